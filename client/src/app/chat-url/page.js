@@ -14,17 +14,20 @@ const ChatUrl = () => {
   const [chats, setChats] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  // Cursor of the next (older) page, from the X-Next-Cursor header
+  const [nextCursor, setNextCursor] = useState(null);
 
   useEffect(() => {
     fetchChats();
   }, []);
 
-  const fetchChats = async () => {
+  const fetchChats = async (before = null) => {
     try {
       const response = await axios.get("http://localhost:5000/api/urls", {
         headers: {
           "Content-Type": "application/json",
         },
+        params: before ? { before } : {},
       });
 
       const formattedChats = response.data.map((chat) => ({
@@ -32,7 +35,8 @@ const ChatUrl = () => {
         date: formatRelativeTime(chat.last_activity),
       }));
 
-      setChats(formattedChats);
+      setChats((prev) => (before ? [...prev, ...formattedChats] : formattedChats));
+      setNextCursor(response.headers["x-next-cursor"] || null);
       setError(null);
     } catch (err) {
       setError(
@@ -214,6 +218,14 @@ const ChatUrl = () => {
                       </div>
                     </div>
                   ))}
+                  {nextCursor && (
+                    <button
+                      onClick={() => fetchChats(nextCursor)}
+                      className="justify-self-center px-4 py-2 text-primary-700 border border-primary-600 rounded-lg hover:bg-primary-50 transition-all"
+                    >
+                      Load older chats
+                    </button>
+                  )}
                 </div>
               ) : (
                 <div className="p-6 flex flex-col items-center justify-center h-60 bg-white">
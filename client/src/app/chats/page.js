@@ -8,13 +8,16 @@ const AllChats = () => {
   const [chats, setChats] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  // Cursor of the next (older) page, from the X-Next-Cursor header
+  const [nextCursor, setNextCursor] = useState(null);
 
-  const fetchChats = async () => {
+  const fetchChats = async (before = null) => {
     try {
       const response = await axios.get("http://localhost:5000/api/chats", {
         headers: {
           "Content-Type": "application/json",
         },
+        params: before ? { before } : {},
       });
 
       // Transform dates and ensure consistent data structure
@@ -24,7 +27,8 @@ const AllChats = () => {
         tags: Array.isArray(chat.keywords) ? chat.keywords : [],
       }));
 
-      setChats(formattedChats);
+      setChats((prev) => (before ? [...prev, ...formattedChats] : formattedChats));
+      setNextCursor(response.headers["x-next-cursor"] || null);
       setError(null);
     } catch (err) {
       setError(
@@ -156,6 +160,17 @@ const AllChats = () => {
             </div>
           ))}
         </div>
+
+        {nextCursor && (
+          <div className="flex justify-center mt-6">
+            <button
+              onClick={() => fetchChats(nextCursor)}
+              className="px-4 py-2 text-primary-700 border border-primary-600 rounded-lg hover:bg-primary-50 transition-all"
+            >
+              Load older chats
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
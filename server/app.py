@@ -4,69 +4,341 @@ from config import Config
 from resources.pdf_chat import PDFChatService
 from resources.url_chat import URLChatService
 from resources.askai import AskAI
+from resources.search import SearchService
+from utils.model_registry import registry
+from utils.container import container
+from utils.vector_store_cache import vector_store_cache
+from utils.ingestion_queue import ingestion_queue
+from utils.embedding_cache import get_embeddings
+from utils.answer_cache import answer_cache
+from utils.global_index import get_global_index
+from utils.metrics import metrics, REQUEST_SECONDS, request_spans, server_timing_header
+from utils.admission import admission, llm_call_limiter
+from utils.index_storage import index_storage
 from flask_cors import CORS
 import os
-import shutil
 
 
 app = Flask(__name__)
 app.config.from_object(Config)
 api = Api(app)
-CORS(app, resources={r"/*": {"origins": "*"}})
+CORS(
+    app,
+    resources={r"/*": {"origins": "*"}},
+    expose_headers=["X-Next-Cursor", "Link", "ETag", "Retry-After"],
+)
 
 # Register resources
-api.add_resource(PDFChatService, "/upload", "/ask")
+api.add_resource(
+    PDFChatService, "/upload", "/ask", resource_class_kwargs={"container": container}
+)
 
-api.add_resource(URLChatService, "/process_url", "/ask_question")
+api.add_resource(
+    URLChatService,
+    "/process_url",
+    "/ask_question",
+    resource_class_kwargs={"container": container},
+)
 
 api.add_resource(AskAI, "/askai")
 
+api.add_resource(
+    SearchService, "/api/search", resource_class_kwargs={"container": container}
+)
 
-from utils.database import MongoDBManager, URLDBManager
-from flask import jsonify
+# With `gunicorn --preload` this runs once in the master, before workers fork
+if Config.MODEL_LOADING == "preload":
+    registry.preload()
+elif Config.MODEL_LOADING == "background":
+    registry.warm_up()
 
-db_manager = MongoDBManager()
-url_db_manager = URLDBManager()
+
+from flask import jsonify, request, g, Response, url_for
+import hashlib
+import threading
+import time
+
+indexes_lock = threading.Lock()
+indexes_ensured = False
+
+
+def questions_page(doc_id):
+    """Reads ?limit=&before= and returns a page of Q&A history"""
+    limit = min(max(request.args.get("limit", Config.QA_PAGE_SIZE, type=int), 1), 200)
+    try:
+        return container.qa_db.get_questions_page(
+            doc_id, limit=limit, before=request.args.get("before")
+        )
+    except ValueError:
+        return None, None
+
+
+def conditional_json(payload, last_modified=None, headers=None):
+    """JSON response with an ETag over its body and headers, answered with
+    304 when the client's If-None-Match already has it. Last-Modified is
+    informational: it cannot see deletions, so only the ETag decides.
+    """
+    response = jsonify(payload)
+    response.headers.update(headers or {})
+    digest = hashlib.sha1(response.get_data())
+    for name, value in sorted((headers or {}).items()):
+        digest.update(f"{name}:{value}".encode())
+    etag = digest.hexdigest()
+    cache_headers = {"Cache-Control": "private, no-cache", **(headers or {})}
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=cache_headers)
+    response.headers.update(cache_headers)
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    return response
+
+
+def listing_limit():
+    return min(max(request.args.get("limit", Config.LISTING_PAGE_SIZE, type=int), 1), 200)
+
+
+def listing_response(fetch):
+    """A keyset page of a sidebar listing, newest activity first.
+
+    The body stays a JSON array; the next page's cursor is sent in
+    X-Next-Cursor and a Link rel="next" header (pass it back as ?before=).
+    """
+    limit = listing_limit()
+    try:
+        records, next_cursor = fetch(limit=limit, before=request.args.get("before"))
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    headers = {}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+        next_url = url_for(request.endpoint, limit=limit, before=next_cursor)
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    newest = records[0].get("last_activity") if records else None
+    return conditional_json(records, newest, headers)
+
+
+# Ingestion jobs run on a bounded local worker pool (see utils/ingestion_queue.py)
+# Managers are resolved on use: the container hands each forked worker its own client
+ingestion_queue.register(
+    "pdf", lambda job, record: PDFChatService().ingest_pdf(job, record), lambda: container.chat_db
+)
+ingestion_queue.register(
+    "url", lambda job, record: URLChatService().ingest_url(job, record), lambda: container.url_db
+)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.before_request
+def admit_llm_request():
+    # Only POSTs to the LLM-bound endpoints queue for a model slot (see
+    # utils/admission.py); reads are never held back by them
+    if request.method != "POST" or request.url_rule is None:
+        return
+    endpoint = request.url_rule.rule.strip("/")
+    if admission.covers(endpoint):
+        g.admission_ticket = admission.admit(endpoint)
+
+
+@app.teardown_request
+def release_llm_request(exc):
+    # For streamed answers this runs once the stream has finished
+    ticket = g.pop("admission_ticket", None)
+    if ticket is not None:
+        admission.finish(ticket)
+
+
+@app.after_request
+def record_request_timing(response):
+    started = g.get("request_started")
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    REQUEST_SECONDS.observe(
+        elapsed, method=request.method, endpoint=endpoint, status=response.status_code
+    )
+    spans = request_spans()
+    # For streamed answers this covers everything up to the first byte
+    if Config.SERVER_TIMING:
+        response.headers["Server-Timing"] = server_timing_header(spans, elapsed)
+    if elapsed * 1000 >= Config.SLOW_REQUEST_MS:
+        breakdown = ", ".join(
+            f"{name}={seconds * 1000:.0f}ms" for name, (seconds, _) in spans.items()
+        )
+        print(
+            f"Slow request: {request.method} {request.path} {response.status_code} "
+            f"{elapsed * 1000:.0f}ms [{breakdown}]"
+        )
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def ensure_db_indexes():
+    # Run after fork so no MongoClient is opened in the gunicorn master
+    global indexes_ensured
+    if indexes_ensured:
+        return
+    with indexes_lock:
+        if indexes_ensured:
+            return
+        # Lookup/listing indexes; create_index is a no-op when they already exist
+        try:
+            container.chat_db.ensure_indexes()
+            container.url_db.ensure_indexes()
+            container.qa_db.ensure_indexes()
+        except Exception as e:
+            print(f"Warning: Failed to create MongoDB indexes: {e}")
+        indexes_ensured = True
+
+
+def start_background_work():
+    """Per-process startup, after any gunicorn fork: Mongo indexes, the thread
+    resuming abandoned ingestion jobs and the index storage sweeper. Each step
+    runs once per process.
+    """
+    ensure_db_indexes()
+    ingestion_queue.start_resumer()
+    index_storage.start_sweeper()
+
+
+@app.before_request
+def start_background_work_on_first_request():
+    # gunicorn starts this at boot (post_worker_init in gunicorn.conf.py);
+    # other servers (flask run, tests) get it on their first request
+    start_background_work()
+
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job_status(job_id):
+    for kind in ("pdf", "url"):
+        status = ingestion_queue.job_status(kind, job_id)
+        if status:
+            return jsonify({"job_id": job_id, "kind": kind, **status}), 200
+    return jsonify({"error": "Job not found"}), 404
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    ready = registry.is_ready()
+    return jsonify({"ready": ready, "components": registry.status()}), (
+        200 if ready else 503
+    )
+
+
+@app.route("/api/cache/vector-stores", methods=["GET"])
+def vector_store_cache_stats():
+    return jsonify(vector_store_cache.stats()), 200
+
+
+@app.route("/api/cache/embeddings", methods=["GET"])
+def embedding_cache_stats():
+    return jsonify(get_embeddings().stats()), 200
+
+
+@app.route("/api/cache/answers", methods=["GET"])
+def answer_cache_stats():
+    return jsonify(answer_cache.stats()), 200
+
+
+@app.route("/api/storage/indexes", methods=["GET"])
+def index_storage_stats():
+    return jsonify(index_storage.stats()), 200
+
+
+@app.route("/api/limits", methods=["GET"])
+def admission_stats():
+    return jsonify({**admission.stats(), "llm_calls": llm_call_limiter.limiter.stats()}), 200
+
+
+@app.route("/api/search/stats", methods=["GET"])
+def global_index_stats():
+    return jsonify(get_global_index().stats()), 200
 
 
 @app.route("/api/chats", methods=["GET"])
 def get_all_chats():
-    chats = db_manager.get_all_chat_records()
-    return jsonify(chats), 200
+    return listing_response(container.chat_db.get_chat_records_page)
+
+
+@app.route("/api/feed", methods=["GET"])
+def get_feed():
+    # Chats and URL chats merged newest-first, each item tagged with "type"
+    try:
+        items, next_cursor = container.feed_db.get_feed_page(
+            limit=listing_limit(), before=request.args.get("before")
+        )
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    newest = items[0].get("last_activity") if items else None
+    return conditional_json({"items": items, "next_cursor": next_cursor}, newest)
 
 
 @app.route("/api/chats/<chat_id>", methods=["GET"])
 def get_chat(chat_id):
-    chat_record = db_manager.get_chat_record(chat_id)
+    chat_record = container.chat_db.get_chat_record(chat_id)
     if not chat_record:
         return jsonify({"error": "Chat not found"}), 404
 
     chat_record.pop("_id", None)
+    # Latest page of history; older pages via /api/chats/<chat_id>/questions
+    chat_record["questions"], chat_record["next_cursor"] = container.qa_db.get_questions_page(
+        chat_id, limit=Config.QA_PAGE_SIZE
+    )
     return jsonify(chat_record)
 
 
+@app.route("/api/chats/<chat_id>/questions", methods=["GET"])
+def get_chat_questions(chat_id):
+    questions, next_cursor = questions_page(chat_id)
+    if questions is None:
+        return jsonify({"error": "Invalid cursor"}), 400
+    return jsonify({"questions": questions, "next_cursor": next_cursor}), 200
+
+
+def remove_from_global_index(doc_id):
+    try:
+        get_global_index().remove_document(doc_id)
+    except Exception as e:
+        print(f"Warning: Failed to remove {doc_id} from the global index: {e}")
+
+
 @app.route("/api/chats/<chat_id>", methods=["DELETE"])
 def delete_chat(chat_id):
-    deleted_count = db_manager.delete_chat_record(chat_id)
+    deleted_count = container.chat_db.delete_chat_record(chat_id)
 
     if deleted_count == 0:
         return jsonify({"error": "Chat not found"}), 404
 
-    # Attempt to delete the corresponding file
-    file_path = f"chat_indexes/faiss_index_{chat_id}"
-    try:
-        if os.path.exists(file_path):
-            shutil.rmtree(file_path)
-    except Exception as e:
-        # Log the error or handle it as needed (not fatal for API success)
-        print(f"Warning: Failed to delete file {file_path}: {e}")
+    vector_store_cache.invalidate(("pdf", chat_id))
+    answer_cache.invalidate(("pdf", chat_id))
+    container.qa_db.delete_questions(chat_id)
+    remove_from_global_index(chat_id)
+
+    # Hot directory and cold archive; failures are logged, not fatal
+    index_storage.delete("pdf", chat_id)
 
     return jsonify({"message": "Chat deleted successfully"}), 200
 
 
+@app.route("/api/chats/<chat_id>/sources/<source_id>", methods=["DELETE"])
+def delete_chat_source(chat_id, source_id):
+    # Sources are added by POSTing a PDF to /upload with the chat_id form field
+    result, status = PDFChatService().remove_source(chat_id, source_id)
+    return jsonify(result), status
+
+
 @app.route("/api/chats/<chat_id>/title", methods=["GET"])
 def get_chat_title(chat_id):
-    chat_record = db_manager.get_chat_title(chat_id)  # Fix method name here
+    chat_record = container.chat_db.get_chat_title(chat_id)  # Fix method name here
     if not chat_record:
         return jsonify({"error": "Chat not found"}), 404
 
@@ -76,23 +348,34 @@ def get_chat_title(chat_id):
 
 @app.route("/api/urls", methods=["GET"])
 def get_all_urls():
-    chats = url_db_manager.get_all_url_records()
-    return jsonify(chats), 200
+    return listing_response(container.url_db.get_url_records_page)
 
 
 @app.route("/api/url-chat/<url_id>", methods=["GET"])
 def get_url_chat(url_id):
-    chat_record = url_db_manager.get_url_record(url_id)
+    chat_record = container.url_db.get_url_record(url_id)
     if not chat_record:
         return jsonify({"error": "Chat not found"}), 404
 
     chat_record.pop("_id", None)
+    # Latest page of history; older pages via /api/url-chat/<url_id>/questions
+    chat_record["questions"], chat_record["next_cursor"] = container.qa_db.get_questions_page(
+        url_id, limit=Config.QA_PAGE_SIZE
+    )
     return jsonify(chat_record)
 
 
+@app.route("/api/url-chat/<url_id>/questions", methods=["GET"])
+def get_url_questions(url_id):
+    questions, next_cursor = questions_page(url_id)
+    if questions is None:
+        return jsonify({"error": "Invalid cursor"}), 400
+    return jsonify({"questions": questions, "next_cursor": next_cursor}), 200
+
+
 @app.route("/api/url-chat/<url_id>/title", methods=["GET"])
 def get_url_title(url_id):
-    chat_record = url_db_manager.get_url_title(url_id)  # Fix method name here
+    chat_record = container.url_db.get_url_title(url_id)  # Fix method name here
     if not chat_record:
         return jsonify({"error": "Chat not found"}), 404
 
@@ -100,24 +383,31 @@ def get_url_title(url_id):
     return jsonify({"name": chat_record.get("name")})
 
 
+@app.route("/api/url-chat/<url_id>/sources/<source_id>", methods=["DELETE"])
+def delete_url_source(url_id, source_id):
+    # Sources are added by POSTing {"url_id", "url"} to /process_url
+    result, status = URLChatService().remove_source(url_id, source_id)
+    return jsonify(result), status
+
+
 @app.route("/api/url-chat/<url_id>", methods=["DELETE"])
 def delete_url_chat(url_id):
-    deleted_count = url_db_manager.delete_url_record(url_id)
+    deleted_count = container.url_db.delete_url_record(url_id)
     if deleted_count == 0:
         return jsonify({"error": "Chat not found"}), 404
 
-    # Attempt to delete the corresponding file
-    file_path = f"url indexes/faiss_index_{url_id}"
-    try:
-        if os.path.exists(file_path):
-            shutil.rmtree(file_path)
-    except Exception as e:
-        # Log the error or handle it as needed (not fatal for API success)
-        print(f"Warning: Failed to delete file {file_path}: {e}")
+    vector_store_cache.invalidate(("url", url_id))
+    answer_cache.invalidate(("url", url_id))
+    container.qa_db.delete_questions(url_id)
+    remove_from_global_index(url_id)
+
+    # Hot directory and cold archive; failures are logged, not fatal
+    index_storage.delete("url", url_id)
 
     return jsonify({"message": "Chat deleted successfully"}), 200
 
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
+    start_background_work()
     app.run(host="0.0.0.0", port=port)
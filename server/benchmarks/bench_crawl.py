@@ -0,0 +1,74 @@
+"""Benchmarks the URL crawl mode against the local static statute site.
+
+Compares the asyncio crawler with the same crawl done one request at a
+time, then runs the whole crawl-mode /process_url through
+benchmarks.fake_app, where pages are embedded while the rest are still
+downloading (compare its time with the crawl alone).
+
+    python -m benchmarks.bench_crawl --chapters 40 --latency 0.1 --json results.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from benchmarks.static_site import make_site, serve
+from utils.crawler import get_crawler
+
+
+def crawl(start_url, serial=False):
+    crawler = get_crawler()
+    if serial:
+        crawler.concurrency = crawler.per_host = 1
+    started = time.perf_counter()
+    first, pages = None, 0
+    for _ in crawler.pages(start_url):
+        first = first or time.perf_counter() - started
+        pages += 1
+    return {
+        "pages": pages,
+        "elapsed_s": round(time.perf_counter() - started, 3),
+        "first_page_s": round(first or 0, 3),
+    }
+
+
+def process_url(start_url):
+    from benchmarks.fake_app import app
+
+    client = app.test_client()
+    started = time.perf_counter()
+    response = client.post("/process_url", json={"url": start_url, "crawl": True, "async": False})
+    elapsed = time.perf_counter() - started
+    body = response.get_json()
+    if response.status_code != 200:
+        raise RuntimeError(f"/process_url failed: {body}")
+    return {"elapsed_s": round(elapsed, 3), "pages": body["url_info"]["pages"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chapters", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.1, help="server response time (s)")
+    parser.add_argument("--json", help="write machine-readable results to this file")
+    args = parser.parse_args()
+    # benchmarks.fake_app moves into a scratch directory when imported
+    output = os.path.abspath(args.json) if args.json else None
+
+    results = {"params": vars(args)}
+    with tempfile.TemporaryDirectory() as root:
+        expected = make_site(root, args.chapters)
+        with serve(root, args.latency) as base_url:
+            start_url = f"{base_url}/act/"
+            results["expected_pages"] = expected
+            results["crawler"] = crawl(start_url)
+            results["serial_crawler"] = crawl(start_url, serial=True)
+            results["process_url_crawl"] = process_url(start_url)
+
+    print(json.dumps(results, indent=2))
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
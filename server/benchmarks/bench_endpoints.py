@@ -0,0 +1,313 @@
+"""End-to-end benchmark of /upload, /ask, /process_url, /ask_question and /askai.
+
+Runs fully offline against benchmarks.fake_app (fake Gemini chat and
+embeddings, mongomock or a local mongod), generated PDFs and a local HTTP
+server for URLs. Drives the app in-process by default, or a running server
+(e.g. gunicorn serving benchmarks.fake_app:app) with --base-url.
+
+    python -m benchmarks.bench_endpoints --concurrency 8 --json results.json
+
+Reports throughput and p50/p95/p99 per endpoint and, in-process, per stage.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+from benchmarks.synthetic_pdf import make_pdf, WORDS
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "What is the punishment for the offence described in Section {n}?",
+    "Summarise the bail provisions in this document.",
+    "Who are the parties to this contract and what are their obligations?",
+    "Which sections deal with the jurisdiction of the tribunal?",
+    "What evidence is required under clause {n}?",
+]
+
+
+class Recorder:
+    """Thread-safe latency samples grouped by name"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, ok=True):
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, wall_seconds=None):
+        result = {}
+        for name, samples in sorted(self.samples.items()):
+            ms = np.array(samples) * 1000
+            row = {
+                "count": len(samples),
+                "errors": self.errors.get(name, 0),
+                "mean_ms": round(float(ms.mean()), 2),
+                "p50_ms": round(float(np.percentile(ms, 50)), 2),
+                "p95_ms": round(float(np.percentile(ms, 95)), 2),
+                "p99_ms": round(float(np.percentile(ms, 99)), 2),
+            }
+            if wall_seconds and name in wall_seconds:
+                row["throughput_rps"] = round(len(samples) / wall_seconds[name], 2)
+            result[name] = row
+        return result
+
+
+def instrument_stages(recorder):
+    """Wraps the pipeline stages so their time is recorded (in-process only)"""
+    from utils.pdf_processor import PDFProcessor
+    from utils.url_processor import URLProcessor
+    from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+    from utils.vector_index import MmapVectorStore
+
+    def wrap(owner, attr, stage, static=False):
+        original = getattr(owner, attr)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                recorder.add(stage, time.perf_counter() - started)
+
+        setattr(owner, attr, staticmethod(timed) if static else timed)
+
+    wrap(PDFProcessor, "get_pdf_chunks", "pdf_extract_chunk", static=True)
+    wrap(PDFProcessor, "get_vector_store", "pdf_embed_index", static=True)
+    wrap(PDFProcessor, "load_vector_store", "index_load", static=True)
+    wrap(URLProcessor, "fetch_and_index", "url_fetch_embed_index")
+    wrap(URLProcessor, "load_vector_store", "index_load")
+    wrap(MmapVectorStore, "hybrid_search", "retrieval")
+    wrap(FakeEmbeddings, "embed_documents", "embedding_call")
+    wrap(FakeEmbeddings, "embed_query", "embedding_call")
+    wrap(FakeChatModel, "_generate", "llm_call")
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """Serves deterministic legal-looking HTML pages at /doc/<n>"""
+
+    def do_GET(self):
+        n = int(self.path.rsplit("/", 1)[-1] or 0)
+        rng = random.Random(n)
+        paragraphs = "".join(
+            f"<p>Section {n}.{i}: " + " ".join(rng.choice(WORDS) for _ in range(80)) + "</p>"
+            for i in range(60)
+        )
+        body = f"<html><head><title>Statute {n}</title></head><body>{paragraphs}</body></html>"
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", f'"doc-{n}"')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_page_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class InProcessClient:
+    def __init__(self):
+        from benchmarks.fake_app import app
+
+        self.app = app
+
+    def post(self, path, json_body=None, files=None):
+        client = self.app.test_client()
+        if files:
+            name, path_on_disk = files
+            with open(path_on_disk, "rb") as f:
+                response = client.post(
+                    path, data={"pdf": (f, name)}, content_type="multipart/form-data"
+                )
+        else:
+            response = client.post(path, json=json_body)
+        return response.status_code, response.get_json(silent=True) or {}
+
+
+class HTTPClient:
+    def __init__(self, base_url):
+        import requests
+
+        self.base_url = base_url.rstrip("/")
+        self.requests = requests
+        self._local = threading.local()
+
+    def _session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = self.requests.Session()
+        return self._local.session
+
+    def post(self, path, json_body=None, files=None):
+        url = self.base_url + path
+        if files:
+            name, path_on_disk = files
+            with open(path_on_disk, "rb") as f:
+                response = self._session().post(url, files={"pdf": (name, f)})
+        else:
+            response = self._session().post(url, json=json_body)
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        return response.status_code, body
+
+
+def run_phase(name, client, requests_, concurrency, recorder, wall):
+    """Fires ``requests_`` [(path, kwargs)] at ``concurrency`` and records latency"""
+    results = []
+
+    def one(item):
+        path, kwargs = item
+        started = time.perf_counter()
+        try:
+            status, body = client.post(path, **kwargs)
+        except Exception as e:
+            status, body = 599, {"error": str(e)}
+        recorder.add(name, time.perf_counter() - started, ok=200 <= status < 300)
+        return status, body
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, requests_))
+    wall[name] = time.perf_counter() - started
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=SERVER_DIR, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--pdfs", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=60)
+    parser.add_argument("--urls", type=int, default=4)
+    parser.add_argument("--questions", type=int, default=40, help="per question endpoint")
+    parser.add_argument("--stream", action="store_true", help="ask with SSE streaming")
+    parser.add_argument("--base-url", help="benchmark a running server instead of in-process")
+    parser.add_argument("--json", help="write machine-readable results to this file")
+    args = parser.parse_args()
+
+    recorder = Recorder()
+    if args.base_url:
+        client = HTTPClient(args.base_url)
+    else:
+        client = InProcessClient()
+        instrument_stages(recorder)
+
+    page_server, page_base = start_page_server()
+    wall = {}
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdfs = [
+            make_pdf(os.path.join(tmp, f"doc_{i}.pdf"), args.pages, seed=i)
+            for i in range(args.pdfs)
+        ]
+        uploads = run_phase(
+            "/upload",
+            client,
+            [("/upload", {"files": (os.path.basename(p), p)}) for p in pdfs],
+            args.concurrency,
+            recorder,
+            wall,
+        )
+    chat_ids = [body["chat_id"] for status, body in uploads if status == 200]
+
+    urls = run_phase(
+        "/process_url",
+        client,
+        [("/process_url", {"json_body": {"url": f"{page_base}/doc/{i}"}}) for i in range(args.urls)],
+        args.concurrency,
+        recorder,
+        wall,
+    )
+    url_ids = [body["url_id"] for status, body in urls if status == 200]
+
+    def question():
+        return rng.choice(QUESTIONS).format(n=rng.randint(1, 500))
+
+    if chat_ids:
+        run_phase(
+            "/ask",
+            client,
+            [
+                ("/ask", {"json_body": {"chat_id": rng.choice(chat_ids), "question": question(), "stream": args.stream}})
+                for _ in range(args.questions)
+            ],
+            args.concurrency,
+            recorder,
+            wall,
+        )
+    if url_ids:
+        run_phase(
+            "/ask_question",
+            client,
+            [
+                ("/ask_question", {"json_body": {"url_id": rng.choice(url_ids), "question": question(), "stream": args.stream}})
+                for _ in range(args.questions)
+            ],
+            args.concurrency,
+            recorder,
+            wall,
+        )
+    run_phase(
+        "/askai",
+        client,
+        [("/askai", {"json_body": {"question": question(), "stream": args.stream}}) for _ in range(args.questions)],
+        args.concurrency,
+        recorder,
+        wall,
+    )
+    page_server.shutdown()
+
+    summary = recorder.summary(wall)
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "mode": "http" if args.base_url else "in-process",
+        "params": vars(args),
+        "endpoints": {k: v for k, v in summary.items() if k.startswith("/")},
+        "stages": {k: v for k, v in summary.items() if not k.startswith("/")},
+    }
+
+    print(f"{'name':<24}{'count':>7}{'err':>5}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for section in ("endpoints", "stages"):
+        for name, row in results[section].items():
+            print(
+                f"{name:<24}{row['count']:>7}{row['errors']:>5}{row.get('throughput_rps', ''):>8}"
+                f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Benchmarks PDF text extraction on synthetic multi-hundred-page PDFs.
+
+Compares the old single-core ``text += page`` loop with the streaming
+page-parallel extractor, serial and on the process pool.
+
+    python -m benchmarks.bench_pdf_extraction --pages 200 500 --json results.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from PyPDF2 import PdfReader
+from benchmarks.synthetic_pdf import make_pdf
+from utils.pdf_extractor import iter_pages
+from utils.chunker import LegalChunker
+
+
+def legacy_extract(pdf_path):
+    text = ""
+    for page in PdfReader(pdf_path).pages:
+        text += page.extract_text() or ""
+    return len(text)
+
+
+def streaming_extract(pdf_path, parallel):
+    chunks = 0
+    for _ in LegalChunker().chunk_pages(iter_pages(pdf_path, parallel=parallel)):
+        chunks += 1
+    return chunks
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    started = time.perf_counter()
+    fn(*args)
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(seconds, 3), "peak_mb": round(peak / 1024 / 1024, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[200, 500])
+    parser.add_argument("--json", help="write machine-readable results to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in args.pages:
+            pdf_path = make_pdf(os.path.join(tmp, f"synthetic_{pages}.pdf"), pages)
+            # Warm the pool so worker start-up is not billed to the first run
+            streaming_extract(pdf_path, parallel=True)
+            row = {
+                "pages": pages,
+                "legacy": measure(legacy_extract, pdf_path),
+                "streaming_serial": measure(streaming_extract, pdf_path, False),
+                "streaming_parallel": measure(streaming_extract, pdf_path, True),
+            }
+            results.append(row)
+            print(
+                f"{pages:>5} pages  "
+                + "  ".join(
+                    f"{name}: {row[name]['seconds']}s / {row[name]['peak_mb']}MB"
+                    for name in ("legacy", "streaming_serial", "streaming_parallel")
+                )
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
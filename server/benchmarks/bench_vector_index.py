@@ -0,0 +1,131 @@
+"""Recall vs. speed of the per-document index storages on synthetic embeddings.
+
+For each storage (float32, float16, ivfpq) reports build time, size on
+disk, open time, resident memory added by opening, search latency and
+recall@k against exact float32 search; the legacy pickle-based LangChain
+FAISS store is measured for comparison.
+
+    python -m benchmarks.bench_vector_index --vectors 50000 --dim 768 --json results.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from config import Config
+from utils.vector_index import MmapVectorStore, STORAGES
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def dir_mb(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 1024 / 1024
+
+
+def synthetic_embeddings(count, dim, seed=0):
+    """Clustered unit vectors, closer to real text embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(count // 200, 8), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), count)]
+    vectors += 0.35 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def measure_store(path, queries, k, truth):
+    before = rss_mb()
+    started = time.perf_counter()
+    store = MmapVectorStore(path)
+    open_ms = (time.perf_counter() - started) * 1000
+    opened_mb = rss_mb() - before
+
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        rows = [row for _, row in store.search(query, k)]
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len(set(rows) & set(expected))
+    return {
+        "open_ms": round(open_ms, 2),
+        "rss_after_open_mb": round(opened_mb, 2),
+        "search_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "search_p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        f"recall@{k}": round(hits / (len(queries) * k), 4),
+    }
+
+
+def measure_legacy(path, texts, vectors, metadatas, queries):
+    from langchain_community.vectorstores import FAISS
+
+    store = FAISS.from_embeddings(zip(texts, vectors.tolist()), None, metadatas=metadatas)
+    store.save_local(path)
+    del store
+    before = rss_mb()
+    started = time.perf_counter()
+    store = FAISS.load_local(path, None, allow_dangerous_deserialization=True)
+    load_ms = (time.perf_counter() - started) * 1000
+    loaded_mb = rss_mb() - before
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        store.index.search(query[None, :], 4)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "disk_mb": round(dir_mb(path), 2),
+        "open_ms": round(load_ms, 2),
+        "rss_after_open_mb": round(loaded_mb, 2),
+        "search_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--skip-legacy", action="store_true")
+    parser.add_argument("--json", help="write machine-readable results to this file")
+    args = parser.parse_args()
+
+    # Always exercise IVF-PQ, whatever the production threshold
+    Config.VECTOR_INDEX_IVF_MIN_VECTORS = min(Config.VECTOR_INDEX_IVF_MIN_VECTORS, args.vectors)
+
+    vectors = synthetic_embeddings(args.vectors, args.dim)
+    # Questions land near some of the chunks, as real ones do
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, args.vectors, args.queries)]
+    queries = queries + 0.5 * rng.standard_normal(queries.shape).astype(np.float32) / np.sqrt(args.dim)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    texts = [f"chunk {i}" for i in range(args.vectors)]
+    metadatas = [{"chunk": i} for i in range(args.vectors)]
+
+    # Ground truth: exact L2 neighbours on float32
+    norms = np.einsum("ij,ij->i", vectors, vectors)
+    truth = [np.argsort(norms - 2 * vectors @ q)[: args.k].tolist() for q in queries]
+
+    results = {"params": vars(args), "storages": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        for storage in STORAGES:
+            path = os.path.join(tmp, storage)
+            started = time.perf_counter()
+            MmapVectorStore.build(path, texts, vectors, metadatas, storage)
+            row = {"build_s": round(time.perf_counter() - started, 2), "disk_mb": round(dir_mb(path), 2)}
+            row.update(measure_store(path, queries, args.k, truth))
+            results["storages"][storage] = row
+        if not args.skip_legacy:
+            results["legacy_faiss_pickle"] = measure_legacy(
+                os.path.join(tmp, "legacy"), texts, vectors, metadatas, queries
+            )
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""The Flask app wired to fakes, for offline benchmarks.
+
+Importing this module:
+  * switches into a scratch working directory (BENCH_WORKDIR, default a new
+    temp dir) so indexes, uploads and caches never touch the real ones,
+  * replaces MongoClient with mongomock when BENCH_MONGO=mock (the default;
+    set BENCH_MONGO=uri to use MONGO_URI, e.g. a local mongod),
+  * installs FakeChatModel / FakeEmbeddings in the container and registry.
+
+It can be served by gunicorn as well as used in-process:
+
+    BENCH_MONGO=uri MONGO_URI=mongodb://localhost:27017 \\
+        gunicorn -w 4 --pythonpath . benchmarks.fake_app:app
+
+With BENCH_MONGO=mock every gunicorn worker has its own in-memory database,
+so use a single worker or a real mongod.
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)  # imports must keep working after the chdir below
+
+workdir = os.environ.get("BENCH_WORKDIR") or tempfile.mkdtemp(prefix="legalassist-bench-")
+os.makedirs(os.path.join(workdir, "indian_penal_code_index"), exist_ok=True)
+shutil.copy(
+    os.path.join(SERVER_DIR, "indian_penal_code_index", "docstore.json"),
+    os.path.join(workdir, "indian_penal_code_index", "docstore.json"),
+)
+os.chdir(workdir)
+os.environ.setdefault("GEMINI", "offline-benchmark")
+
+if os.environ.get("BENCH_MONGO", "mock") == "mock":
+    import mongomock
+    import utils.database
+
+    utils.database.MongoClient = mongomock.MongoClient
+
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings  # noqa: E402
+from config import Config  # noqa: E402
+from utils.container import container  # noqa: E402
+from utils.embedding_cache import CachedEmbeddings, EmbeddingStore, set_embeddings  # noqa: E402
+from utils.ipc_index import IPCIndex  # noqa: E402
+from utils.metrics import llm_metrics  # noqa: E402
+from utils.admission import llm_call_limiter  # noqa: E402
+from utils.model_registry import registry  # noqa: E402
+from app import app  # noqa: E402
+
+FAKE_EMBEDDING_MODEL = "fake:hash-64"
+
+llm = FakeChatModel(
+    latency=float(os.environ.get("BENCH_LLM_LATENCY", 0.5)),
+    first_token_latency=float(os.environ.get("BENCH_LLM_FIRST_TOKEN", 0.05)),
+    callbacks=[llm_call_limiter, llm_metrics],
+)
+embeddings = CachedEmbeddings(
+    FakeEmbeddings(latency_per_call=float(os.environ.get("BENCH_EMBED_LATENCY", 0.05))),
+    FAKE_EMBEDDING_MODEL,
+    EmbeddingStore(
+        Config.EMBEDDING_CACHE_PATH,
+        max_queries=Config.EMBED_QUERY_CACHE_MAX_ENTRIES,
+        query_ttl=Config.EMBED_QUERY_CACHE_TTL,
+    ),
+    batch_size=Config.EMBED_BATCH_SIZE,
+    concurrency=Config.EMBED_CONCURRENCY,
+    max_retries=Config.EMBED_MAX_RETRIES,
+)
+
+set_embeddings(embeddings)
+container.override("embeddings", embeddings)
+container.override("chat_llm", llm)
+registry.override("askai_llm", llm)
+registry.override("askai_embed_model", embeddings)
+registry.override(
+    "ipc_index",
+    IPCIndex.build(embeddings, FAKE_EMBEDDING_MODEL),
+)
@@ -0,0 +1,84 @@
+"""Deterministic stand-ins for Gemini chat and embedding models.
+
+They keep the benchmarks offline and repeatable while still paying a
+configurable, realistic latency per call.
+"""
+import hashlib
+import json
+import time
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeChatModel(BaseChatModel):
+    """Answers every prompt with deterministic markdown after ``latency`` seconds.
+
+    Metadata prompts that ask for JSON get a valid JSON object, so the
+    structured metadata path is exercised rather than its fallback.
+    """
+
+    latency: float = 0.05
+    first_token_latency: float = 0.01
+    answer_tokens: int = 60
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _answer(self, prompt):
+        if "JSON" in prompt and '"keywords"' in prompt:
+            return json.dumps(
+                {
+                    "name": "Synthetic legal document",
+                    "description": "A generated document used to benchmark ingestion and question answering end to end.",
+                    "keywords": ["section", "offence", "bail"],
+                }
+            )
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        words = [digest[i : i + 6] for i in range(0, 60, 6)]
+        return " ".join(f"**{words[i % len(words)]}**" for i in range(self.answer_tokens))
+
+    @staticmethod
+    def _prompt(messages):
+        return "\n".join(str(message.content) for message in messages)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        message = AIMessage(content=self._answer(self._prompt(messages)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._answer(self._prompt(messages)).split(" ")
+        time.sleep(self.first_token_latency)
+        per_token = max(self.latency - self.first_token_latency, 0) / len(tokens)
+        for token in tokens:
+            time.sleep(per_token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token + " "))
+
+
+class FakeEmbeddings(Embeddings):
+    """Hash-seeded unit vectors: identical text always maps to the same vector"""
+
+    def __init__(self, dim=64, latency_per_call=0.02):
+        self.dim = dim
+        self.latency_per_call = latency_per_call
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency_per_call)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latency_per_call)
+        return self._vector(text)
+
+    def embed_queries(self, texts):
+        time.sleep(self.latency_per_call)
+        return [self._vector(text) for text in texts]
@@ -0,0 +1,146 @@
+"""A local static statute site for exercising the URL crawl mode.
+
+The act is split over one page per chapter, linked from a contents page
+and from each other, with the traps a real portal has: navigation, header
+and footer furniture on every page, a print view that declares the chapter
+as its canonical URL, a mirror of a chapter under another name, a page
+disallowed by robots.txt, a page outside the act's directory and a
+non-HTML download.
+
+    python -m benchmarks.static_site --chapters 20 --latency 0.05
+"""
+import os
+import time
+import random
+import argparse
+import threading
+from contextlib import contextmanager
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks.synthetic_pdf import WORDS
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>{head}</head>
+<body>
+<header class="site-header"><a href="/">Legal Portal</a> | <a href="/act/">The Act</a></header>
+<nav class="breadcrumbs"><a href="/act/">Contents</a> &raquo; {title}</nav>
+<div id="cookie-banner">This site uses cookies. <button>Accept</button></div>
+<main>
+<h1>{title}</h1>
+{body}
+</main>
+<aside class="sidebar"><a href="/act/index.html">Contents</a> <a href="/other/news.html">News</a></aside>
+<footer>Copyright Legal Portal. <a href="/act/private/draft.html">Drafts</a></footer>
+</body></html>
+"""
+
+
+def chapter_body(chapter, sections_per_chapter, rng):
+    paragraphs = []
+    for i in range(1, sections_per_chapter + 1):
+        number = (chapter - 1) * sections_per_chapter + i
+        words = " ".join(rng.choice(WORDS) for _ in range(120))
+        paragraphs.append(f"<p>{number}. Provision {number} of chapter {chapter}. {words}.</p>")
+    return "\n".join(paragraphs)
+
+
+def make_site(root, chapters=20, sections_per_chapter=5, seed=0):
+    """Writes the site under ``root``; returns the number of distinct act pages
+    a crawl of /act/ should index (the contents page plus every chapter).
+    """
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(root, "act", "private"), exist_ok=True)
+    os.makedirs(os.path.join(root, "act", "print"), exist_ok=True)
+    os.makedirs(os.path.join(root, "other"), exist_ok=True)
+
+    def write(path, title, body, head=""):
+        with open(os.path.join(root, path), "w", encoding="utf-8") as f:
+            f.write(PAGE.format(title=title, body=body, head=head))
+
+    contents = "\n".join(
+        f'<li><a href="chapter-{c}.html">Chapter {c}</a></li>' for c in range(1, chapters + 1)
+    )
+    write(
+        "act/index.html",
+        "The Synthetic Act - Contents",
+        f'<ol>{contents}</ol><p><a href="act.pdf">Download PDF</a> '
+        '<a href="chapter-1-old.html">Chapter 1 (old address)</a></p>',
+    )
+    for chapter in range(1, chapters + 1):
+        body = chapter_body(chapter, sections_per_chapter, rng)
+        links = [f'<a href="print/chapter-{chapter}.html">Print view</a>']
+        if chapter > 1:
+            links.append(f'<a href="chapter-{chapter - 1}.html">Previous</a>')
+        if chapter < chapters:
+            links.append(f'<a href="chapter-{chapter + 1}.html?ref=next">Next</a>')
+        write(
+            f"act/chapter-{chapter}.html",
+            f"Chapter {chapter}",
+            body + '<div class="pagination">' + " ".join(links) + "</div>",
+        )
+        write(
+            f"act/print/chapter-{chapter}.html",
+            f"Chapter {chapter}",
+            body,
+            head=f'<link rel="canonical" href="/act/chapter-{chapter}.html">',
+        )
+    # Same text under another URL, e.g. a legacy path
+    write("act/chapter-1-old.html", "Chapter 1", chapter_body(1, sections_per_chapter, random.Random(seed)))
+    write("act/private/draft.html", "Draft", "<p>Not for crawlers.</p>")
+    write("other/news.html", "News", "<p>Outside the act.</p>")
+    with open(os.path.join(root, "act", "act.pdf"), "wb") as f:
+        f.write(b"%PDF-1.4\n%%EOF\n")
+    with open(os.path.join(root, "robots.txt"), "w") as f:
+        f.write("User-agent: *\nDisallow: /act/private/\n")
+    return chapters + 1
+
+
+class _Handler(SimpleHTTPRequestHandler):
+    latency = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)  # a remote server's response time
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # clients that stop reading early (a cancelled crawl) are expected
+
+
+@contextmanager
+def serve(root, latency=0.0):
+    """Serves ``root`` on a free localhost port; yields the base URL"""
+    handler = type("Handler", (_Handler,), {"latency": latency})
+    server = _Server(("127.0.0.1", 0), partial(handler, directory=root))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", default="static site")
+    parser.add_argument("--chapters", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    make_site(args.root, args.chapters)
+    with serve(args.root, args.latency) as base_url:
+        print(f"Serving {args.root} at {base_url}/act/ (Ctrl-C to stop)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
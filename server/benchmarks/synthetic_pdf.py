@@ -0,0 +1,67 @@
+import random
+
+WORDS = (
+    "section article clause court appeal accused bail offence punishment "
+    "imprisonment fine evidence witness judgment petitioner respondent order "
+    "statute provision amendment schedule tribunal jurisdiction contract party"
+).split()
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def page_lines(page_number, lines_per_page, rng):
+    lines = [f"Section {page_number}. Synthetic provision for page {page_number}"]
+    for _ in range(lines_per_page - 1):
+        lines.append(" ".join(rng.choice(WORDS) for _ in range(12)))
+    return lines
+
+
+def make_pdf(path, pages, lines_per_page=40, seed=0):
+    """Writes a plain-text PDF with ``pages`` pages of legal-looking filler.
+
+    Hand-assembled (one Helvetica font, one content stream per page) so the
+    benchmarks need nothing beyond PyPDF2 to read it back.
+    """
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object ids are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page_number in range(1, pages + 1):
+        stream = ["BT /F1 10 Tf 14 TL 40 800 Td"]
+        for line in page_lines(page_number, lines_per_page, rng):
+            stream.append(f"({_escape(line)}) Tj T*")
+        stream.append("ET")
+        content = "\n".join(stream).encode("latin-1")
+        objects.append(
+            b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream"
+        )
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    with open(path, "wb") as f:
+        f.write(out)
+    return path
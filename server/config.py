@@ -6,3 +6,153 @@ class Config:
     MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/chat_db")
     MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "chat_db")
     MONGO_CHATS_COLLECTION = os.getenv("MONGO_CHATS_COLLECTION", "chats")
+
+    # How heavy models are loaded: "lazy" (on first request), "preload" (at import,
+    # before gunicorn forks when run with --preload) or "background" (warm-up thread)
+    MODEL_LOADING = os.getenv("MODEL_LOADING", "lazy")
+
+    # Process-wide LRU cache of loaded FAISS stores
+    VECTOR_STORE_CACHE_MAX_MB = int(os.getenv("VECTOR_STORE_CACHE_MAX_MB", 512))
+    VECTOR_STORE_CACHE_TTL = int(os.getenv("VECTOR_STORE_CACHE_TTL", 1800))
+    VECTOR_STORE_CACHE_MAX_ENTRIES = int(os.getenv("VECTOR_STORE_CACHE_MAX_ENTRIES", 128))
+
+    # Background ingestion of uploaded PDFs and URLs
+    UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+    INGESTION_ASYNC = os.getenv("INGESTION_ASYNC", "false").lower() == "true"
+    INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", 2))
+    INGESTION_MAX_PENDING = int(os.getenv("INGESTION_MAX_PENDING", 20))
+    INGESTION_STALE_SECONDS = int(os.getenv("INGESTION_STALE_SECONDS", 300))
+
+    # On-disk cache of fetched URL content (revalidated with ETag/Last-Modified)
+    URL_CACHE_DIR = os.getenv("URL_CACHE_DIR", "url cache")
+    URL_FETCH_TIMEOUT = int(os.getenv("URL_FETCH_TIMEOUT", 30))
+
+    # Crawl mode of POST /process_url ({"url", "crawl": true}): linked pages on
+    # the same host under the start URL's directory, fetched over a pooled
+    # connector and embedded as they arrive. Requests may lower the page and
+    # depth caps ({"crawl": {"max_pages", "max_depth"}}), not raise them.
+    CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", 50))
+    CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", 2))
+    CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", 8))
+    CRAWL_PER_HOST_CONCURRENCY = int(os.getenv("CRAWL_PER_HOST_CONCURRENCY", 4))
+    CRAWL_MAX_PAGE_BYTES = int(os.getenv("CRAWL_MAX_PAGE_BYTES", 5 * 1024 * 1024))
+    CRAWL_USER_AGENT = os.getenv("CRAWL_USER_AGENT", "LegalAssistBot/1.0")
+
+    # Per-document index storage (utils/index_storage.py). Indexes idle for
+    # INDEX_COLD_AFTER_DAYS move to a cold tier of compressed archives, as do
+    # the least recently active ones while the hot directories exceed
+    # INDEX_DISK_QUOTA_MB (0: no quota); archives are restored on their next
+    # question. Indexes touched within INDEX_MIN_IDLE_SECONDS are never moved.
+    # Every INDEX_SWEEP_INTERVAL_SECONDS (0: only `python -m utils.index_storage
+    # sweep`) one worker also removes directories and archives that have no
+    # Mongo record and are older than INDEX_ORPHAN_GRACE_SECONDS.
+    PDF_INDEX_DIR = os.getenv("PDF_INDEX_DIR", "chat indexes")
+    URL_INDEX_DIR = os.getenv("URL_INDEX_DIR", "url indexes")
+    INDEX_COLD_DIR = os.getenv("INDEX_COLD_DIR", "cold indexes")
+    INDEX_DISK_QUOTA_MB = int(os.getenv("INDEX_DISK_QUOTA_MB", 2048))
+    INDEX_COLD_AFTER_DAYS = float(os.getenv("INDEX_COLD_AFTER_DAYS", 30))
+    INDEX_MIN_IDLE_SECONDS = int(os.getenv("INDEX_MIN_IDLE_SECONDS", 900))
+    INDEX_ORPHAN_GRACE_SECONDS = int(os.getenv("INDEX_ORPHAN_GRACE_SECONDS", 3600))
+    INDEX_SWEEP_INTERVAL_SECONDS = int(os.getenv("INDEX_SWEEP_INTERVAL_SECONDS", 3600))
+
+    # Page-parallel PDF text extraction
+    PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+    PDF_EXTRACT_START_METHOD = os.getenv("PDF_EXTRACT_START_METHOD", "forkserver")
+    PDF_EXTRACT_BATCH_PAGES = int(os.getenv("PDF_EXTRACT_BATCH_PAGES", 25))
+    PDF_EXTRACT_MAX_INFLIGHT_PAGES = int(os.getenv("PDF_EXTRACT_MAX_INFLIGHT_PAGES", 200))
+    PDF_EXTRACT_PARALLEL_MIN_PAGES = int(os.getenv("PDF_EXTRACT_PARALLEL_MIN_PAGES", 50))
+
+    # Content-addressed embedding cache and batched embedding calls
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding cache/embeddings.sqlite")
+    EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 100))
+    EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", 4))
+    EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", 3))
+    # Query embeddings are kept apart and bounded: least recently used first
+    # past EMBED_QUERY_CACHE_MAX_ENTRIES, and dropped after EMBED_QUERY_CACHE_TTL seconds unused
+    EMBED_QUERY_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_QUERY_CACHE_MAX_ENTRIES", 50000))
+    EMBED_QUERY_CACHE_TTL = int(os.getenv("EMBED_QUERY_CACHE_TTL", 7 * 86400))
+
+    # Embedding model for PDF/URL indexes as "provider:model", e.g.
+    # "google:models/embedding-001" or "local:sentence-transformers/all-MiniLM-L6-v2"
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "google:models/embedding-001")
+    LOCAL_EMBED_BATCH_SIZE = int(os.getenv("LOCAL_EMBED_BATCH_SIZE", 64))
+    LOCAL_EMBED_THREADS = int(os.getenv("LOCAL_EMBED_THREADS", 0))
+
+    # Per-document semantic answer cache
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+    ANSWER_CACHE_MAX_DOCS = int(os.getenv("ANSWER_CACHE_MAX_DOCS", 256))
+    ANSWER_CACHE_MAX_PER_DOC = int(os.getenv("ANSWER_CACHE_MAX_PER_DOC", 500))
+
+    # Batch questions (POST /ask or /ask_question with a "questions" list):
+    # at most BATCH_MAX_QUESTIONS per request, BATCH_LLM_CONCURRENCY LLM calls at once
+    BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", 50))
+    BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", 4))
+
+    # Backpressure for the LLM-bound endpoints (/upload, /ask, /process_url,
+    # /ask_question, /askai), per process: at most LLM_MAX_CONCURRENT_REQUESTS
+    # run at once and at most LLM_ENDPOINT_LIMITS ("endpoint=limit" pairs) per
+    # endpoint. Up to LLM_MAX_WAITING more wait LLM_ADMISSION_WAIT_SECONDS for
+    # a slot; the rest get 429, and waits that time out 503, with Retry-After.
+    # LLM_MAX_CONCURRENT_CALLS bounds outbound model calls (batch questions and
+    # ingestion included). A request gets 503 once REQUEST_DEADLINE_SECONDS
+    # pass, whether waiting for a call slot or for the model's answer. Keep GUNICORN_THREADS above the first limit plus
+    # the waiters so reads like GET /api/chats always find a free thread.
+    LLM_MAX_CONCURRENT_REQUESTS = int(os.getenv("LLM_MAX_CONCURRENT_REQUESTS", 16))
+    LLM_ENDPOINT_LIMITS = os.getenv(
+        "LLM_ENDPOINT_LIMITS", "upload=4,ask=12,process_url=4,ask_question=12,askai=12"
+    )
+    LLM_MAX_WAITING = int(os.getenv("LLM_MAX_WAITING", 8))
+    LLM_ADMISSION_WAIT_SECONDS = float(os.getenv("LLM_ADMISSION_WAIT_SECONDS", 10))
+    LLM_MAX_CONCURRENT_CALLS = int(os.getenv("LLM_MAX_CONCURRENT_CALLS", 16))
+    REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", 120))
+
+    # Q&A history page size (GET /api/chats/<id> and the /questions endpoints)
+    QA_PAGE_SIZE = int(os.getenv("QA_PAGE_SIZE", 50))
+    # Default page size of GET /api/chats, /api/urls and /api/feed
+    LISTING_PAGE_SIZE = int(os.getenv("LISTING_PAGE_SIZE", 50))
+
+    # Process-wide MongoClient connection pool
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 30000))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000))
+
+    # Request diagnostics: Server-Timing header with per-stage spans and a log
+    # line for requests slower than SLOW_REQUEST_MS (metrics are on /metrics)
+    SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
+    SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", 2000))
+
+    # Structure-aware chunking (approximate tokens) and the retrieved context
+    # packed into each prompt
+    CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", 512))
+    CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 64))
+    CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", 128))
+    RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 8))
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+
+    # Generated /askai retrieval index over the tracked IPC docstore
+    # (built offline with `python -m utils.ipc_index`, or on first use)
+    IPC_INDEX_DIR = os.getenv("IPC_INDEX_DIR", "ipc index")
+
+    # Cross-document index behind /api/search, sharded by document
+    GLOBAL_INDEX_DIR = os.getenv("GLOBAL_INDEX_DIR", "global index")
+    GLOBAL_INDEX_SHARDS = int(os.getenv("GLOBAL_INDEX_SHARDS", 8))
+    SEARCH_MAX_K = int(os.getenv("SEARCH_MAX_K", 50))
+
+    # Per-document index format: "float32" (exact), "float16" (exact, half the
+    # disk and page cache but slower scans) or "ivfpq" (IVF-PQ candidates
+    # re-ranked with float16 vectors; from VECTOR_INDEX_IVF_MIN_VECTORS chunks,
+    # float16 below). See benchmarks/bench_vector_index.py for the trade-offs.
+    VECTOR_INDEX_STORAGE = os.getenv("VECTOR_INDEX_STORAGE", "float32")
+    VECTOR_INDEX_IVF_MIN_VECTORS = int(os.getenv("VECTOR_INDEX_IVF_MIN_VECTORS", 20000))
+    VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", 32))
+    VECTOR_INDEX_RERANK_FACTOR = int(os.getenv("VECTOR_INDEX_RERANK_FACTOR", 10))
+
+    # Hybrid retrieval: a BM25 index next to every store is fused with vector
+    # search by reciprocal rank fusion (HYBRID_RRF_K is the rank damping).
+    # Statute lookups ("IPC 302", "Section 498A") with at most
+    # LEXICAL_FAST_PATH_MAX_TERMS other words skip the embedding call entirely.
+    HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", 60))
+    LEXICAL_FAST_PATH_MAX_TERMS = int(os.getenv("LEXICAL_FAST_PATH_MAX_TERMS", 4))
@@ -0,0 +1,26 @@
+# Loaded automatically by `gunicorn app:app` run from this directory.
+#
+# Threaded workers: a request waiting seconds on Gemini holds one thread, not
+# a whole worker process, so reads such as GET /api/chats keep being served
+# while the LLM-bound endpoints are saturated. utils/admission.py caps how
+# many threads those endpoints can take (LLM_MAX_CONCURRENT_REQUESTS running
+# plus LLM_MAX_WAITING queued); GUNICORN_THREADS should stay above that sum.
+import os
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', 5000)}")
+workers = int(os.getenv("GUNICORN_WORKERS", 2))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 32))
+# gthread workers heartbeat from their main loop, so this only catches hung
+# workers, not slow requests (those are bounded by REQUEST_DEADLINE_SECONDS)
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 180))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+
+def post_worker_init(worker):
+    # Resume abandoned ingestion jobs and start the sweeper when each worker
+    # boots, not on its first request: an idle restarted worker still resumes
+    from app import start_background_work
+
+    start_background_work()
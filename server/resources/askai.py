@@ -1,44 +1,64 @@
 import os
 import json
 from flask_restful import Resource, reqparse
-from flask import Flask, jsonify
-from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
-from langchain_google_genai import ChatGoogleGenerativeAI
-
-# Initialize the embedding model using HuggingFaceEmbeddings
-embed_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+from flask import Flask, jsonify, request
+from config import Config
+from utils.ipc_index import IPCIndex, IPC_EMBEDDING_MODEL
+from utils.embedding_cache import get_embeddings
+from utils.embedding_providers import create_embeddings
+from utils.model_registry import registry
+from utils.streaming import wants_stream, stream_llm_answer
+from utils.metrics import span, llm_metrics
+from utils.admission import llm_call_limiter, within_deadline
+from utils.lexical_index import is_reference_query
 
 # Set environment variables for tokenizers and Google API key
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 os.environ["GOOGLE_API_KEY"] = os.getenv("GEMINI")
 
-# Initialize the Google Gemini Generative AI model
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash", temperature=0.7, max_output_tokens=4000
-)
 
+# Heavy components are registered here and only built on first use (or on preload)
+def load_embed_model():
+    # Share the ingestion client when it is configured for the same model
+    if Config.EMBEDDING_MODEL == IPC_EMBEDDING_MODEL:
+        return get_embeddings()
+    return create_embeddings(IPC_EMBEDDING_MODEL)
+
+
+def load_llm():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.0-flash",
+        temperature=0.7,
+        max_output_tokens=4000,
+        callbacks=[llm_call_limiter, llm_metrics],
+    )
+
+
+def load_ipc_index():
+    # Open the precomputed IPC retrieval index (memory-mapped), building it on first run
+    if not IPCIndex.exists():
+        print("IPC index not found, building it (run `python -m utils.ipc_index` offline)")
+        return IPCIndex.build(
+            registry.get("askai_embed_model"), IPC_EMBEDDING_MODEL, rebuild=False
+        )
+    return IPCIndex.load(model_id=IPC_EMBEDDING_MODEL)
 
-# Manually load documents from a directory and create embeddings
-def load_documents(directory_path):
-    documents = []
-    document_texts = []
-    for filename in os.listdir(directory_path):
-        if filename.endswith(".json"):  # Handle JSON files
-            file_path = os.path.join(directory_path, filename)
-            with open(file_path, "r", encoding="utf-8") as file:
-                data = json.load(file)
-                # Assuming that the text is stored under a key like 'text'
-                text = data.get("text", "")
-                documents.append({"filename": filename, "text": text})
-                document_texts.append(text)
-    return documents, document_texts
 
+registry.register("askai_embed_model", load_embed_model)
+registry.register("askai_llm", load_llm)
+registry.register("ipc_index", load_ipc_index)
 
-# Load document texts and precompute embeddings
-documents, document_texts = load_documents("./indian_penal_code_index")
-document_embeddings = [embed_model.embed_query(text) for text in document_texts]
+TOP_K = int(os.getenv("ASKAI_TOP_K", 4))
+
+
+def format_sections(sections):
+    """Formats retrieved nodes as cited context blocks for the prompt"""
+    return "\n\n".join(
+        f"[{section['file_name']}, page {section['page_label']}]\n{section['text']}"
+        for section in sections
+    )
 
 
 # Define a basic AskAI resource for handling incoming requests
@@ -50,22 +70,46 @@ class AskAI(Resource):
         parser.add_argument("question", type=str, required=True)
         args = parser.parse_args()
 
-        # Embed the question using `embed_query`
-        question_embedding = embed_model.embed_query(args["question"])
-
-        # Compute cosine similarity between question embedding and document embeddings
-        similarities = cosine_similarity([question_embedding], document_embeddings)[0]
-        most_similar_idx = np.argmax(similarities)
-
-        # Fetch the most similar document text
-        relevant_text = document_texts[most_similar_idx]
-
-        # Create a prompt to ask Gemini to generate an answer based on the document
-        # prompt = f"Answer the following question based on the document:\n\n{relevant_text}\n\nQuestion: {args['question']}\nAnswer:"
-        prompt = f"Answer the following question based on indian law system. No bullshit answers, don't entertain question which is not relevant to legal. Answer can be in markdown formate.\n\nQuestion: {args['question']}\nAnswer:"
+        ipc_index = registry.get("ipc_index")
+
+        # Section lookups ("IPC 302") are served from the BM25 index, no embedding
+        sections = []
+        if is_reference_query(args["question"]):
+            with span("lexical_search"):
+                sections = ipc_index.hybrid_search(args["question"], k=TOP_K)
+
+        if not sections:
+            # Embed the question using `embed_query`
+            with span("embedding"):
+                question_embedding = registry.get("askai_embed_model").embed_query(
+                    args["question"]
+                )
+
+            # BM25 fused with the vectorized search over the memory-mapped IPC embeddings
+            with span("similarity_search"):
+                sections = ipc_index.hybrid_search(
+                    args["question"], question_embedding, k=TOP_K
+                )
+
+        # Create a prompt to ask Gemini to generate an answer grounded in the sections
+        prompt = f"Answer the following question based on indian law system. No bullshit answers, don't entertain question which is not relevant to legal. Answer can be in markdown formate. Use the relevant sections below where they apply and cite them by document and page.\n\nRelevant sections:\n{format_sections(sections)}\n\nQuestion: {args['question']}\nAnswer:"
+
+        sources = [
+            {
+                "file_name": section["file_name"],
+                "page_label": section["page_label"],
+                "score": section["score"],
+            }
+            for section in sections
+        ]
+
+        if wants_stream(request.get_json(silent=True)):
+            return stream_llm_answer(
+                registry.get("askai_llm"), prompt, extra={"sources": sources}
+            )
 
         # Use Gemini to generate a response
-        response = llm.invoke(prompt)  # Using invoke() as in your original code
+        response = within_deadline(registry.get("askai_llm").invoke, prompt)
 
         # Extract the generated answer from the response
         answer = (
@@ -73,4 +117,4 @@ class AskAI(Resource):
         )  # Adjust depending on the exact structure of Gemini's response
 
         # Return the generated answer as JSON
-        return jsonify({"error": False, "data": answer})
+        return jsonify({"error": False, "data": answer, "sources": sources})
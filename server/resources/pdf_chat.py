@@ -1,20 +1,44 @@
 from flask import request
 from flask_restful import Resource
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.chains.question_answering import load_qa_chain
 from langchain.prompts import PromptTemplate
+import os
 import uuid
 from datetime import datetime
-from utils.pdf_processor import PDFProcessor
-from utils.database import MongoDBManager
+from config import Config
+from utils.container import container
+from utils.admission import within_deadline
+from utils.streaming import wants_stream, stream_llm_answer, stream_text
+from utils.answer_cache import answer_cache, history_loader
+from utils.metadata_extractor import extract_metadata
+from utils.embedding_providers import EmbeddingModelMismatch
+from utils.ingestion_queue import ingestion_queue, wants_background, QueueFullError
+from utils.metrics import span
+from utils.chunker import pack_documents
+from utils.lexical_index import is_reference_query
+from utils.vector_index import retrieve
+from utils.global_index import get_global_index
+from utils.index_storage import index_storage
+from utils.batch_qa import (
+    BatchAnswerer,
+    parse_questions,
+    parse_source_ids,
+    not_answerable,
+    cited_sources,
+    respond,
+)
 
 
 class PDFChatService(Resource):
-    def __init__(self):
-        self.pdf_processor = PDFProcessor()
-        self.db_manager = MongoDBManager()
+    def __init__(self, container=container):
+        # Shared per-process clients; flask-restful builds a resource per request
+        self.pdf_processor = container.pdf_processor
+        self.db_manager = container.chat_db
+        self.qa_manager = container.qa_db
+        self.model = container.chat_llm
+        self.embeddings = container.embeddings
 
-    def get_conversational_chain(self):
+    def get_prompt(self):
         prompt_template = """
         Answer the question as detailed as possible from the provided context. 
         If the answer is not in the provided context, just say 
@@ -27,15 +51,23 @@ class PDFChatService(Resource):
         Question: {question}
         Answer:"""
 
-        model = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.3)
-        prompt = PromptTemplate(
+        return PromptTemplate(
             template=prompt_template, input_variables=["context", "question"]
         )
-        return load_qa_chain(model, chain_type="stuff", prompt=prompt)
+
+    def get_model(self):
+        return self.model
+
+    def get_conversational_chain(self):
+        return load_qa_chain(self.get_model(), chain_type="stuff", prompt=self.get_prompt())
 
     def post(self):
         if "pdf" in request.files:
+            if request.form.get("chat_id"):
+                return self.add_pdf_source(request.form["chat_id"])
             return self.upload_pdf()
+        if "questions" in (request.get_json(silent=True) or {}):
+            return self.ask_batch()
         return self.ask_question()
 
     def upload_pdf(self):
@@ -45,46 +77,46 @@ class PDFChatService(Resource):
         pdf_file = request.files["pdf"]
         pdf_id = str(uuid.uuid4())
 
-        raw_text = self.pdf_processor.get_pdf_text(pdf_file)
-        text_chunks = self.pdf_processor.get_text_chunks(raw_text)
-        self.pdf_processor.get_vector_store(text_chunks, pdf_id)
+        # Persist the upload so a queued or interrupted job can be (re)run later
+        os.makedirs(Config.UPLOAD_DIR, exist_ok=True)
+        upload_path = os.path.join(Config.UPLOAD_DIR, f"{pdf_id}.pdf")
+        pdf_file.save(upload_path)
 
-        # Use the first few chunks as context
-        context = " ".join(text_chunks[:3])[
-            :3000
-        ]  # Keep context short to avoid token limits
-        chain = self.get_conversational_chain()
-
-        # Ask LLM for metadata
-        def ask(prompt):
-            result = chain.invoke(
-                {"input_documents": [], "question": f"{prompt}\n\nContent:\n{context}"}
-            )
-            return result["output_text"].strip()
-
-        name = ask("Generate a short and meaningful name for this PDF. Answer in english only.")
-        description = ask("Write a 20-25 word description summarizing the document. Answer in english only.")
-        keywords = ask(
-            "Give 3-4 important keywords or phrases relevant to the document, separated by commas. Answer in english only."
-        )
-
-        # Prepare MongoDB record
+        # Prepare MongoDB record; metadata is filled in once ingestion finishes
         chat_record = {
             "chat_id": pdf_id,
             "file_name": pdf_file.filename,
-            "file_size": len(pdf_file.read()),
+            "file_size": os.path.getsize(upload_path),
             "upload_date": datetime.utcnow(),
-            "status": "processed",
-            "name": name,
-            "description": description,
-            "keywords": [k.strip() for k in keywords.split(",") if k.strip()],
-            "questions": [],
+            "status": "queued",
+            "progress": 0,
+            "upload_path": upload_path,
+            "name": pdf_file.filename,
+            "description": "",
+            "keywords": [],
         }
+        self.db_manager.create_chat_record(chat_record)
 
-        # Reset file pointer after reading size
-        pdf_file.seek(0)
+        if wants_background(request.form.get("async")):
+            try:
+                ingestion_queue.submit("pdf", pdf_id)
+            except QueueFullError as e:
+                self.db_manager.delete_chat_record(pdf_id)
+                os.remove(upload_path)
+                return {"error": str(e)}, 429
+            return {
+                "message": "PDF queued for processing",
+                "chat_id": pdf_id,
+                "job_id": pdf_id,
+                "status": "queued",
+            }, 202
 
-        self.db_manager.create_chat_record(chat_record)
+        try:
+            metadata = ingestion_queue.run_now("pdf", pdf_id)
+        except Exception as e:
+            # Like a failed URL: nothing is left behind for a request that got an error
+            self.discard_failed(pdf_id, upload_path)
+            return {"error": f"Failed to process PDF: {str(e)}"}, 500
 
         return {
             "message": "PDF processed successfully",
@@ -92,12 +124,177 @@ class PDFChatService(Resource):
             "file_info": {
                 "name": pdf_file.filename,
                 "size": chat_record["file_size"],
-                "title": name,
-                "description": description,
-                "keywords": chat_record["keywords"],
+                "title": metadata["name"],
+                "description": metadata["description"],
+                "keywords": metadata["keywords"],
             },
         }, 200
 
+    def discard_failed(self, pdf_id, upload_path):
+        """Removes the record, upload and any partial index of a failed synchronous ingest"""
+        self.db_manager.delete_chat_record(pdf_id)
+        index_storage.delete("pdf", pdf_id)
+        if os.path.exists(upload_path):
+            os.remove(upload_path)
+
+    def ingest_pdf(self, job, chat_record):
+        """Ingestion job: extract, chunk, embed and index an uploaded PDF.
+
+        Returns the generated metadata, which the queue stores on the record.
+        """
+        pdf_id = chat_record["chat_id"]
+        upload_path = chat_record["upload_path"]
+        answer_cache.invalidate(("pdf", pdf_id))
+
+        job.set_status("extracting")
+        text_chunks, metadatas = self.pdf_processor.get_pdf_chunks(upload_path)
+        if not text_chunks:
+            raise ValueError("No text could be extracted from the PDF")
+        for chunk_metadata in metadatas:
+            chunk_metadata["source"] = chat_record["file_name"]
+
+        job.set_status("embedding")
+        self.pdf_processor.get_vector_store(text_chunks, pdf_id, metadatas)
+
+        job.set_status("indexing")
+        # Use the first few chunks as context
+        context = " ".join(text_chunks[:3])[
+            :3000
+        ]  # Keep context short to avoid token limits
+
+        # One structured LLM call for name, description and keywords
+        metadata = extract_metadata(self.get_model(), context, "PDF document")
+
+        self.add_to_global_index(pdf_id, chat_record, metadata)
+
+        # The index is built, so the uploaded file is no longer needed
+        if os.path.exists(upload_path):
+            os.remove(upload_path)
+
+        return {
+            **metadata,
+            "sources": [self.original_source(chat_record)],
+            "last_activity": datetime.utcnow(),
+            # Versions the answer cache of every worker (see AnswerCache)
+            "ingested_at": datetime.utcnow(),
+        }
+
+    @staticmethod
+    def original_source(chat_record):
+        # The uploaded PDF is the chat's first source and shares its id
+        return {
+            "source_id": chat_record["chat_id"],
+            "name": chat_record.get("file_name"),
+            "file_size": chat_record.get("file_size"),
+            "added_at": chat_record.get("upload_date"),
+        }
+
+    def add_pdf_source(self, chat_id):
+        """Appends another PDF (e.g. an exhibit) to an existing chat.
+
+        Only the new file is extracted, chunked and embedded; its chunks are
+        added to the chat's index and tagged with the new source_id.
+        """
+        chat_record = self.db_manager.get_chat_record(chat_id)
+        if not chat_record:
+            return {"error": "Chat not found"}, 404
+        if chat_record.get("status", "processed") != "processed":
+            return {"error": "The chat is still being processed"}, 409
+
+        pdf_file = request.files["pdf"]
+        source_id = str(uuid.uuid4())
+        os.makedirs(Config.UPLOAD_DIR, exist_ok=True)
+        upload_path = os.path.join(Config.UPLOAD_DIR, f"{source_id}.pdf")
+        pdf_file.save(upload_path)
+        file_size = os.path.getsize(upload_path)
+
+        try:
+            text_chunks, metadatas = self.pdf_processor.get_pdf_chunks(upload_path)
+            if not text_chunks:
+                return {"error": "No text could be extracted from the PDF"}, 400
+            for chunk_metadata in metadatas:
+                chunk_metadata["source"] = pdf_file.filename
+            self.pdf_processor.add_source(chat_id, source_id, text_chunks, metadatas)
+        except EmbeddingModelMismatch as e:
+            return {"error": str(e)}, 409
+        except Exception as e:
+            print(f"Error adding a source to {chat_id}: {e}")
+            return {"error": f"Failed to process PDF: {str(e)}"}, 500
+        finally:
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
+
+        now = datetime.utcnow()
+        source = {
+            "source_id": source_id,
+            "name": pdf_file.filename,
+            "file_size": file_size,
+            "added_at": now,
+            "chunks": len(text_chunks),
+        }
+        # Chats created before multi-source support get their original PDF listed first
+        new_sources = [source]
+        if "sources" not in chat_record:
+            new_sources.insert(0, self.original_source(chat_record))
+        self.db_manager.update_chat_record(
+            chat_id,
+            {
+                "$push": {"sources": {"$each": new_sources}},
+                "$set": {"last_activity": now, "sources_changed_at": now},
+            },
+        )
+        self.source_changed(chat_id, chat_record)
+
+        return {
+            "message": "Source added successfully",
+            "chat_id": chat_id,
+            "source": {**source, "added_at": now.isoformat()},
+        }, 200
+
+    def remove_source(self, chat_id, source_id):
+        """Removes one source's chunks from a chat's index"""
+        chat_record = self.db_manager.get_chat_record(chat_id)
+        if not chat_record:
+            return {"error": "Chat not found"}, 404
+        try:
+            self.pdf_processor.drop_source(chat_id, source_id)
+        except KeyError:
+            return {"error": "Source not found"}, 404
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        now = datetime.utcnow()
+        self.db_manager.update_chat_record(
+            chat_id,
+            {
+                "$pull": {"sources": {"source_id": source_id}},
+                "$set": {"last_activity": now, "sources_changed_at": now},
+            },
+        )
+        self.source_changed(chat_id, chat_record)
+        return {"message": "Source removed successfully", "chat_id": chat_id}, 200
+
+    def source_changed(self, chat_id, chat_record):
+        # Cached answers may no longer hold (sources_changed_at also versions the
+        # caches of other workers); the global index gets the new passages
+        answer_cache.invalidate(("pdf", chat_id))
+        self.add_to_global_index(chat_id, chat_record, chat_record)
+
+    def add_to_global_index(self, pdf_id, chat_record, metadata):
+        """Adds the new index to the cross-document search; failures are not fatal"""
+        try:
+            get_global_index().add_vector_store(
+                "pdf",
+                pdf_id,
+                self.pdf_processor.load_vector_store(pdf_id),
+                name=metadata.get("name"),
+                keywords=metadata.get("keywords"),
+                created_at=chat_record.get("upload_date"),
+                model_id=self.embeddings.model_name,
+            )
+        except Exception as e:
+            print(f"Warning: Failed to add {pdf_id} to the global index: {e}")
+
     def ask_question(self):
         data = request.get_json()
         chat_id = data.get("chat_id")
@@ -106,24 +303,165 @@ class PDFChatService(Resource):
         if not chat_id or not user_question:
             return {"error": "Missing chat_id or question"}, 400
 
-        # Get answer first
-        docs = self.pdf_processor.load_vector_store(chat_id).similarity_search(
-            user_question
-        )
+        try:
+            source_ids = parse_source_ids(data)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        state = self.db_manager.get_answer_state(chat_id)
+        if state is None:
+            return {"error": "Chat not found"}, 404
+        status, answer_version = state
+        not_ready = not_answerable(status)
+        if not_ready:
+            return not_ready
+
+        def embed_and_check_cache():
+            # Near-identical questions on this chat are answered from its history
+            # (not when the question is limited to some of its sources)
+            with span("embedding"):
+                vector = self.embeddings.embed_query(user_question)
+            if source_ids is None:
+                cached_answer = answer_cache.lookup(
+                    ("pdf", chat_id),
+                    vector,
+                    history_loader(lambda: self.get_questions(chat_id)),
+                    version=answer_version,
+                )
+                if cached_answer is not None:
+                    self.save_question(chat_id, user_question, cached_answer)
+                    if wants_stream(data):
+                        return vector, stream_text(cached_answer, extra={"cached": True})
+                    return vector, ({"answer": cached_answer, "cached": True}, 200)
+            return vector, None
+
+        # Section lookups ("Section 498A") come from the BM25 index without an
+        # embedding call, and skip the semantic answer cache, which cannot tell
+        # "Section 302" from "Section 304". Other questions try the cache before
+        # the index is loaded, so a hit never pays for loading a cold index.
+        reference = is_reference_query(user_question)
+        question_vector = None
+        if not reference:
+            question_vector, cached_response = embed_and_check_cache()
+            if cached_response is not None:
+                return cached_response
+
+        try:
+            vector_store = self.pdf_processor.load_vector_store(chat_id)
+        except EmbeddingModelMismatch as e:
+            return {"error": str(e)}, 409
+
+        docs = []
+        if reference:
+            with span("lexical_search"):
+                docs = retrieve(
+                    vector_store, user_question, k=Config.RETRIEVAL_TOP_K, source_ids=source_ids
+                )
+
+        if not docs:
+            if question_vector is None:
+                question_vector, cached_response = embed_and_check_cache()
+                if cached_response is not None:
+                    return cached_response
+
+            with span("similarity_search"):
+                docs = retrieve(
+                    vector_store,
+                    user_question,
+                    question_vector,
+                    k=Config.RETRIEVAL_TOP_K,
+                    source_ids=source_ids,
+                )
+
+        # Bounded prompt: dedup, merge neighbouring chunks, fit CONTEXT_TOKEN_BUDGET
+        docs = pack_documents(docs, Config.CONTEXT_TOKEN_BUDGET)
+        citations = {"pages": self.cited_pages(docs), "sources": cited_sources(docs)}
+
+        def on_answer(answer):
+            self.save_question(chat_id, user_question, answer, source_ids)
+            if question_vector is not None and source_ids is None:
+                answer_cache.add(("pdf", chat_id), question_vector, answer)
+
+        if wants_stream(data):
+            # Same "stuff" prompt as the chain, but tokens are sent as they arrive
+            context = "\n\n".join(doc.page_content for doc in docs)
+            prompt = self.get_prompt().format(context=context, question=user_question)
+            return stream_llm_answer(
+                self.get_model(),
+                prompt,
+                on_complete=on_answer,
+                extra=citations,
+            )
+
         chain = self.get_conversational_chain()
-        response = chain.invoke({"input_documents": docs, "question": user_question})
+        response = within_deadline(
+            chain.invoke, {"input_documents": docs, "question": user_question}
+        )
         answer = response["output_text"]
 
-        # Update MongoDB with the new question
-        question_record = {
-            "question": user_question,
-            "answer": answer,
-            "timestamp": datetime.utcnow(),
-        }
-        update_data = {
-            "$push": {"questions": question_record},
-            "$set": {"last_activity": datetime.utcnow()},
-        }
-        self.db_manager.update_chat_record(chat_id, update_data)
+        on_answer(answer)
+
+        return {"answer": answer, **citations}, 200
+
+    def ask_batch(self):
+        """Answers a list of questions about one chat (e.g. a review checklist)"""
+        data = request.get_json()
+        chat_id = data.get("chat_id")
+        if not chat_id:
+            return {"error": "Missing chat_id"}, 400
+        try:
+            questions = parse_questions(data)
+            source_ids = parse_source_ids(data)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        state = self.db_manager.get_answer_state(chat_id)
+        if state is None:
+            return {"error": "Chat not found"}, 404
+        status, answer_version = state
+        not_ready = not_answerable(status)
+        if not_ready:
+            return not_ready
+        try:
+            vector_store = self.pdf_processor.load_vector_store(chat_id)
+        except EmbeddingModelMismatch as e:
+            return {"error": str(e)}, 409
+
+        batch = BatchAnswerer(
+            ("pdf", chat_id),
+            vector_store,
+            self.embeddings,
+            self.get_model(),
+            self.get_prompt(),
+            history_loader(lambda: self.get_questions(chat_id)),
+            cite=lambda docs: {"pages": self.cited_pages(docs)},
+            source_ids=source_ids,
+            cache_version=answer_version,
+        )
+        return respond(batch, questions, data, lambda pairs: self.save_questions(chat_id, pairs, source_ids))
+
+    @staticmethod
+    def cited_pages(docs):
+        # Indexes built before page-aware extraction have no page_label metadata
+        return [doc.metadata["page_label"] for doc in docs if "page_label" in doc.metadata]
 
-        return {"answer": answer}, 200
+    def get_questions(self, chat_id):
+        # Answers given before a source was added or removed are not reused
+        chat_record = self.db_manager.get_chat_record(chat_id) or {}
+        return self.qa_manager.get_recent_questions(
+            chat_id, Config.ANSWER_CACHE_MAX_PER_DOC, since=chat_record.get("sources_changed_at")
+        )
+
+    def save_question(self, chat_id, user_question, answer, source_ids=None):
+        # Q&A history lives in its own collection; the chat only tracks activity
+        self.qa_manager.add_question("pdf", chat_id, user_question, answer, source_ids=source_ids)
+        self.db_manager.update_chat_record(
+            chat_id, {"$set": {"last_activity": datetime.utcnow()}}
+        )
+
+    def save_questions(self, chat_id, pairs, source_ids=None):
+        # One bulk insert for a whole batch
+        self.qa_manager.add_questions("pdf", chat_id, pairs, source_ids=source_ids)
+        self.db_manager.update_chat_record(
+            chat_id, {"$set": {"last_activity": datetime.utcnow()}}
+        )
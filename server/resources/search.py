@@ -0,0 +1,65 @@
+from flask import request
+from flask_restful import Resource
+from datetime import datetime
+from config import Config
+from utils.container import container
+from utils.embedding_providers import EmbeddingModelMismatch
+from utils.global_index import get_global_index
+from utils.metrics import span
+
+
+class SearchService(Resource):
+    """Ranked passages across every PDF and URL document (POST /api/search)"""
+
+    def __init__(self, container=container):
+        self.embeddings = container.embeddings
+
+    def post(self):
+        data = request.get_json(silent=True) or {}
+        query = (data.get("query") or "").strip()
+        if not query:
+            return {"error": "Missing query"}, 400
+
+        source_type = data.get("source_type")
+        if source_type not in (None, "pdf", "url"):
+            return {"error": "source_type must be 'pdf' or 'url'"}, 400
+
+        keywords = data.get("keywords") or []
+        if isinstance(keywords, str):
+            keywords = [k.strip() for k in keywords.split(",") if k.strip()]
+
+        try:
+            date_from = self._parse_date(data.get("date_from"))
+            date_to = self._parse_date(data.get("date_to"), end_of_day=True)
+            k = min(max(int(data.get("k") or 10), 1), Config.SEARCH_MAX_K)
+        except (TypeError, ValueError):
+            return {"error": "k must be a number and date_from/date_to ISO dates, e.g. 2024-05-01"}, 400
+
+        with span("embedding"):
+            query_vector = self.embeddings.embed_query(query)
+        try:
+            with span("global_search"):
+                results = get_global_index().search(
+                    query_vector,
+                    k=k,
+                    model_id=self.embeddings.model_name,
+                    doc_type=source_type,
+                    keywords=keywords,
+                    date_from=date_from,
+                    date_to=date_to,
+                )
+        except EmbeddingModelMismatch as e:
+            return {"error": str(e)}, 409
+
+        return {"query": query, "results": results}, 200
+
+    @staticmethod
+    def _parse_date(value, end_of_day=False):
+        # Dates are compared as ISO strings against the stored creation dates;
+        # a bare date_to includes the whole day
+        if not value:
+            return None
+        parsed = datetime.fromisoformat(value)
+        if end_of_day and len(value) == 10:
+            parsed = parsed.replace(hour=23, minute=59, second=59, microsecond=999999)
+        return parsed.isoformat()
@@ -1,115 +1,444 @@
 from flask import request, jsonify
 from flask_restful import Resource
-from langchain_google_genai import ChatGoogleGenerativeAI
+from werkzeug.exceptions import HTTPException
 from langchain.chains.question_answering import load_qa_chain
 from langchain.prompts import PromptTemplate
-from utils.url_processor import URLProcessor
-from utils.database import URLDBManager
+from utils.container import container
+from utils.admission import within_deadline
+from config import Config
+from utils.streaming import wants_stream, stream_llm_answer, stream_text
+from utils.answer_cache import answer_cache, history_loader
+from utils.metadata_extractor import extract_metadata
+from utils.embedding_providers import EmbeddingModelMismatch
+from utils.ingestion_queue import ingestion_queue, wants_background, QueueFullError
+from utils.metrics import span
+from utils.chunker import pack_documents
+from utils.lexical_index import is_reference_query
+from utils.vector_index import retrieve
+from utils.global_index import get_global_index
+from utils.index_storage import index_storage
+from utils.batch_qa import (
+    BatchAnswerer,
+    parse_questions,
+    parse_source_ids,
+    not_answerable,
+    cited_sources,
+    respond,
+)
 import traceback
+import uuid
 from datetime import datetime
 
 
 class URLChatService(Resource):
     """Handles the chat API endpoints and question answering with database storage"""
 
-    def __init__(self):
-        self.model = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.3)
-        self.url_processor = URLProcessor()
-        self.db_manager = URLDBManager()
+    def __init__(self, container=container):
+        # Shared per-process clients; flask-restful builds a resource per request
+        self.model = container.chat_llm
+        self.url_processor = container.url_processor
+        self.db_manager = container.url_db
+        self.qa_manager = container.qa_db
 
     def post(self):
         """Main endpoint for both URL processing and question answering"""
+        if "url" in request.json and "url_id" in request.json:
+            return self._handle_add_source(request.json)
         if "url" in request.json:
             return self._handle_url_processing(request.json)
         elif "url_id" in request.json and "question" in request.json:
             return self._handle_question(request.json)
+        elif "url_id" in request.json and "questions" in request.json:
+            return self._handle_batch(request.json)
         return jsonify({"error": "Invalid request parameters"}), 400
 
     def _handle_url_processing(self, data):
-        """Processes a URL, stores in database, and returns its ID"""
+        """Registers a URL for ingestion, stores it in the database and returns its ID"""
         url = data.get("url")
-        url_id, error = self.url_processor.process_url(url)
-
-        if error:
-            return jsonify({"error": error}), 400
-
-        # Get context from the URL (first part of the content)
-        raw_text = self.url_processor.get_text_from_url(url)
-        text_chunks = self.url_processor.get_text_chunks(raw_text)
-        context = " ".join(text_chunks[:3])[:3000]  # Keep context short
+        if not url:
+            return jsonify({"error": "No URL provided"}), 400
+        try:
+            crawl = self._crawl_options(data.get("crawl"))
+        except ValueError as e:
+            return {"error": str(e)}, 400
 
-        # Generate metadata using LLM
-        name = self._generate_metadata(
-            context, "Generate a short and meaningful name for this URL content."
-        )
-        description = self._generate_metadata(
-            context, "Write a 20-25 word description summarizing the URL content."
-        )
+        url_id = str(uuid.uuid4())
 
-        # Prepare database record
+        # Prepare database record; metadata is filled in once ingestion finishes
         chat_record = {
             "url_id": url_id,
             "url": url,
             "created_at": datetime.utcnow(),
             "last_activity": datetime.utcnow(),
-            "status": "processed",
-            "name": name,
-            "description": description,
-            "questions": [],
+            "status": "queued",
+            "progress": 0,
+            "name": url,
+            "description": "",
         }
-
+        if crawl is not None:
+            chat_record["crawl"] = crawl
         self.db_manager.create_url_record(chat_record)
 
-        return {
+        if wants_background(data.get("async")):
+            try:
+                ingestion_queue.submit("url", url_id)
+            except QueueFullError as e:
+                self.db_manager.delete_url_record(url_id)
+                return {"error": str(e)}, 429
+            return {
+                "message": "URL queued for processing",
+                "url_id": url_id,
+                "job_id": url_id,
+                "status": "queued",
+            }, 202
+
+        try:
+            metadata = ingestion_queue.run_now("url", url_id)
+        except Exception as e:
+            self.db_manager.delete_url_record(url_id)
+            index_storage.delete("url", url_id)
+            return {"error": str(e)}, 400
+
+        response = {
             "message": "URL processed successfully",
             "url_id": url_id,
             "url_info": {
                 "url": url,
-                "title": name,
-                "description": description,
+                "title": metadata["name"],
+                "description": metadata["description"],
             },
+        }
+        if crawl is not None:
+            response["url_info"]["pages"] = len(metadata["sources"])
+        return response, 200
+
+    @staticmethod
+    def _crawl_options(value):
+        """Parses the optional "crawl" flag or {"max_pages", "max_depth"} object"""
+        if value is None or value is False:
+            return None
+        if value is True:
+            return {}
+        if not isinstance(value, dict):
+            raise ValueError("crawl must be true or an object with max_pages and max_depth")
+        options = {}
+        for key, minimum in (("max_pages", 1), ("max_depth", 0)):
+            if key in value:
+                if not isinstance(value[key], int) or isinstance(value[key], bool) or value[key] < minimum:
+                    raise ValueError(f"crawl.{key} must be an integer of at least {minimum}")
+                options[key] = value[key]
+        return options
+
+    def ingest_url(self, job, chat_record):
+        """Ingestion job: fetch, chunk, embed and index a URL, then generate metadata"""
+        url_id = chat_record["url_id"]
+        answer_cache.invalidate(("url", url_id))
+
+        # Fetch once and index; the extracted chunks are reused for metadata below
+        job.set_status("extracting")
+        sources = [self._original_source(chat_record)]
+        if chat_record.get("crawl") is not None:
+            # Pages are embedded while the crawl continues, so the job is
+            # reported as embedding from the first page on
+            result = self.url_processor.crawl_and_index(
+                chat_record["url"],
+                url_id,
+                on_page=lambda pages: job.set_status("embedding", pages_indexed=pages),
+                **chat_record["crawl"],
+            )
+            added_at = chat_record.get("created_at")
+            sources = [{**source, "added_at": added_at} for source in result["sources"]]
+        else:
+            result = self.url_processor.fetch_and_index(
+                chat_record["url"], url_id, on_stage=job.set_status
+            )
+        text_chunks = result["chunks"]
+
+        job.set_status("indexing")
+        context = " ".join(text_chunks[:3])[:3000]  # Keep context short
+
+        # Generate metadata using a single structured LLM call
+        metadata = extract_metadata(
+            self.model, context, "URL content", fields=("name", "description")
+        )
+        self._add_to_global_index(url_id, chat_record, metadata)
+        return {
+            **metadata,
+            "sources": sources,
+            "last_activity": datetime.utcnow(),
+            # Versions the answer cache of every worker (see AnswerCache)
+            "ingested_at": datetime.utcnow(),
+        }
+
+    @staticmethod
+    def _original_source(chat_record):
+        """The URL a chat was created from is its first source and shares its id"""
+        return {
+            "source_id": chat_record["url_id"],
+            "url": chat_record.get("url"),
+            "added_at": chat_record.get("created_at"),
+        }
+
+    def _handle_add_source(self, data):
+        """Appends another URL to an existing URL chat; only the new page is
+        fetched, chunked and embedded.
+        """
+        url_id, url = data["url_id"], data["url"]
+        chat_record = self.db_manager.get_url_record(url_id)
+        if not chat_record:
+            return {"error": "Chat not found"}, 404
+        if chat_record.get("status", "processed") != "processed":
+            return {"error": "The chat is still being processed"}, 409
+
+        source_id = str(uuid.uuid4())
+        try:
+            text_chunks = self.url_processor.add_source(url_id, source_id, url)
+        except EmbeddingModelMismatch as e:
+            return {"error": str(e)}, 409
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except Exception as e:
+            print("Error adding a URL source:", traceback.format_exc())
+            return {"error": f"Failed to process URL: {str(e)}"}, 500
+
+        now = datetime.utcnow()
+        source = {"source_id": source_id, "url": url, "added_at": now, "chunks": len(text_chunks)}
+        # Chats created before multi-source support get their original URL listed first
+        new_sources = [source]
+        if "sources" not in chat_record:
+            new_sources.insert(0, self._original_source(chat_record))
+        self.db_manager.update_url_record(
+            url_id,
+            {
+                "$push": {"sources": {"$each": new_sources}},
+                "$set": {"last_activity": now, "sources_changed_at": now},
+            },
+        )
+        self._source_changed(url_id, chat_record)
+
+        return {
+            "message": "Source added successfully",
+            "url_id": url_id,
+            "source": {**source, "added_at": now.isoformat()},
         }, 200
 
+    def remove_source(self, url_id, source_id):
+        """Removes one source's chunks from a URL chat's index"""
+        chat_record = self.db_manager.get_url_record(url_id)
+        if not chat_record:
+            return {"error": "Chat not found"}, 404
+        try:
+            self.url_processor.drop_source(url_id, source_id)
+        except KeyError:
+            return {"error": "Source not found"}, 404
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        now = datetime.utcnow()
+        self.db_manager.update_url_record(
+            url_id,
+            {
+                "$pull": {"sources": {"source_id": source_id}},
+                "$set": {"last_activity": now, "sources_changed_at": now},
+            },
+        )
+        self._source_changed(url_id, chat_record)
+        return {"message": "Source removed successfully", "url_id": url_id}, 200
+
+    def _source_changed(self, url_id, chat_record):
+        """Drops cached answers (sources_changed_at versions those of other
+        workers) and re-indexes the chat's passages for global search
+        """
+        answer_cache.invalidate(("url", url_id))
+        self._add_to_global_index(url_id, chat_record, chat_record)
+
+    def _add_to_global_index(self, url_id, chat_record, metadata):
+        """Adds the URL's index to the cross-document search; failures are not fatal"""
+        try:
+            get_global_index().add_vector_store(
+                "url",
+                url_id,
+                self.url_processor.load_vector_store(url_id),
+                name=metadata.get("name"),
+                keywords=chat_record.get("keywords"),
+                created_at=chat_record.get("created_at"),
+                model_id=self.url_processor.embeddings.model_name,
+            )
+        except Exception as e:
+            print(f"Warning: Failed to add {url_id} to the global index: {e}")
+
     def _handle_question(self, data):
         """Answers a question about a processed URL and stores in database"""
         try:
             url_id = data["url_id"]
             user_question = data["question"]
 
-            # Get answer first
+            try:
+                source_ids = parse_source_ids(data)
+            except ValueError as e:
+                return {"error": str(e)}, 400
+
+            state = self.db_manager.get_answer_state(url_id)
+            if state is None:
+                return {"error": "Chat not found"}, 404
+            status, answer_version = state
+            not_ready = not_answerable(status)
+            if not_ready:
+                return not_ready
+
+            def embed_and_check_cache():
+                # Near-identical questions on this URL are answered from its history
+                # (not when the question is limited to some of its sources)
+                with span("embedding"):
+                    vector = self.url_processor.embeddings.embed_query(user_question)
+                if source_ids is None:
+                    cached_answer = answer_cache.lookup(
+                        ("url", url_id),
+                        vector,
+                        history_loader(lambda: self._get_questions(url_id)),
+                        version=answer_version,
+                    )
+                    if cached_answer is not None:
+                        self._save_question(url_id, user_question, cached_answer)
+                        if wants_stream(data):
+                            return vector, stream_text(cached_answer, extra={"cached": True})
+                        return vector, ({"answer": cached_answer, "cached": True}, 200)
+                return vector, None
+
+            # Section lookups ("Section 498A") come from the BM25 index without an
+            # embedding call, and skip the semantic answer cache, which cannot tell
+            # "Section 302" from "Section 304". Other questions try the cache before
+            # the index is loaded, so a hit never pays for loading a cold index.
+            reference = is_reference_query(user_question)
+            question_vector = None
+            if not reference:
+                question_vector, cached_response = embed_and_check_cache()
+                if cached_response is not None:
+                    return cached_response
+
             vector_store = self.url_processor.load_vector_store(url_id)
-            docs = vector_store.similarity_search(user_question)
+
+            docs = []
+            if reference:
+                with span("lexical_search"):
+                    docs = retrieve(
+                        vector_store, user_question, k=Config.RETRIEVAL_TOP_K, source_ids=source_ids
+                    )
+
+            if not docs:
+                if question_vector is None:
+                    question_vector, cached_response = embed_and_check_cache()
+                    if cached_response is not None:
+                        return cached_response
+
+                with span("similarity_search"):
+                    docs = retrieve(
+                        vector_store,
+                        user_question,
+                        question_vector,
+                        k=Config.RETRIEVAL_TOP_K,
+                        source_ids=source_ids,
+                    )
+
+            # Bounded prompt: dedup, merge neighbouring chunks, fit CONTEXT_TOKEN_BUDGET
+            docs = pack_documents(docs, Config.CONTEXT_TOKEN_BUDGET)
+
+            def on_answer(answer):
+                self._save_question(url_id, user_question, answer, source_ids)
+                if question_vector is not None and source_ids is None:
+                    answer_cache.add(("url", url_id), question_vector, answer)
 
             if not docs:
                 return jsonify({"error": "No relevant content found"}), 200
 
+            if wants_stream(data):
+                context = "\n\n".join(doc.page_content for doc in docs)
+                prompt = self._get_prompt().format(context=context, question=user_question)
+                return stream_llm_answer(
+                    self.model,
+                    prompt,
+                    on_complete=on_answer,
+                    extra={"sources": cited_sources(docs)},
+                )
+
             chain = self._get_conversational_chain()
-            response = chain.invoke(
+            response = within_deadline(
+                chain.invoke,
                 {"input_documents": docs, "question": user_question},
                 return_only_outputs=True,
             )
             answer = response.get("output_text", "No response")
 
-            # Update database with the new question
-            question_record = {
-                "question": user_question,
-                "answer": answer,
-                "timestamp": datetime.utcnow(),
-            }
-            update_data = {
-                "$push": {"questions": question_record},
-                "$set": {"last_activity": datetime.utcnow()},
-            }
-            self.db_manager.update_url_record(url_id, update_data)
+            on_answer(answer)
 
-            return {"answer": answer}, 200
+            return {"answer": answer, "sources": cited_sources(docs)}, 200
+
+        except EmbeddingModelMismatch as e:
+            return {"error": str(e)}, 409
+
+        except HTTPException:
+            raise  # e.g. 503 from the LLM call limiter, with its Retry-After
 
         except Exception as e:
             print("Error answering question:", traceback.format_exc())
             return jsonify({"error": str(e)}), 500
 
-    def _get_conversational_chain(self):
-        """Creates the QA chain with prompt template"""
+    def _handle_batch(self, data):
+        """Answers a list of questions about a processed URL in one request"""
+        url_id = data["url_id"]
+        try:
+            questions = parse_questions(data)
+            source_ids = parse_source_ids(data)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        state = self.db_manager.get_answer_state(url_id)
+        if state is None:
+            return {"error": "Chat not found"}, 404
+        status, answer_version = state
+        not_ready = not_answerable(status)
+        if not_ready:
+            return not_ready
+        try:
+            vector_store = self.url_processor.load_vector_store(url_id)
+        except EmbeddingModelMismatch as e:
+            return {"error": str(e)}, 409
+
+        batch = BatchAnswerer(
+            ("url", url_id),
+            vector_store,
+            self.url_processor.embeddings,
+            self.model,
+            self._get_prompt(),
+            history_loader(lambda: self._get_questions(url_id)),
+            source_ids=source_ids,
+            cache_version=answer_version,
+        )
+        return respond(batch, questions, data, lambda pairs: self._save_questions(url_id, pairs, source_ids))
+
+    def _get_questions(self, url_id):
+        """Q&A history of a URL since its sources last changed, used to seed the answer cache"""
+        chat_record = self.db_manager.get_url_record(url_id) or {}
+        return self.qa_manager.get_recent_questions(
+            url_id, Config.ANSWER_CACHE_MAX_PER_DOC, since=chat_record.get("sources_changed_at")
+        )
+
+    def _save_question(self, url_id, user_question, answer, source_ids=None):
+        """Records a Q&A pair in the history collection and bumps last_activity"""
+        self.qa_manager.add_question("url", url_id, user_question, answer, source_ids=source_ids)
+        self.db_manager.update_url_record(
+            url_id, {"$set": {"last_activity": datetime.utcnow()}}
+        )
+
+    def _save_questions(self, url_id, pairs, source_ids=None):
+        """Records a batch of Q&A pairs with one bulk insert"""
+        self.qa_manager.add_questions("url", url_id, pairs, source_ids=source_ids)
+        self.db_manager.update_url_record(
+            url_id, {"$set": {"last_activity": datetime.utcnow()}}
+        )
+
+    def _get_prompt(self):
+        """Prompt template shared by the QA chain and the streaming path"""
         prompt_template = """
         Answer based on the context. If answer isn't in context, say: 
         'Answer is not available in the context.'
@@ -121,15 +450,10 @@ class URLChatService(Resource):
         
         Answer:
         """
-        prompt = PromptTemplate(
+        return PromptTemplate(
             template=prompt_template, input_variables=["context", "question"]
         )
-        return load_qa_chain(self.model, chain_type="stuff", prompt=prompt)
 
-    def _generate_metadata(self, context, prompt):
-        """Helper method to generate metadata using LLM"""
-        chain = self._get_conversational_chain()
-        result = chain.invoke(
-            {"input_documents": [], "question": f"{prompt}\n\nContent:\n{context}"}
-        )
-        return result["output_text"].strip()
+    def _get_conversational_chain(self):
+        """Creates the QA chain with prompt template"""
+        return load_qa_chain(self.model, chain_type="stuff", prompt=self._get_prompt())
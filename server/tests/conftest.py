@@ -0,0 +1,99 @@
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from benchmarks.static_site import make_site, serve as serve_static
+
+PAGE = "<html><body><h1>{title}</h1><p>{body}</p></body></html>"
+
+
+class StubSite:
+    """Pages served by path; pages with an etag answer a matching If-None-Match with 304"""
+
+    def __init__(self):
+        self.pages = {}  # path -> (html, etag or None)
+        self.log = []  # (path, status)
+        self.base_url = None
+
+    def set(self, path, title, body, etag=None):
+        self.pages[path] = (PAGE.format(title=title, body=body), etag)
+        return f"{self.base_url}{path}"
+
+    def statuses(self, path):
+        return [status for logged, status in self.log if logged == path]
+
+
+def _handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            page = site.pages.get(self.path)
+            if page is None:
+                status = 404
+                self.send_response(404)
+                self.end_headers()
+            else:
+                html, etag = page
+                if etag and self.headers.get("If-None-Match") == etag:
+                    status = 304
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                else:
+                    status = 200
+                    body = html.encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    if etag:
+                        self.send_header("ETag", etag)
+                    self.end_headers()
+                    self.wfile.write(body)
+            site.log.append((self.path, status))
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+@contextmanager
+def serve_stub(site):
+    """Serves ``site`` on a free localhost port; yields the base URL"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(site))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def stub_site():
+    """A StubSite served on localhost; its pages are set by the test"""
+    site = StubSite()
+    with serve_stub(site) as base_url:
+        site.base_url = base_url
+        yield site
+
+
+@pytest.fixture(scope="session")
+def statute_site(tmp_path_factory):
+    """benchmarks.static_site served on localhost: (start URL, expected pages)"""
+    root = str(tmp_path_factory.mktemp("static-site"))
+    expected = make_site(root, chapters=8)
+    with serve_static(root) as base_url:
+        yield f"{base_url}/act/", expected
+
+
+@pytest.fixture(scope="session")
+def fake_app():
+    """benchmarks.fake_app: the real app on mongomock and fake models.
+
+    Importing it moves into a scratch directory for the rest of the session.
+    """
+    from benchmarks.fake_app import app
+
+    return app
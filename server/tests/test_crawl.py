@@ -0,0 +1,43 @@
+from urllib.parse import urlsplit
+from utils.crawler import get_crawler
+
+
+def test_crawl_indexes_each_act_page_once(statute_site):
+    start_url, expected = statute_site
+
+    pages = list(get_crawler().pages(start_url))
+    paths = [urlsplit(page["url"]).path for page in pages]
+
+    # Print views and the mirrored chapter collapse into their chapter; the
+    # draft (robots.txt), the news page (out of scope) and the PDF are skipped
+    assert len(paths) == expected
+    assert set(paths) == {"/act"} | {f"/act/chapter-{c}.html" for c in range(1, expected)}
+
+
+def test_crawl_drops_page_furniture(statute_site):
+    start_url, _ = statute_site
+
+    chapter = next(
+        page for page in get_crawler().pages(start_url) if page["url"].endswith("/chapter-2.html")
+    )
+
+    assert "Provision 6 of chapter 2" in chapter["text"]
+    assert "Legal Portal" not in chapter["text"]
+    assert "cookies" not in chapter["text"]
+
+
+def test_crawl_honours_the_page_cap(statute_site):
+    start_url, _ = statute_site
+
+    assert len(list(get_crawler(max_pages=3).pages(start_url))) == 3
+
+
+def test_process_url_crawl(statute_site, fake_app):
+    start_url, expected = statute_site
+
+    response = fake_app.test_client().post(
+        "/process_url", json={"url": start_url, "crawl": True, "async": False}
+    )
+
+    assert response.status_code == 200
+    assert response.get_json()["url_info"]["pages"] == expected
@@ -0,0 +1,58 @@
+import os
+from utils.url_content_cache import URLContentCache
+
+
+def test_etag_is_revalidated_with_a_conditional_get(stub_site, tmp_path):
+    cache = URLContentCache(str(tmp_path), timeout=5)
+    url = stub_site.set("/etag.html", "Act", "Section 1 applies.", etag='"v1"')
+
+    first = cache.fetch(url)
+    cache.set_index_id(url, "index-1")
+    second = cache.fetch(url)
+
+    assert stub_site.statuses("/etag.html") == [200, 304]
+    assert second["text"] == first["text"]
+    assert second["index_id"] == "index-1"
+
+
+def test_unchanged_text_keeps_the_index(stub_site, tmp_path):
+    cache = URLContentCache(str(tmp_path), timeout=5)
+    url = stub_site.set("/plain.html", "Rules", "Rule 2 applies.")
+
+    first = cache.fetch(url)
+    cache.set_index_id(url, "index-2")
+    second = cache.fetch(url)
+
+    assert stub_site.statuses("/plain.html") == [200, 200]
+    assert second["content_hash"] == first["content_hash"]
+    assert second["index_id"] == "index-2"
+
+
+def test_changed_text_drops_the_index(stub_site, tmp_path):
+    cache = URLContentCache(str(tmp_path), timeout=5)
+    url = stub_site.set("/plain.html", "Rules", "Rule 2 applies.")
+    first = cache.fetch(url)
+    cache.set_index_id(url, "index-2")
+
+    stub_site.set("/plain.html", "Rules", "Rule 2 was amended.")
+    changed = cache.fetch(url)
+
+    assert changed["content_hash"] != first["content_hash"]
+    assert changed["index_id"] is None
+
+
+def test_reingesting_unchanged_content_reuses_the_index(stub_site, fake_app):
+    from utils.container import container
+    from utils.index_storage import index_storage
+
+    processor = container.url_processor
+    url = stub_site.set(
+        "/chapter.html", "Chapter 1", " ".join(f"Provision {i} applies." for i in range(200))
+    )
+
+    first = processor.fetch_and_index(url, "reuse-first")
+    second = processor.fetch_and_index(url, "reuse-second")
+
+    assert not first["reused_index"]
+    assert second["reused_index"]
+    assert os.path.isdir(index_storage.path("url", "reuse-second"))
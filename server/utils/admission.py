@@ -0,0 +1,332 @@
+import os
+import json
+import math
+import time
+import queue
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from flask import Response
+from langchain_core.callbacks import BaseCallbackHandler
+from werkzeug.exceptions import HTTPException
+from config import Config
+from utils.metrics import metrics
+
+ADMISSION_WAIT_SECONDS = metrics.histogram(
+    "legalassist_admission_wait_seconds", "Time LLM-bound requests waited for a slot", ("endpoint",)
+)
+ADMISSION_REJECTED = metrics.counter(
+    "legalassist_admission_rejected_total",
+    "Requests and LLM calls turned away by the limiters",
+    ("endpoint", "reason"),
+)
+
+# Deadline (time.monotonic()) of the request being served, if it has one
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class Overloaded(HTTPException):
+    """429/503 with a JSON {"error"} body and a Retry-After header.
+
+    Being an HTTPException, Flask and flask-restful send its response as is.
+    Built without an app context, since LLM calls can run on worker threads.
+    """
+
+    def __init__(self, status, message, retry_after):
+        response = Response(
+            json.dumps({"error": message}),
+            status=status,
+            mimetype="application/json",
+            headers={"Retry-After": str(retry_after)},
+        )
+        super().__init__(description=message, response=response)
+        self.code = status
+
+
+class Limiter:
+    """Counting semaphore that also tracks how long slots are held (moving
+    average), which gives the Retry-After estimate sent with rejections.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self.waiting = 0
+        self._hold_seconds = 1.0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        """Takes a slot, waiting at most ``timeout`` seconds (None: as long as
+        it takes); returns False on timeout.
+        """
+        with self._cond:
+            self.waiting += 1
+            try:
+                if not self._cond.wait_for(lambda: self.in_use < self.limit, timeout):
+                    return False
+                self.in_use += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self, held_seconds=None):
+        with self._cond:
+            self.in_use -= 1
+            if held_seconds is not None:
+                self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * held_seconds
+            self._cond.notify_all()
+
+    def retry_after(self, backlog=None):
+        """Seconds until ``backlog`` more holders (default: the current
+        waiters and the caller) have probably been served, 1..60
+        """
+        with self._cond:
+            backlog = self.waiting + 1 if backlog is None else backlog
+            seconds = self._hold_seconds * backlog / max(self.limit, 1)
+        return min(max(math.ceil(seconds), 1), 60)
+
+    def stats(self):
+        return {"limit": self.limit, "in_use": self.in_use, "waiting": self.waiting}
+
+
+def parse_endpoint_limits(spec):
+    """"ask=8,askai=4" -> {"ask": 8, "askai": 4}"""
+    limits = {}
+    for pair in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = pair.partition("=")
+        limits[name.strip().strip("/")] = int(value)
+    return limits
+
+
+def remaining_seconds():
+    """Seconds left before the current request's deadline, or None without one"""
+    deadline = _deadline.get()
+    return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+
+
+def _deadline_exceeded():
+    ADMISSION_REJECTED.inc(endpoint="llm_call", reason="deadline")
+    return Overloaded(
+        503, "Request deadline exceeded while waiting for the model",
+        llm_call_limiter.limiter.retry_after(),
+    )
+
+
+_call_executor = None
+_call_executor_pid = None
+_call_executor_lock = threading.Lock()
+
+
+def _executor():
+    global _call_executor, _call_executor_pid
+    with _call_executor_lock:
+        if _call_executor_pid != os.getpid():
+            # Calls that ran out of time keep their thread until the provider
+            # answers, so leave room beyond the concurrent call limit
+            _call_executor = ThreadPoolExecutor(
+                max_workers=2 * Config.LLM_MAX_CONCURRENT_CALLS, thread_name_prefix="llm-call"
+            )
+            _call_executor_pid = os.getpid()
+        return _call_executor
+
+
+def within_deadline(call, *args, **kwargs):
+    """Runs ``call`` (an LLM invoke) for at most the current request's
+    remaining time, raising a 503 Overloaded when it runs out. The model has
+    no request timeout of its own, so the call runs on a worker thread that
+    the request stops waiting for. Without a deadline (background jobs) it
+    runs inline.
+    """
+    remaining = remaining_seconds()
+    if remaining is None:
+        return call(*args, **kwargs)
+    future = _executor().submit(contextvars.copy_context().run, call, *args, **kwargs)
+    try:
+        return future.result(timeout=remaining)
+    except FutureTimeout:
+        future.cancel()
+        raise _deadline_exceeded() from None
+
+
+def stream_within_deadline(make_stream):
+    """Yields from ``make_stream()`` (an LLM stream), raising a 503 Overloaded
+    when the request deadline passes before the next chunk arrives
+    """
+    if remaining_seconds() is None:
+        yield from make_stream()
+        return
+    chunks = queue.Queue()
+    done = object()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for chunk in make_stream():
+                if stop.is_set():
+                    return
+                chunks.put(chunk)
+            chunks.put(done)
+        except BaseException as e:
+            chunks.put(e)
+
+    _executor().submit(contextvars.copy_context().run, produce)
+    try:
+        while True:
+            try:
+                item = chunks.get(timeout=remaining_seconds())
+            except queue.Empty:
+                raise _deadline_exceeded() from None
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+class Ticket:
+    """An admitted request's slots; released once, when its response is done"""
+
+    def __init__(self, limiters):
+        self._limiters = limiters
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        held = time.monotonic() - self._started
+        for limiter in reversed(self._limiters):
+            limiter.release(held)
+
+
+class AdmissionController:
+    """Per-process backpressure for the endpoints that wait on the LLM.
+
+    A request needs a slot of its endpoint's limiter and of the global one.
+    When none is free it waits for at most ``wait_seconds``, with at most
+    ``max_waiting`` requests waiting in all, so a burst of slow Gemini calls
+    queues here, with a bound, instead of occupying every server thread:
+    cheap reads such as GET /api/chats never pass through it. A full queue
+    answers 429 and a wait that times out 503, both with Retry-After.
+    """
+
+    def __init__(self, total, endpoint_limits, max_waiting, wait_seconds, deadline_seconds):
+        self.total = Limiter(total)
+        self.endpoints = {name: Limiter(limit) for name, limit in endpoint_limits.items()}
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self._lock = threading.Lock()
+        self.wait_seconds = wait_seconds
+        self.deadline_seconds = deadline_seconds
+
+    def covers(self, endpoint):
+        return endpoint in self.endpoints
+
+    def admit(self, endpoint):
+        """Returns a Ticket, or raises Overloaded; starts the request deadline"""
+        started = time.monotonic()
+        _deadline.set(started + self.deadline_seconds)
+        acquired = []
+        try:
+            for limiter in (self.endpoints[endpoint], self.total):
+                if not limiter.acquire(0):
+                    self._wait(endpoint, limiter, started)
+                acquired.append(limiter)
+        except Overloaded:
+            for limiter in acquired:
+                limiter.release()
+            _deadline.set(None)
+            raise
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - started, endpoint=endpoint)
+        return Ticket(acquired)
+
+    def _wait(self, endpoint, limiter, started):
+        with self._lock:
+            if self.waiting >= self.max_waiting:
+                ADMISSION_REJECTED.inc(endpoint=endpoint, reason="queue_full")
+                raise Overloaded(
+                    429,
+                    "Too many requests are waiting for the model, try again later",
+                    limiter.retry_after(self.waiting + 1),
+                )
+            self.waiting += 1
+        try:
+            timeout = max(self.wait_seconds - (time.monotonic() - started), 0)
+            if not limiter.acquire(timeout):
+                ADMISSION_REJECTED.inc(endpoint=endpoint, reason="wait_timeout")
+                raise Overloaded(503, "The model is busy, try again later", limiter.retry_after())
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    @staticmethod
+    def finish(ticket):
+        ticket.release()
+        _deadline.set(None)
+
+    def stats(self):
+        return {
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "total": self.total.stats(),
+            "endpoints": {name: limiter.stats() for name, limiter in self.endpoints.items()},
+        }
+
+
+class LLMCallLimiter(BaseCallbackHandler):
+    """LangChain callback bounding concurrent outbound LLM calls per process.
+
+    Attached to the chat models, like LLMMetricsHandler, so chains, streams,
+    batch questions and ingestion metadata calls all share the slots. A call
+    made for a request waits no longer than that request's deadline, then
+    fails with a 503; ingestion jobs in the background wait as long as needed.
+    """
+
+    raise_error = True
+
+    def __init__(self, limit):
+        self.limiter = Limiter(limit)
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id):
+        remaining = remaining_seconds()
+        if remaining == 0.0 or not self.limiter.acquire(remaining):
+            ADMISSION_REJECTED.inc(endpoint="llm_call", reason="deadline")
+            raise Overloaded(
+                503, "Request deadline exceeded while waiting for the model",
+                self.limiter.retry_after(),
+            )
+        with self._lock:
+            self._runs[run_id] = time.monotonic()
+
+    def _finish(self, run_id):
+        with self._lock:
+            started = self._runs.pop(run_id, None)
+        if started is not None:
+            self.limiter.release(time.monotonic() - started)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+
+admission = AdmissionController(
+    total=Config.LLM_MAX_CONCURRENT_REQUESTS,
+    endpoint_limits=parse_endpoint_limits(Config.LLM_ENDPOINT_LIMITS),
+    max_waiting=Config.LLM_MAX_WAITING,
+    wait_seconds=Config.LLM_ADMISSION_WAIT_SECONDS,
+    deadline_seconds=Config.REQUEST_DEADLINE_SECONDS,
+)
+llm_call_limiter = LLMCallLimiter(Config.LLM_MAX_CONCURRENT_CALLS)
@@ -0,0 +1,141 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import Config
+from utils.embedding_cache import get_embeddings
+
+
+class DocumentAnswers:
+    """Normalised question embeddings of one document with their answers"""
+
+    def __init__(self, dim, max_entries, version=None):
+        self.max_entries = max_entries
+        self.version = version
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.answers = []
+
+    def add(self, vectors, answers):
+        if not answers:
+            return
+        self.matrix = np.vstack([self.matrix, vectors])[-self.max_entries :]
+        self.answers = (self.answers + list(answers))[-self.max_entries :]
+
+    def best(self, vector):
+        if not self.answers:
+            return None, 0.0
+        scores = self.matrix @ vector
+        i = int(np.argmax(scores))
+        return self.answers[i], float(scores[i])
+
+
+class AnswerCache:
+    """Per-document semantic cache of answers to previously asked questions.
+
+    Keyed by ("pdf", chat_id) or ("url", url_id). The first lookup for a
+    document seeds it from that document's stored Q&A history; a new question
+    whose embedding has cosine similarity >= ``threshold`` with a cached
+    question gets the stored answer without any LLM call. At most
+    ``max_docs`` documents are held, evicted least-recently-used first.
+    """
+
+    def __init__(self, threshold, max_docs, max_entries_per_doc):
+        self.threshold = threshold
+        self.max_docs = max_docs
+        self.max_entries_per_doc = max_entries_per_doc
+        self._docs = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _get_doc(self, key, vector, load_history, version):
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is not None and doc.version == version:
+                self._docs.move_to_end(key)
+                return doc
+
+        # Seed from history outside the lock; it embeds the stored questions
+        doc = DocumentAnswers(vector.shape[-1], self.max_entries_per_doc, version)
+        questions, answers, vectors = load_history()
+        if questions:
+            doc.add(self._normalize(vectors), answers)
+
+        with self._lock:
+            current = self._docs.get(key)
+            if current is None or current.version != version:
+                self._docs[key] = current = doc
+            doc = current
+            self._docs.move_to_end(key)
+            while len(self._docs) > self.max_docs:
+                self._docs.popitem(last=False)
+            return doc
+
+    def lookup(self, key, question_vector, load_history, version=None):
+        """Returns a stored answer for a near-identical question, or None.
+
+        ``load_history()`` returns (questions, answers, question_vectors) and is
+        only called the first time a document is looked up at ``version``.
+        """
+        vector = self._normalize(question_vector)[0]
+        doc = self._get_doc(key, vector, load_history, version)
+        with self._lock:
+            answer, score = doc.best(vector)
+            if answer is not None and score >= self.threshold:
+                self.hits += 1
+                return answer
+            self.misses += 1
+            return None
+
+    def add(self, key, question_vector, answer):
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is not None:
+                doc.add(self._normalize(question_vector), [answer])
+
+    def invalidate(self, key):
+        """Drops a document's answers, e.g. when it is re-ingested or deleted"""
+        with self._lock:
+            self._docs.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "documents": len(self._docs),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else None,
+                "threshold": self.threshold,
+            }
+
+
+def history_loader(get_questions):
+    """Builds a ``load_history`` callable from a function returning Q&A records"""
+
+    def load():
+        # Answers limited to some sources never seed the whole-document cache
+        records = [
+            r for r in (get_questions() or [])
+            if r.get("question") and r.get("answer") and not r.get("source_ids")
+        ]
+        questions = [r["question"] for r in records]
+        if not questions:
+            return [], [], []
+        vectors = get_embeddings().embed_queries(questions)
+        return questions, [r["answer"] for r in records], vectors
+
+    return load
+
+
+answer_cache = AnswerCache(
+    threshold=Config.ANSWER_CACHE_THRESHOLD,
+    max_docs=Config.ANSWER_CACHE_MAX_DOCS,
+    max_entries_per_doc=Config.ANSWER_CACHE_MAX_PER_DOC,
+)
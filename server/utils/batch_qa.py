@@ -0,0 +1,215 @@
+import traceback
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import Config
+from utils.admission import within_deadline
+from utils.answer_cache import answer_cache
+from utils.chunker import pack_documents
+from utils.lexical_index import is_reference_query
+from utils.metrics import span
+from utils.streaming import wants_stream, stream_events
+from utils.vector_index import retrieve, retrieve_many
+
+
+def parse_questions(data):
+    """The questions of a batch request body; raises ValueError when invalid"""
+    questions = data.get("questions")
+    if not isinstance(questions, list) or not questions:
+        raise ValueError("questions must be a non-empty list of strings")
+    if not all(isinstance(question, str) and question.strip() for question in questions):
+        raise ValueError("Every question must be a non-empty string")
+    if len(questions) > Config.BATCH_MAX_QUESTIONS:
+        raise ValueError(f"At most {Config.BATCH_MAX_QUESTIONS} questions per batch")
+    return [question.strip() for question in questions]
+
+
+def parse_source_ids(data):
+    """Optional "source_ids" filter of a question request (a list or one id)"""
+    source_ids = data.get("source_ids")
+    if not source_ids:
+        return None
+    if isinstance(source_ids, str):
+        return [source_ids]
+    if not isinstance(source_ids, list) or not all(isinstance(s, str) for s in source_ids):
+        raise ValueError("source_ids must be a list of source ids")
+    return source_ids
+
+
+def not_answerable(status):
+    """Error response for a chat whose index cannot be queried yet, or None"""
+    if status == "processed":
+        return None
+    if status == "failed":
+        return {"error": "Processing the chat failed; add the document again"}, 409
+    return {"error": "The chat is still being processed"}, 409
+
+
+def cited_sources(docs):
+    """Distinct source names of the retrieved chunks, for attribution"""
+    sources = []
+    for doc in docs:
+        name = doc.metadata.get("source")
+        if name and name not in sources:
+            sources.append(name)
+    return sources
+
+
+class BatchAnswerer:
+    """Answers a checklist of questions against one loaded document store.
+
+    Retrieval is done for the whole batch up front: statute lookups go to the
+    lexical index, all other questions are embedded with one embed_queries
+    call, checked against the answer cache and searched with one vectorized
+    multi-query search. The remaining LLM calls run on at most
+    BATCH_LLM_CONCURRENCY threads and results are yielded as they finish.
+    """
+
+    def __init__(self, cache_key, vector_store, embeddings, model, prompt, load_history,
+                 cite=None, source_ids=None, cache_version=None):
+        self.cache_key = cache_key
+        self.cache_version = cache_version
+        self.vector_store = vector_store
+        self.embeddings = embeddings
+        self.model = model
+        self.prompt = prompt
+        self.load_history = load_history
+        self.cite = cite
+        # Answers cached for the whole document do not apply to a source filter
+        self.source_ids = source_ids
+
+    def retrieve(self, questions):
+        """One item per question with its packed documents or cached answer"""
+        items = [
+            {"index": i, "question": question, "vector": None, "docs": [], "answer": None}
+            for i, question in enumerate(questions)
+        ]
+        with span("lexical_search"):
+            for item in items:
+                if is_reference_query(item["question"]):
+                    item["docs"] = retrieve(
+                        self.vector_store,
+                        item["question"],
+                        k=Config.RETRIEVAL_TOP_K,
+                        source_ids=self.source_ids,
+                    )
+
+        pending = [item for item in items if not item["docs"]]
+        if pending:
+            with span("embedding"):
+                vectors = self.embeddings.embed_queries([item["question"] for item in pending])
+            for item, vector in zip(pending, vectors):
+                item["vector"] = vector
+                if self.source_ids is None:
+                    item["answer"] = answer_cache.lookup(
+                        self.cache_key, vector, self.load_history, version=self.cache_version
+                    )
+
+            searched = [item for item in pending if item["answer"] is None]
+            with span("similarity_search"):
+                found = retrieve_many(
+                    self.vector_store,
+                    [item["question"] for item in searched],
+                    [item["vector"] for item in searched],
+                    k=Config.RETRIEVAL_TOP_K,
+                    source_ids=self.source_ids,
+                )
+            for item, docs in zip(searched, found):
+                item["docs"] = docs
+
+        for item in items:
+            item["docs"] = pack_documents(item["docs"], Config.CONTEXT_TOKEN_BUDGET)
+        return items
+
+    def _ask(self, item):
+        context = "\n\n".join(doc.page_content for doc in item["docs"])
+        prompt = self.prompt.format(context=context, question=item["question"])
+        return within_deadline(self.model.invoke, prompt).content
+
+    def _result(self, item, answer=None, error=None, cached=False):
+        result = {"index": item["index"], "question": item["question"]}
+        if error is not None:
+            result["error"] = error
+            return result
+        result["answer"] = answer
+        if cached:
+            result["cached"] = True
+            return result
+        if self.cite:
+            result.update(self.cite(item["docs"]))
+        sources = cited_sources(item["docs"])
+        if sources:
+            result["sources"] = sources
+        return result
+
+    def run(self, questions):
+        """Yields a result dict per question in completion order (cached answers first)"""
+        items = self.retrieve(questions)
+        todo = []
+        for item in items:
+            if item["answer"] is not None:
+                yield self._result(item, item["answer"], cached=True)
+            elif not item["docs"]:
+                yield self._result(item, error="No relevant content found")
+            else:
+                todo.append(item)
+        if not todo:
+            return
+
+        executor = ThreadPoolExecutor(max_workers=min(Config.BATCH_LLM_CONCURRENCY, len(todo)))
+        try:
+            # Each call carries the request's context, so its deadline applies
+            futures = {
+                executor.submit(contextvars.copy_context().run, self._ask, item): item
+                for item in todo
+            }
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    answer = future.result()
+                except Exception as e:
+                    print("Error answering batch question:", traceback.format_exc())
+                    yield self._result(item, error=getattr(e, "description", None) or str(e))
+                    continue
+                if item["vector"] is not None and self.source_ids is None:
+                    answer_cache.add(self.cache_key, item["vector"], answer)
+                yield self._result(item, answer)
+        finally:
+            # A client that disconnects mid-stream does not keep LLM calls queued
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def respond(batch, questions, data, save):
+    """Runs ``batch`` as SSE ("answer" events, then "done") or as one JSON body.
+
+    The answered questions are persisted with a single ``save(pairs)`` call
+    once the batch ends, including when a streaming client disconnects early.
+    """
+    results = []
+
+    def persist():
+        answered = sorted(
+            (result for result in results if "answer" in result), key=lambda r: r["index"]
+        )
+        if answered:
+            save([(result["question"], result["answer"]) for result in answered])
+
+    def summary():
+        errors = sum(1 for result in results if "error" in result)
+        return {"count": len(results), "answered": len(results) - errors, "errors": errors}
+
+    if wants_stream(data):
+
+        def events():
+            try:
+                for result in batch.run(questions):
+                    results.append(result)
+                    yield "answer", result
+            finally:
+                persist()
+            yield "done", summary()
+
+        return stream_events(events())
+
+    results.extend(batch.run(questions))
+    persist()
+    return {"answers": sorted(results, key=lambda r: r["index"]), **summary()}, 200
@@ -0,0 +1,254 @@
+import re
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from config import Config
+
+# Approximate tokens: words, numbers and punctuation marks each count as one.
+# Close enough to Gemini's tokenizer for budgeting without a network call.
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Lines that open a new unit of a statute, contract or judgment. The number
+# must be followed by ".", ":", a dash or the end of the line, and Roman
+# numerals must be upper case, so prose such as "Order in which..." or
+# "Rule 2 applies" does not start a unit
+HEADING_PATTERN = re.compile(
+    r"^[ \t]*(?:"
+    r"(?:section|sec\.|article|art\.|clause|chapter|part|schedule|rule|regulation|order)"
+    r"[ \t]+(?:\d+|(?-i:[IVXLC]+))[A-Za-z]?[ \t]*(?:[.:\-\u2013\u2014]|$)"
+    r"|§+[ \t]*\d+"
+    r")",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def count_tokens(text):
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def token_tail(text, tokens):
+    """The last ``tokens`` tokens of ``text``, cut at a token boundary"""
+    if tokens <= 0:
+        return ""
+    starts = [match.start() for match in TOKEN_PATTERN.finditer(text)]
+    if len(starts) <= tokens:
+        return text
+    return text[starts[-tokens]:]
+
+
+def truncate_tokens(text, tokens):
+    """The first ``tokens`` tokens of ``text``"""
+    ends = [match.end() for match in TOKEN_PATTERN.finditer(text)]
+    if len(ends) <= tokens:
+        return text
+    return text[: ends[tokens - 1]]
+
+
+def split_blocks(text):
+    """Splits a page into blocks that each start at a heading (or the page start).
+
+    Returns [(heading_or_None, block_text)].
+    """
+    starts = [match.start() for match in HEADING_PATTERN.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    blocks = []
+    for start, stop in zip(starts, starts[1:] + [len(text)]):
+        block = text[start:stop]
+        if not block.strip():
+            continue
+        match = HEADING_PATTERN.match(block)
+        heading = block.strip().splitlines()[0].strip()[:120] if match else None
+        blocks.append((heading, block))
+    return blocks
+
+
+class LegalChunker:
+    """Token-budgeted chunker that prefers legal structure as split points.
+
+    Chunks hold at most ``chunk_tokens`` tokens. A new chunk starts at a
+    Section/Article/Clause/... heading once the current one has at least
+    ``min_tokens``; otherwise headings and page boundaries are packed
+    together. Blocks larger than a chunk are split recursively (paragraphs,
+    lines, sentences) into pieces of about equal size that leave room for
+    the ``overlap_tokens`` tail carried over from the previous chunk.
+    """
+
+    def __init__(self, chunk_tokens=None, overlap_tokens=None, min_tokens=None):
+        self.chunk_tokens = chunk_tokens or Config.CHUNK_TOKENS
+        self.overlap_tokens = (
+            Config.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+        )
+        self.overlap_tokens = min(self.overlap_tokens, self.chunk_tokens // 2)
+        self.min_tokens = Config.CHUNK_MIN_TOKENS if min_tokens is None else min_tokens
+        # Largest piece that still fits in a chunk behind an overlap tail
+        self.piece_tokens = self.chunk_tokens - self.overlap_tokens
+
+    def _split(self, block, tokens):
+        """Splits an oversized block into pieces of at most ``piece_tokens``.
+
+        The pieces aim at an equal share of the block, so the last one is not
+        a small fragment, and fragments the splitter still leaves (a heading
+        line, a short paragraph) join a neighbour when they fit.
+        """
+        count = -(-tokens // self.piece_tokens)
+        share = -(-tokens // count)
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=min(self.piece_tokens, share + share // 4),
+            chunk_overlap=0,
+            length_function=count_tokens,
+            separators=["\n\n", "\n", ". ", "; ", " ", ""],
+            keep_separator=True,
+            strip_whitespace=False,  # the pieces concatenate back to the block
+        )
+        pieces = []
+        for piece in splitter.split_text(block):
+            tokens = count_tokens(piece)
+            if pieces:
+                previous, previous_tokens = pieces[-1]
+                small = min(previous_tokens, tokens) < self.min_tokens
+                if small and previous_tokens + tokens <= self.piece_tokens:
+                    pieces[-1] = (previous + piece, previous_tokens + tokens)
+                    continue
+            pieces.append((piece, tokens))
+        return pieces
+
+    def _pieces(self, pages):
+        """Yields (page_number, page_label, heading, text, tokens) in reading order"""
+        for page_number, page_label, page_text in pages:
+            if not page_text.strip():
+                continue
+            for heading, block in split_blocks(page_text):
+                tokens = count_tokens(block)
+                if tokens <= self.piece_tokens:
+                    yield page_number, page_label, heading, block, tokens
+                    continue
+                for i, (piece, piece_tokens) in enumerate(self._split(block, tokens)):
+                    yield page_number, page_label, heading if i == 0 else None, piece, piece_tokens
+
+    def chunk_pages(self, pages):
+        """Chunks a stream of (page_number, page_label, text) pages.
+
+        Yields (text, metadata); metadata has ``chunk`` (position in the
+        document), ``section`` (the heading in force), and ``page_label`` /
+        ``pages`` when the pages are labelled.
+        """
+        parts, labels, numbers = [], [], []
+        size = carried = 0
+        section = None  # heading in force at the start of the current chunk
+        current_section = None  # heading in force at the current position
+        index = 0
+
+        def flush():
+            metadata = {"chunk": index, "section": section}
+            if labels:
+                label = labels[0] if labels[0] == labels[-1] else f"{labels[0]}-{labels[-1]}"
+                metadata.update({"page_label": label, "pages": list(numbers)})
+            return "".join(parts).strip(), metadata
+
+        for page_number, page_label, heading, text, tokens in self._pieces(pages):
+            new_unit = heading is not None and size - carried >= self.min_tokens
+            if size > carried and (new_unit or size + tokens > self.chunk_tokens):
+                chunk, metadata = flush()
+                yield chunk, metadata
+                index += 1
+                # A new section starts clean; otherwise carry an overlap tail
+                tail = "" if heading is not None else token_tail(chunk, self.overlap_tokens)
+                if tail:
+                    parts = [tail + "\n"]
+                    labels, numbers = labels[-1:], numbers[-1:]
+                else:
+                    parts, labels, numbers = [], [], []
+                size = carried = count_tokens(tail)
+                section = current_section
+
+            if heading is not None:
+                current_section = heading
+                if size == carried:
+                    section = heading
+            if section is None:
+                section = current_section
+            parts.append(text)
+            size += tokens
+            if page_label is not None and (not numbers or numbers[-1] != page_number):
+                labels.append(page_label)
+                numbers.append(page_number)
+
+        if size > carried:
+            yield flush()
+
+    def chunk_text(self, text):
+        """Chunks an unpaginated text (e.g. a web page)"""
+        return list(self.chunk_pages([(None, None, text)]))
+
+
+def pack_documents(docs, budget_tokens=None):
+    """Packs retrieved documents into a prompt context of at most ``budget_tokens``.
+
+    ``docs`` are in relevance order. Exact and contained duplicates are
+    dropped, chunks are taken greedily while they fit (the first one is
+    truncated if it alone exceeds the budget, so legacy 100k-character chunks
+    stay bounded), and the chosen chunks are put back in document order with
+    adjacent ones merged so their shared overlap is sent once.
+    """
+    budget_tokens = budget_tokens or Config.CONTEXT_TOKEN_BUDGET
+    chosen, seen, remaining = [], set(), budget_tokens
+    for doc in docs:
+        text = doc.page_content.strip()
+        normalized = " ".join(text.split())
+        if not normalized or normalized in seen:
+            continue
+        if any(normalized in other for other in seen):
+            continue
+        tokens = count_tokens(text)
+        if tokens > remaining:
+            if chosen:
+                continue
+            text = truncate_tokens(text, remaining)
+            tokens = remaining
+        seen.add(normalized)
+        chosen.append(Document(page_content=text, metadata=dict(doc.metadata)))
+        remaining -= tokens
+        if remaining <= 0:
+            break
+
+    if not all("chunk" in doc.metadata for doc in chosen):
+        return chosen
+
+    # Chunk numbers restart in every source of a multi-source document
+    chosen.sort(key=lambda doc: (doc.metadata.get("source_id") or "", doc.metadata["chunk"]))
+    merged = []
+    for doc in chosen:
+        previous = merged[-1] if merged else None
+        if (
+            previous
+            and doc.metadata.get("source_id") == previous.metadata.get("source_id")
+            and doc.metadata["chunk"] == previous.metadata["last_chunk"] + 1
+        ):
+            previous.page_content = _join_overlapping(previous.page_content, doc.page_content)
+            previous.metadata["last_chunk"] = doc.metadata["chunk"]
+            _merge_pages(previous.metadata, doc.metadata)
+        else:
+            doc.metadata["last_chunk"] = doc.metadata["chunk"]
+            merged.append(doc)
+    for doc in merged:
+        doc.metadata.pop("last_chunk")
+    return merged
+
+
+def _join_overlapping(first, second):
+    """Concatenates two consecutive chunks, sending their overlap once"""
+    # The overlap is at most CHUNK_OVERLAP_TOKENS; ~20 characters per token is generous
+    limit = min(len(first), len(second), Config.CHUNK_OVERLAP_TOKENS * 20)
+    for size in range(limit, 0, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+
+def _merge_pages(metadata, other):
+    if "pages" not in metadata or "pages" not in other:
+        return
+    numbers = sorted(set(metadata["pages"]) | set(other["pages"]))
+    first, last = metadata["page_label"].split("-")[0], other["page_label"].split("-")[-1]
+    metadata["pages"] = numbers
+    metadata["page_label"] = first if first == last else f"{first}-{last}"
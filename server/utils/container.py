@@ -0,0 +1,97 @@
+import os
+import threading
+from utils.database import (
+    MongoDBManager,
+    URLDBManager,
+    QAHistoryManager,
+    UnifiedDBManager,
+    create_mongo_client,
+)
+
+
+class Container:
+    """Process-wide shared clients, injected into the flask-restful resources.
+
+    flask-restful builds a new Resource per request, so anything expensive
+    (Mongo connection pool, Gemini client, embeddings, processors) is built
+    once here and handed to every resource instance. Everything is created
+    lazily and rebuilt after a fork, since MongoClient is not fork-safe.
+    """
+
+    def __init__(self):
+        self._instances = {}
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+
+    def _get(self, name, factory):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._instances = {}
+                self._pid = os.getpid()
+            if name not in self._instances:
+                self._instances[name] = factory()
+            return self._instances[name]
+
+    def override(self, name, instance):
+        """Replaces a shared instance, e.g. with fakes for offline benchmarks"""
+        with self._lock:
+            self._instances[name] = instance
+
+    @property
+    def mongo_client(self):
+        return self._get("mongo_client", create_mongo_client)
+
+    @property
+    def chat_db(self):
+        return self._get("chat_db", lambda: MongoDBManager(self.mongo_client))
+
+    @property
+    def url_db(self):
+        return self._get("url_db", lambda: URLDBManager(self.mongo_client))
+
+    @property
+    def qa_db(self):
+        return self._get("qa_db", lambda: QAHistoryManager(self.mongo_client))
+
+    @property
+    def feed_db(self):
+        return self._get("feed_db", lambda: UnifiedDBManager(self.mongo_client))
+
+    @property
+    def chat_llm(self):
+        """Gemini chat model used for document Q&A and metadata (thread-safe)"""
+
+        def create():
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            from utils.admission import llm_call_limiter
+            from utils.metrics import llm_metrics
+
+            # The limiter goes first: a call it rejects never starts its metrics run
+            return ChatGoogleGenerativeAI(
+                model="gemini-2.0-flash",
+                temperature=0.3,
+                callbacks=[llm_call_limiter, llm_metrics],
+            )
+
+        return self._get("chat_llm", create)
+
+    @property
+    def embeddings(self):
+        from utils.embedding_cache import get_embeddings
+
+        return self._get("embeddings", get_embeddings)
+
+    @property
+    def pdf_processor(self):
+        from utils.pdf_processor import PDFProcessor
+
+        return self._get("pdf_processor", PDFProcessor)
+
+    @property
+    def url_processor(self):
+        from utils.url_processor import URLProcessor
+
+        return self._get("url_processor", URLProcessor)
+
+
+container = Container()
@@ -0,0 +1,322 @@
+import re
+import queue
+import asyncio
+import hashlib
+import threading
+import posixpath
+import traceback
+from contextlib import aclosing
+from urllib import robotparser
+from urllib.parse import urljoin, urlsplit
+import aiohttp
+from bs4 import BeautifulSoup
+from config import Config
+from utils.url_content_cache import normalize_url
+
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+
+# Page furniture dropped before text extraction; links are collected first,
+# since navigation menus are how the other pages of a statute are found
+BOILERPLATE_TAGS = [
+    "script", "style", "noscript", "template", "iframe", "svg", "canvas",
+    "nav", "header", "footer", "aside", "form", "button", "select",
+]
+BOILERPLATE_ROLES = ["navigation", "banner", "contentinfo", "complementary", "search"]
+BOILERPLATE_NAMES = re.compile(
+    r"(^|[-_\s])(nav|navbar|menu|breadcrumbs?|footer|header|sidebar|cookies?|"
+    r"share|social|advert|ads|banner|skip|pagination)($|[-_\s])",
+    re.IGNORECASE,
+)
+MAIN_SELECTORS = ["main", "article", "[role=main]", "#content", "#main-content"]
+
+
+def scope_prefix(url):
+    """Path prefix a crawl stays under: the start page's directory, or the
+    start URL itself when its last segment has no extension ("/acts/ipc")
+    """
+    path = urlsplit(url.strip()).path or "/"
+    last = path.rsplit("/", 1)[-1]
+    if "." in last:
+        path = posixpath.dirname(path)
+    return path.rstrip("/") + "/"
+
+
+def extract_page(html, url, encoding=None):
+    """Title, main text, outgoing links and canonical URL of an HTML page
+    (``html`` may be bytes, decoded with ``encoding`` or the page's meta charset)
+    """
+    soup = BeautifulSoup(html, "html.parser", from_encoding=encoding)
+    base = soup.find("base", href=True)
+    base_url = urljoin(url, base["href"]) if base else url
+
+    links = []
+    for anchor in soup.find_all("a", href=True):
+        if "nofollow" in (anchor.get("rel") or []):
+            continue
+        links.append(urljoin(base_url, anchor["href"]))
+
+    canonical = None
+    for link in soup.find_all("link", href=True):
+        if "canonical" in (link.get("rel") or []):
+            canonical = urljoin(base_url, link["href"])
+            break
+
+    title = soup.title.get_text(strip=True) if soup.title else ""
+
+    for tag in soup.find_all(BOILERPLATE_TAGS):
+        tag.decompose()
+    for tag in soup.find_all(attrs={"role": BOILERPLATE_ROLES}):
+        tag.decompose()
+    for tag in soup.find_all(True):
+        if tag.decomposed:
+            continue
+        names = " ".join([tag.get("id") or ""] + list(tag.get("class") or []))
+        if names.strip() and BOILERPLATE_NAMES.search(names):
+            tag.decompose()
+
+    root = None
+    for selector in MAIN_SELECTORS:
+        root = soup.select_one(selector)
+        if root is not None:
+            break
+    root = root or soup.body or soup
+    lines = (line.strip() for line in root.get_text("\n").splitlines())
+    text = "\n".join(line for line in lines if line)
+    return {"title": title, "text": text, "links": links, "canonical": canonical}
+
+
+class SiteCrawler:
+    """Breadth-first asyncio crawl of the pages linked from a start URL.
+
+    Stays on the start URL's host and under its directory, up to
+    ``max_depth`` links away and ``max_pages`` pages. Fetches share one pooled
+    aiohttp connector (``concurrency`` connections, ``per_host`` per host),
+    robots.txt is honoured, including Crawl-delay, and pages are skipped when
+    their canonical URL or their extracted text was already seen. Pages are
+    yielded as soon as they are extracted, so callers can index the first
+    pages while the rest are still downloading.
+    """
+
+    def __init__(self, max_pages, max_depth, concurrency, per_host, timeout, user_agent,
+                 max_page_bytes):
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.max_page_bytes = max_page_bytes
+
+    async def crawl(self, start_url):
+        """Async generator of {"url", "title", "text", "depth", "content_hash"}"""
+        start = normalize_url(start_url)
+        host = urlsplit(start).netloc
+        prefix = scope_prefix(start_url)
+        frontier = asyncio.Queue()
+        results = asyncio.Queue()
+        seen_urls = {start}
+        visited = set()
+        seen_hashes = set()
+        robots = {}
+        host_slots = {}
+        state = {"pages": 0}
+
+        def in_scope(url):
+            parts = urlsplit(url)
+            return (
+                parts.scheme in ("http", "https")
+                and parts.netloc == host
+                and (parts.path + "/").startswith(prefix)
+            )
+
+        async def allowed(session, url):
+            parts = urlsplit(url)
+            origin = f"{parts.scheme}://{parts.netloc}"
+            if origin not in robots:
+                robots[origin] = asyncio.ensure_future(self._robots(session, origin))
+            rules = await robots[origin]
+            return rules.can_fetch(self.user_agent, url), rules.crawl_delay(self.user_agent)
+
+        async def fetch(session, url):
+            netloc = urlsplit(url).netloc
+            slot = host_slots.setdefault(netloc, asyncio.Semaphore(self.per_host))
+            permitted, delay = await allowed(session, url)
+            if not permitted:
+                return None
+            async with slot:
+                async with session.get(url) as response:
+                    content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+                    if response.status != 200 or content_type not in HTML_TYPES:
+                        return None
+                    if (response.content_length or 0) > self.max_page_bytes:
+                        return None
+                    body = await response.content.read(self.max_page_bytes + 1)
+                    if len(body) > self.max_page_bytes:
+                        return None
+                    final_url = str(response.url)
+                    encoding = response.charset
+                if delay:
+                    await asyncio.sleep(delay)
+            return final_url, body, encoding
+
+        async def visit(session, url, depth):
+            try:
+                fetched = await fetch(session, url)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Warning: Failed to crawl {url}: {e}")
+                return
+            if fetched is None:
+                return
+            final_url, body, encoding = fetched
+            # BeautifulSoup is CPU-bound; parsing off the loop keeps fetches flowing
+            page = await asyncio.to_thread(extract_page, body, final_url, encoding)
+
+            # Aliases of a page (redirects, rel=canonical, reordered queries) count once
+            canonical = normalize_url(final_url)
+            if page["canonical"] and urlsplit(page["canonical"]).netloc == urlsplit(final_url).netloc:
+                canonical = normalize_url(page["canonical"])
+            if canonical in visited:
+                return
+            visited.add(canonical)
+            content_hash = hashlib.sha256(page["text"].encode("utf-8")).hexdigest()
+            if not page["text"] or content_hash in seen_hashes:
+                return
+            if state["pages"] >= self.max_pages:
+                return
+            seen_hashes.add(content_hash)
+            state["pages"] += 1
+            await results.put(
+                {
+                    "url": canonical,
+                    "title": page["title"],
+                    "text": page["text"],
+                    "depth": depth,
+                    "content_hash": content_hash,
+                }
+            )
+
+            if depth >= self.max_depth:
+                return
+            for link in page["links"]:
+                link = normalize_url(link)
+                if link not in seen_urls and in_scope(link):
+                    seen_urls.add(link)
+                    frontier.put_nowait((link, depth + 1))
+
+        async def worker(session):
+            while True:
+                url, depth = await frontier.get()
+                try:
+                    if state["pages"] < self.max_pages:
+                        await visit(session, url, depth)
+                except Exception:
+                    print(f"Warning: Failed to crawl {url}:", traceback.format_exc())
+                finally:
+                    frontier.task_done()
+
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency, limit_per_host=self.per_host, ttl_dns_cache=300
+        )
+        async with aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={"User-Agent": self.user_agent},
+        ) as session:
+            frontier.put_nowait((start, 0))
+            workers = [asyncio.create_task(worker(session)) for _ in range(self.concurrency)]
+            finished = asyncio.create_task(frontier.join())
+            try:
+                while True:
+                    getter = asyncio.create_task(results.get())
+                    done, _ = await asyncio.wait(
+                        {getter, finished}, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if getter in done:
+                        yield getter.result()
+                        continue
+                    getter.cancel()
+                    while not results.empty():
+                        yield results.get_nowait()
+                    break
+            finally:
+                finished.cancel()
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                for task in robots.values():
+                    task.cancel()
+
+    async def _robots(self, session, origin):
+        """robots.txt rules of an origin; missing or unreadable files allow everything"""
+        rules = robotparser.RobotFileParser(origin + "/robots.txt")
+        try:
+            async with session.get(origin + "/robots.txt") as response:
+                if response.status in (401, 403):
+                    rules.disallow_all = True
+                elif response.status == 200:
+                    rules.parse((await response.text(errors="replace")).splitlines())
+                else:
+                    rules.allow_all = True
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            rules.allow_all = True
+        return rules
+
+    def pages(self, start_url):
+        """Synchronous iterator over ``crawl``, run on its own event-loop thread.
+
+        At most ``concurrency`` extracted pages wait for the consumer, so a slow
+        consumer (e.g. embedding) holds back the crawl instead of buffering
+        the whole site. Closing the iterator early cancels the crawl.
+        """
+        pages = queue.Queue(maxsize=self.concurrency)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        async def produce():
+            async with aclosing(self.crawl(start_url)) as crawl:
+                async for page in crawl:
+                    if not await asyncio.to_thread(put, page):
+                        break
+
+        def run():
+            try:
+                asyncio.run(produce())
+                put(done)
+            except BaseException as e:
+                put(e)
+
+        thread = threading.Thread(target=run, name="crawler", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = pages.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join()
+
+
+def get_crawler(max_pages=None, max_depth=None):
+    """A crawler with the configured limits; requests can only lower the caps"""
+    return SiteCrawler(
+        max_pages=min(max_pages or Config.CRAWL_MAX_PAGES, Config.CRAWL_MAX_PAGES),
+        max_depth=min(Config.CRAWL_MAX_DEPTH if max_depth is None else max_depth, Config.CRAWL_MAX_DEPTH),
+        concurrency=Config.CRAWL_CONCURRENCY,
+        per_host=Config.CRAWL_PER_HOST_CONCURRENCY,
+        timeout=Config.URL_FETCH_TIMEOUT,
+        user_agent=Config.CRAWL_USER_AGENT,
+        max_page_bytes=Config.CRAWL_MAX_PAGE_BYTES,
+    )
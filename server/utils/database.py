@@ -1,5 +1,10 @@
-from pymongo import MongoClient
-from datetime import datetime
+from pymongo import MongoClient, ReturnDocument, ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import OperationFailure
+from bson import ObjectId
+from bson.errors import InvalidId
+import base64
+import heapq
+from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import os
 from dotenv import load_dotenv
@@ -7,28 +12,92 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def create_mongo_client():
+    """Pooled MongoClient configured from Config; one per process is enough"""
+    from config import Config
+    from utils.metrics import MongoCommandTimer
+
+    return MongoClient(
+        os.getenv("MONGO_URI"),
+        maxPoolSize=Config.MONGO_MAX_POOL_SIZE,
+        minPoolSize=Config.MONGO_MIN_POOL_SIZE,
+        serverSelectionTimeoutMS=Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=Config.MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=Config.MONGO_SOCKET_TIMEOUT_MS,
+        waitQueueTimeoutMS=Config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        event_listeners=[MongoCommandTimer()],
+    )
+
+
+# Sidebar listings, newest activity first; _id breaks ties so keyset pages
+# never skip or repeat records
+LISTING_SORT = [("last_activity", DESCENDING), ("_id", DESCENDING)]
+CHAT_LISTING_FIELDS = {"chat_id": 1, "name": 1, "description": 1, "keywords": 1, "last_activity": 1}
+URL_LISTING_FIELDS = {"url_id": 1, "name": 1, "description": 1, "last_activity": 1, "url": 1}
+
+
+def encode_listing_cursor(record):
+    """Opaque cursor of a listing record: its (last_activity, _id) sort key"""
+    last_activity = record.get("last_activity")
+    raw = f"{last_activity.isoformat() if last_activity else ''}|{record['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def listing_filter(before):
+    """Query matching the records after cursor ``before`` in LISTING_SORT order.
+    Records without last_activity sort last. Raises ValueError for a bad cursor.
+    """
+    if not before:
+        return {}
+    try:
+        last_activity, oid = base64.urlsafe_b64decode(before.encode()).decode().split("|")
+        oid = ObjectId(oid)
+        last_activity = datetime.fromisoformat(last_activity) if last_activity else None
+    except (ValueError, InvalidId) as e:
+        raise ValueError("Invalid cursor") from e
+    if last_activity is None:
+        return {"last_activity": None, "_id": {"$lt": oid}}
+    return {
+        "$or": [
+            {"last_activity": {"$lt": last_activity}},
+            {"last_activity": last_activity, "_id": {"$lt": oid}},
+            {"last_activity": None},
+        ]
+    }
+
+
+def listing_page(collection, fields, limit, before=None):
+    """(records, next_cursor) of one listing page, served by the LISTING_SORT index"""
+    records = list(
+        collection.find(listing_filter(before), fields).sort(LISTING_SORT).limit(limit + 1)
+    )
+    return _finish_page(records, limit)
+
+
+def _finish_page(records, limit):
+    next_cursor = encode_listing_cursor(records[limit - 1]) if len(records) > limit else None
+    records = records[:limit]
+    for record in records:
+        record.pop("_id", None)
+    return records, next_cursor
+
+
 class MongoDBManager:
-    """EXISTING CLASS - DO NOT MODIFY (Production)"""
+    """Chats of uploaded PDFs (the ``chats`` collection)"""
 
-    def __init__(self):
-        self.client = MongoClient(os.getenv("MONGO_URI"))
+    def __init__(self, client=None):
+        self.client = client or create_mongo_client()
         self.db = self.client.get_database("chat_db")
         self.chats_collection = self.db["chats"]
 
-    def get_all_chat_records(self):
-        """Retrieve all chat records with selected fields, sorted by last_activity descending"""
-        chats = self.chats_collection.find(
-            {},
-            {
-                "_id": 0,
-                "chat_id": 1,
-                "name": 1,
-                "description": 1,
-                "keywords": 1,
-                "last_activity": 1,
-            },
-        ).sort("last_activity", -1)
-        return list(chats)
+    def ensure_indexes(self):
+        """Create the lookup and listing indexes for the chats collection"""
+        self.chats_collection.create_index([("chat_id", ASCENDING)])
+        self.chats_collection.create_index(LISTING_SORT)
+
+    def get_chat_records_page(self, limit=50, before=None):
+        """Return (chat records newest-first, next_cursor) for the page after ``before``"""
+        return listing_page(self.chats_collection, CHAT_LISTING_FIELDS, limit, before)
 
     def get_chat_title(self, chat_id):
         """Retrieve only the chat title (name) by chat_id"""
@@ -41,8 +110,8 @@ class MongoDBManager:
         return self.chats_collection.insert_one(chat_data)
 
     def get_chat_record(self, chat_id):
-        """Retrieve a chat record by chat_id"""
-        return self.chats_collection.find_one({"chat_id": chat_id})
+        """Retrieve a chat record (header only, without the legacy questions array) by chat_id"""
+        return self.chats_collection.find_one({"chat_id": chat_id}, {"questions": 0})
 
     def update_chat_record(self, chat_id, update_data):
         """Update an existing chat record"""
@@ -53,31 +122,77 @@ class MongoDBManager:
         result = self.chats_collection.delete_one({"chat_id": chat_id})
         return result.deleted_count  # returns 1 if deleted, 0 if not found
 
+    def get_answer_state(self, chat_id):
+        """(ingestion status, version of the cached answers) of a chat, or None
+        when the chat does not exist
+        """
+        record = self.chats_collection.find_one(
+            {"chat_id": chat_id},
+            {"_id": 0, "status": 1, "ingested_at": 1, "sources_changed_at": 1},
+        )
+        if record is None:
+            return None
+        version = record.get("ingested_at"), record.get("sources_changed_at")
+        return record.get("status", "processed"), version
+
+    def get_index_activity(self):
+        """{chat_id: {"last_activity", "status"}} of every chat, for index storage sweeps"""
+        records = self.chats_collection.find({}, {"_id": 0, "chat_id": 1, "last_activity": 1, "status": 1})
+        return {record["chat_id"]: record for record in records if record.get("chat_id")}
+
+    def update_job(self, chat_id, update_data):
+        """Update the ingestion job fields of a chat record"""
+        return self.update_chat_record(chat_id, update_data)
+
+    def get_job(self, chat_id):
+        """Retrieve the chat record an ingestion job works on"""
+        return self.get_chat_record(chat_id)
+
+    def get_job_status(self, chat_id):
+        """Retrieve only the ingestion status fields of a chat record"""
+        return self.chats_collection.find_one(
+            {"chat_id": chat_id},
+            {"_id": 0, "chat_id": 1, "status": 1, "progress": 1, "error": 1},
+        )
+
+    def claim_stale_jobs(self, statuses, stale_before, owner):
+        """Atomically claim unfinished jobs whose heartbeat is older than stale_before"""
+        while True:
+            record = self.chats_collection.find_one_and_update(
+                {
+                    "status": {"$in": statuses},
+                    "$or": [
+                        {"job.heartbeat": {"$lt": stale_before}},
+                        {"job.heartbeat": {"$exists": False}},
+                    ],
+                },
+                {"$set": {"job.owner": owner, "job.heartbeat": datetime.utcnow()}},
+                projection={"_id": 0, "chat_id": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+            if record is None:
+                return
+            yield record["chat_id"]
+
 
 class URLDBManager:
     """NEW CLASS - For URL documents (Mirrors ChatDB structure but separate collection)"""
 
-    def __init__(self):
-        self.client = MongoClient(os.getenv("MONGO_URI"))
+    def __init__(self, client=None):
+        self.client = client or create_mongo_client()
         self.db = self.client.get_database(
             "chat_db"
         )  # Same DB but different collection
         self.urls_collection = self.db["url_chats"]  # Separate collection for URLs
 
-    def get_all_url_records(self):
-        """Mirror of get_all_chat_records but for URLs"""
-        urls = self.urls_collection.find(
-            {},
-            {
-                "_id": 0,
-                "url_id": 1,  # Keeping same field name for compatibility
-                "name": 1,
-                "description": 1,
-                "last_activity": 1,
-                "url": 1,  # Additional URL-specific field
-            },
-        ).sort("last_activity", -1)
-        return list(urls)
+    def ensure_indexes(self):
+        """Create the lookup and listing indexes for the url_chats collection"""
+        self.urls_collection.create_index([("url_id", ASCENDING)])
+        self.urls_collection.create_index(LISTING_SORT)
+
+    def get_url_records_page(self, limit=50, before=None):
+        """Mirror of get_chat_records_page but for URLs"""
+        return listing_page(self.urls_collection, URL_LISTING_FIELDS, limit, before)
 
     def get_url_title(self, url_id):
         """Mirror of get_chat_title but for URLs"""
@@ -91,7 +206,7 @@ class URLDBManager:
 
     def get_url_record(self, url_id):
         """Mirror of get_chat_record but for URLs"""
-        return self.urls_collection.find_one({"url_id": url_id})
+        return self.urls_collection.find_one({"url_id": url_id}, {"questions": 0})
 
     def update_url_record(self, url_id, update_data):
         """Mirror of update_chat_record but for URLs"""
@@ -99,17 +214,11 @@ class URLDBManager:
 
     def add_url_question_answer(self, url_id, question, answer):
         """Special method for URL Q&A (matches chat pattern)"""
-        qa_record = {
-            "question": question,
-            "answer": answer,
-            "timestamp": datetime.utcnow(),
-        }
+        from utils.container import container
+
+        container.qa_db.add_question("url", url_id, question, answer)
         return self.urls_collection.update_one(
-            {"url_id": url_id},
-            {
-                "$push": {"questions": qa_record},
-                "$set": {"last_activity": datetime.utcnow()},
-            },
+            {"url_id": url_id}, {"$set": {"last_activity": datetime.utcnow()}}
         )
 
     def delete_url_record(self, url_id):
@@ -117,16 +226,281 @@ class URLDBManager:
         result = self.urls_collection.delete_one({"url_id": url_id})
         return result.deleted_count  # returns 1 if deleted, 0 if not found
 
+    def get_answer_state(self, url_id):
+        """Mirror of get_answer_state but for URLs"""
+        record = self.urls_collection.find_one(
+            {"url_id": url_id},
+            {"_id": 0, "status": 1, "ingested_at": 1, "sources_changed_at": 1},
+        )
+        if record is None:
+            return None
+        version = record.get("ingested_at"), record.get("sources_changed_at")
+        return record.get("status", "processed"), version
+
+    def get_index_activity(self):
+        """Mirror of get_index_activity but for URLs"""
+        records = self.urls_collection.find({}, {"_id": 0, "url_id": 1, "last_activity": 1, "status": 1})
+        return {record["url_id"]: record for record in records if record.get("url_id")}
+
+    def update_job(self, url_id, update_data):
+        """Update the ingestion job fields of a URL record"""
+        return self.update_url_record(url_id, update_data)
+
+    def get_job(self, url_id):
+        """Retrieve the URL record an ingestion job works on"""
+        return self.get_url_record(url_id)
+
+    def get_job_status(self, url_id):
+        """Retrieve only the ingestion status fields of a URL record"""
+        return self.urls_collection.find_one(
+            {"url_id": url_id},
+            {"_id": 0, "url_id": 1, "status": 1, "progress": 1, "error": 1, "pages_indexed": 1},
+        )
+
+    def claim_stale_jobs(self, statuses, stale_before, owner):
+        """Atomically claim unfinished jobs whose heartbeat is older than stale_before"""
+        while True:
+            record = self.urls_collection.find_one_and_update(
+                {
+                    "status": {"$in": statuses},
+                    "$or": [
+                        {"job.heartbeat": {"$lt": stale_before}},
+                        {"job.heartbeat": {"$exists": False}},
+                    ],
+                },
+                {"$set": {"job.owner": owner, "job.heartbeat": datetime.utcnow()}},
+                projection={"_id": 0, "url_id": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+            if record is None:
+                return
+            yield record["url_id"]
+
+
+class QAHistoryManager:
+    """Q&A history of chats and URL chats, one document per question.
+
+    Replaces the unbounded ``questions`` array embedded in chat / url_chat
+    records. Pages are read newest-first with an opaque keyset cursor over
+    (timestamp, _id), backed by the (doc_id, timestamp) index.
+    """
+
+    def __init__(self, client=None):
+        self.client = client or create_mongo_client()
+        self.db = self.client.get_database("chat_db")
+        self.qa_collection = self.db["qa_history"]
+
+    def ensure_indexes(self):
+        """Create the (doc_id, timestamp) index used for paginated history"""
+        self.qa_collection.create_index(
+            [("doc_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]
+        )
+
+    @staticmethod
+    def _qa_record(doc_type, doc_id, question, answer, timestamp, source_ids):
+        record = {
+            "doc_type": doc_type,
+            "doc_id": doc_id,
+            "question": question,
+            "answer": answer,
+            "timestamp": timestamp,
+        }
+        if source_ids is not None:
+            # Answered from some of the document's sources only
+            record["source_ids"] = list(source_ids)
+        return record
+
+    def add_question(self, doc_type, doc_id, question, answer, timestamp=None, source_ids=None):
+        """Insert one Q&A record for a chat ('pdf') or URL chat ('url').
+
+        ``source_ids`` records a question that was limited to those sources.
+        """
+        return self.qa_collection.insert_one(
+            self._qa_record(
+                doc_type, doc_id, question, answer, timestamp or datetime.utcnow(), source_ids
+            )
+        )
+
+    def add_questions(self, doc_type, doc_id, pairs, timestamp=None, source_ids=None):
+        """Insert many (question, answer) records of one document in a single write.
+
+        Timestamps step by a millisecond (Mongo's precision) so history keeps
+        the order of ``pairs``.
+        """
+        if not pairs:
+            return None
+        timestamp = timestamp or datetime.utcnow()
+        return self.qa_collection.insert_many(
+            [
+                self._qa_record(
+                    doc_type, doc_id, question, answer,
+                    timestamp + timedelta(milliseconds=i), source_ids,
+                )
+                for i, (question, answer) in enumerate(pairs)
+            ],
+            ordered=False,
+        )
+
+    @staticmethod
+    def encode_cursor(record):
+        raw = f"{record['timestamp'].isoformat()}|{record['_id']}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            timestamp, oid = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            return datetime.fromisoformat(timestamp), ObjectId(oid)
+        except (ValueError, InvalidId) as e:
+            raise ValueError("Invalid cursor") from e
+
+    def get_questions_page(self, doc_id, limit=50, before=None, since=None, whole_document=False):
+        """Return (questions oldest-first, next_cursor) for the page ending at ``before``.
+
+        ``next_cursor`` points at older questions and is None on the last page.
+        With ``since``, only questions asked after that time are returned; with
+        ``whole_document``, only those not limited to some of its sources.
+        """
+        query = {"doc_id": doc_id}
+        if since:
+            query["timestamp"] = {"$gt": since}
+        if whole_document:
+            query["source_ids"] = {"$exists": False}
+        if before:
+            timestamp, oid = self.decode_cursor(before)
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": oid}},
+            ]
+        records = list(
+            self.qa_collection.find(query, {"doc_id": 0, "doc_type": 0})
+            .sort([("timestamp", DESCENDING), ("_id", DESCENDING)])
+            .limit(limit + 1)
+        )
+        next_cursor = self.encode_cursor(records[limit - 1]) if len(records) > limit else None
+        records = records[:limit]
+        records.reverse()
+        for record in records:
+            record.pop("_id", None)
+        return records, next_cursor
+
+    def get_recent_questions(self, doc_id, limit, since=None):
+        """The newest ``limit`` Q&A records of a document (asked after ``since``),
+        oldest-first, for seeding the answer cache. Questions limited to some
+        of the document's sources are left out: their answers do not hold for
+        the whole document.
+        """
+        return self.get_questions_page(doc_id, limit=limit, since=since, whole_document=True)[0]
+
+    def delete_questions(self, doc_id):
+        """Delete all Q&A records of a document"""
+        return self.qa_collection.delete_many({"doc_id": doc_id}).deleted_count
+
+    def migrate_embedded_questions(self, collection, id_field, doc_type):
+        """One-shot move of embedded ``questions`` arrays into this collection.
+
+        Idempotent: records are upserted on (doc_id, timestamp, question) and the
+        array is only removed once its records are written. Questions saved
+        without a timestamp get their record's creation time, since history
+        pages are keyed on it.
+        """
+        migrated = 0
+        for record in collection.find(
+            {"questions.0": {"$exists": True}}, {id_field: 1, "questions": 1}
+        ):
+            doc_id = record[id_field]
+            created = record["_id"].generation_time.replace(tzinfo=None)
+            operations = [
+                UpdateOne(
+                    {
+                        "doc_id": doc_id,
+                        "timestamp": qa.get("timestamp") or created,
+                        "question": qa.get("question"),
+                    },
+                    {
+                        "$setOnInsert": {
+                            "doc_type": doc_type,
+                            "answer": qa.get("answer"),
+                        }
+                    },
+                    upsert=True,
+                )
+                for qa in record["questions"]
+            ]
+            self.qa_collection.bulk_write(operations, ordered=False)
+            collection.update_one({"_id": record["_id"]}, {"$unset": {"questions": ""}})
+            migrated += len(operations)
+        return migrated
+
 
 class UnifiedDBManager:
-    """Optional unified interface that works with both"""
+    """Optional unified interface that works with both.
+
+    The merged feed of chats and URL chats is built in Mongo: each collection
+    contributes at most one page through its (last_activity, _id) index and
+    $unionWith merges them, so a page costs the same however many records
+    exist. Items carry "type" ("pdf" or "url").
+    """
+
+    def __init__(self, client=None):
+        client = client or create_mongo_client()
+        self.chat_db = MongoDBManager(client)
+        self.url_db = URLDBManager(client)
+
+    def _branch(self, doc_type, fields, match, limit):
+        stages = [{"$match": match}, {"$sort": dict(LISTING_SORT)}]
+        if limit is not None:
+            stages.append({"$limit": limit})
+        stages.append({"$project": {**fields, "type": {"$literal": doc_type}}})
+        return stages
+
+    def _feed(self, limit=None, before=None):
+        match = listing_filter(before)
+        pipeline = self._branch("pdf", CHAT_LISTING_FIELDS, match, limit)
+        pipeline.append(
+            {
+                "$unionWith": {
+                    "coll": self.url_db.urls_collection.name,
+                    "pipeline": self._branch("url", URL_LISTING_FIELDS, match, limit),
+                }
+            }
+        )
+        pipeline.append({"$sort": dict(LISTING_SORT)})
+        if limit is not None:
+            pipeline.append({"$limit": limit})
+        try:
+            return list(self.chat_db.chats_collection.aggregate(pipeline))
+        except (OperationFailure, NotImplementedError):
+            # Servers before MongoDB 4.4 (and mongomock) have no $unionWith:
+            # merge the two index-ordered pages here instead
+            return self._merged_feed(match, limit)
+
+    def _merged_feed(self, match, limit):
+        pages = []
+        for collection, fields, doc_type in (
+            (self.chat_db.chats_collection, CHAT_LISTING_FIELDS, "pdf"),
+            (self.url_db.urls_collection, URL_LISTING_FIELDS, "url"),
+        ):
+            cursor = collection.find(match, fields).sort(LISTING_SORT)
+            if limit is not None:
+                cursor = cursor.limit(limit)
+            pages.append([{**record, "type": doc_type} for record in cursor])
+
+        def key(record):
+            # Descending (last_activity, _id), records without last_activity last
+            last_activity = record.get("last_activity")
+            return (last_activity is not None, last_activity or datetime.min, record["_id"])
+
+        merged = heapq.merge(*pages, key=key, reverse=True)
+        return list(merged)[:limit] if limit is not None else list(merged)
 
-    def __init__(self):
-        self.chat_db = MongoDBManager()
-        self.url_db = URLDBManager()
+    def get_feed_page(self, limit=50, before=None):
+        """Return (chats and URL chats newest-first, next_cursor) after ``before``"""
+        return _finish_page(self._feed(limit + 1, before), limit)
 
     def get_all_records(self):
         """Combine both chat and URL records"""
-        chats = self.chat_db.get_all_chat_records()
-        urls = self.url_db.get_all_url_records()
-        return sorted(chats + urls, key=lambda x: x["last_activity"], reverse=True)
+        records = self._feed()
+        for record in records:
+            record.pop("_id", None)
+        return records
@@ -0,0 +1,319 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from config import Config
+from utils.embedding_providers import create_embeddings, embed_query_batch
+from utils.metrics import EMBEDDED_TEXTS
+
+
+class EmbeddingStore:
+    """Compact on-disk store of float32 vectors keyed by (model, sha256(text)).
+
+    Backed by SQLite in WAL mode so several gunicorn workers can read and
+    write it at once; each thread keeps its own connection. Chunk embeddings
+    are kept for good; query embeddings, one per question ever asked, live in
+    their own table bounded to ``max_queries`` entries and ``query_ttl``
+    seconds since last use.
+    """
+
+    # Pruning the query table every this many query writes (per process)
+    PRUNE_EVERY = 200
+
+    def __init__(self, path, max_queries=None, query_ttl=None):
+        self.path = path
+        self.max_queries = max_queries
+        self.query_ttl = query_ttl
+        self._local = threading.local()
+        self._query_writes = 0
+        self._prune_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, hash BLOB NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, hash)) WITHOUT ROWID"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT NOT NULL, hash BLOB NOT NULL, vector BLOB NOT NULL, "
+                "used_at REAL NOT NULL, PRIMARY KEY (model, hash)) WITHOUT ROWID"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS query_embeddings_used_at ON query_embeddings (used_at)"
+            )
+            # Query vectors used to be stored with the chunks, without a bound
+            conn.execute("DELETE FROM embeddings WHERE model LIKE '%:query'")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, model, hashes):
+        """Returns {hash: vector} for the hashes present in the store"""
+        found = {}
+        conn = self._connect()
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(hashes), 500):
+            batch = hashes[i : i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                [model, *batch],
+            )
+            for digest, vector in rows:
+                found[digest] = np.frombuffer(vector, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model, items):
+        """Stores [(hash, vector)]"""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [
+                    (model, digest, np.asarray(vector, dtype=np.float32).tobytes())
+                    for digest, vector in items
+                ],
+            )
+
+    def get_queries(self, model, hashes):
+        """get_many for query embeddings; marks the ones found as just used"""
+        now = time.time()
+        min_used_at = now - self.query_ttl if self.query_ttl else 0
+        found = {}
+        conn = self._connect()
+        for i in range(0, len(hashes), 500):
+            batch = hashes[i : i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT hash, vector FROM query_embeddings "
+                f"WHERE model = ? AND used_at >= ? AND hash IN ({placeholders})",
+                [model, min_used_at, *batch],
+            )
+            for digest, vector in rows:
+                found[digest] = np.frombuffer(vector, dtype=np.float32).tolist()
+        if found:
+            with conn:
+                # Only rows not touched in the last minute, to keep hits mostly read-only
+                conn.executemany(
+                    "UPDATE query_embeddings SET used_at = ? "
+                    "WHERE model = ? AND hash = ? AND used_at < ?",
+                    [(now, model, digest, now - 60) for digest in found],
+                )
+        return found
+
+    def put_queries(self, model, items):
+        """Stores [(hash, vector)] query embeddings, pruning the table now and then"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO query_embeddings (model, hash, vector, used_at) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (model, digest, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                    for digest, vector in items
+                ],
+            )
+        with self._prune_lock:
+            self._query_writes += len(items)
+            if self._query_writes < self.PRUNE_EVERY:
+                return
+            self._query_writes = 0
+        self.prune_queries()
+
+    def prune_queries(self):
+        """Drops expired query embeddings, then the least recently used past max_queries"""
+        with self._connect() as conn:
+            if self.query_ttl:
+                conn.execute(
+                    "DELETE FROM query_embeddings WHERE used_at < ?",
+                    (time.time() - self.query_ttl,),
+                )
+            if self.max_queries:
+                conn.execute(
+                    "DELETE FROM query_embeddings WHERE used_at < ("
+                    "SELECT used_at FROM query_embeddings ORDER BY used_at DESC LIMIT 1 OFFSET ?)",
+                    (self.max_queries - 1,),
+                )
+
+    def query_count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends cache misses to the underlying model.
+
+    Misses are embedded in batches of ``batch_size`` texts, ``concurrency``
+    batches at a time, each retried with exponential backoff. Documents and
+    queries are cached under separate keys because the remote model embeds
+    them with different task types.
+    """
+
+    def __init__(self, embeddings, model_name, store, batch_size, concurrency, max_retries):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.store = store
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _hash(text):
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def _with_retry(self, fn, *args):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn(*args)
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                print("Embedding call failed, retrying:", traceback.format_exc())
+                time.sleep(0.5 * 2**attempt)
+
+    def _count(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        EMBEDDED_TEXTS.inc(hits, cache="hit")
+        EMBEDDED_TEXTS.inc(misses, cache="miss")
+
+    def embed_documents(self, texts):
+        model = f"{self.model_name}:document"
+        hashes = [self._hash(text) for text in texts]
+        cached = self.store.get_many(model, list(set(hashes)))
+
+        hit_count = sum(1 for digest in hashes if digest in cached)
+        self._count(hit_count, len(texts) - hit_count)
+
+        # Embed each distinct missing text once, even if it repeats in `texts`
+        missing = {}
+        for digest, text in zip(hashes, texts):
+            if digest not in cached:
+                missing.setdefault(digest, text)
+
+        if missing:
+            cached.update(
+                self._embed_missing(
+                    missing,
+                    self.embeddings.embed_documents,
+                    lambda result: self.store.put_many(model, result),
+                )
+            )
+
+        return [list(cached[digest]) for digest in hashes]
+
+    def _embed_missing(self, missing, embed, put):
+        """Embeds {digest: text} in batches of ``batch_size``, ``concurrency``
+        at a time, each retried; every batch is stored with ``put`` as it lands.
+        """
+        items = list(missing.items())
+        batches = [items[i : i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+
+        def embed_batch(batch):
+            vectors = self._with_retry(embed, [text for _, text in batch])
+            result = [(digest, vector) for (digest, _), vector in zip(batch, vectors)]
+            put(result)
+            return result
+
+        if len(batches) == 1:
+            return embed_batch(batches[0])
+        embedded = []
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for result in executor.map(embed_batch, batches):
+                embedded.extend(result)
+        return embedded
+
+    def embed_query(self, text):
+        model = f"{self.model_name}:query"
+        digest = self._hash(text)
+        cached = self.store.get_queries(model, [digest])
+        if digest in cached:
+            self._count(1, 0)
+            return cached[digest]
+        self._count(0, 1)
+        vector = self._with_retry(self.embeddings.embed_query, text)
+        self.store.put_queries(model, [(digest, vector)])
+        return vector
+
+    def embed_queries(self, texts):
+        """embed_query for many texts: cached ones from the store, the rest in
+        query-mode batch calls (one for up to ``batch_size`` texts)
+        """
+        model = f"{self.model_name}:query"
+        hashes = [self._hash(text) for text in texts]
+        cached = self.store.get_queries(model, list(set(hashes)))
+        hit_count = sum(1 for digest in hashes if digest in cached)
+        self._count(hit_count, len(texts) - hit_count)
+
+        missing = {}
+        for digest, text in zip(hashes, texts):
+            if digest not in cached:
+                missing.setdefault(digest, text)
+        if missing:
+            cached.update(
+                self._embed_missing(
+                    missing,
+                    lambda batch: embed_query_batch(self.embeddings, batch),
+                    lambda result: self.store.put_queries(model, result),
+                )
+            )
+
+        return [list(cached[digest]) for digest in hashes]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else None,
+                "query_entries": self.store.query_count(),
+            }
+
+
+_store = None
+_embeddings = None
+_init_lock = threading.Lock()
+
+
+def set_embeddings(embeddings):
+    """Replaces the process-wide client (used by the offline benchmarks)"""
+    global _embeddings
+    with _init_lock:
+        _embeddings = embeddings
+
+
+def get_embeddings():
+    """Process-wide cached embeddings client (EMBEDDING_MODEL) for ingestion and queries"""
+    global _store, _embeddings
+    with _init_lock:
+        if _embeddings is None:
+            _store = EmbeddingStore(
+                Config.EMBEDDING_CACHE_PATH,
+                max_queries=Config.EMBED_QUERY_CACHE_MAX_ENTRIES,
+                query_ttl=Config.EMBED_QUERY_CACHE_TTL,
+            )
+            _embeddings = CachedEmbeddings(
+                create_embeddings(Config.EMBEDDING_MODEL),
+                Config.EMBEDDING_MODEL,
+                _store,
+                batch_size=Config.EMBED_BATCH_SIZE,
+                concurrency=Config.EMBED_CONCURRENCY,
+                max_retries=Config.EMBED_MAX_RETRIES,
+            )
+        return _embeddings
@@ -0,0 +1,108 @@
+import os
+import json
+from langchain_core.embeddings import Embeddings
+from config import Config
+
+MODEL_ID_FILE = "embedding_model.json"
+
+# Indexes written before the model id was recorded were all built with this
+LEGACY_MODEL_ID = "google:models/embedding-001"
+
+
+class EmbeddingModelMismatch(ValueError):
+    """Raised when an index is loaded with a different embedding model than it was built with"""
+
+
+class LocalEmbeddings(Embeddings):
+    """sentence-transformers model run in-process on CPU.
+
+    Texts are encoded in batches of ``batch_size``; ``threads`` caps the torch
+    intra-op thread pool so ingestion does not starve request threads.
+    Vectors are L2-normalised, so inner product equals cosine similarity.
+    """
+
+    def __init__(self, model_name, batch_size, threads, device="cpu"):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_name, device=device)
+
+    def _encode(self, texts):
+        return self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+
+    def embed_documents(self, texts):
+        return self._encode(list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self._encode([text])[0].tolist()
+
+    def embed_queries(self, texts):
+        return self._encode(list(texts)).tolist()
+
+
+def create_embeddings(model_id):
+    """Builds the embeddings client for a ``provider:model`` id.
+
+    Supported providers are ``google`` (remote Gemini embeddings) and
+    ``local`` (sentence-transformers on CPU).
+    """
+    provider, _, model_name = model_id.partition(":")
+    if provider == "google":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        return GoogleGenerativeAIEmbeddings(model=model_name)
+    if provider == "local":
+        return LocalEmbeddings(
+            model_name,
+            batch_size=Config.LOCAL_EMBED_BATCH_SIZE,
+            threads=Config.LOCAL_EMBED_THREADS,
+        )
+    raise ValueError(f"Unknown embedding provider: {model_id}")
+
+
+def embed_query_batch(embeddings, texts):
+    """Embeds several queries with one call to the model where it allows it.
+
+    Gemini embeds a list in query mode through ``_embed`` (its public
+    embed_documents would use the document task type); clients without a
+    batch query call fall back to one embed_query per text.
+    """
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    if hasattr(embeddings, "_embed"):
+        return embeddings._embed(list(texts), task_type=embeddings.task_type or "retrieval_query")
+    return [embeddings.embed_query(text) for text in texts]
+
+
+def write_model_id(index_dir, model_id):
+    """Records which embedding model an index was built with"""
+    with open(os.path.join(index_dir, MODEL_ID_FILE), "w") as f:
+        json.dump({"embedding_model": model_id}, f)
+
+
+def read_model_id(index_dir, default=LEGACY_MODEL_ID):
+    path = os.path.join(index_dir, MODEL_ID_FILE)
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)["embedding_model"]
+
+
+def check_model_id(index_dir, model_id, default=LEGACY_MODEL_ID):
+    """Refuses to use an index built with a different embedding model"""
+    built_with = read_model_id(index_dir, default)
+    if built_with != model_id:
+        raise EmbeddingModelMismatch(
+            f"Index {index_dir} was built with {built_with}, "
+            f"but the server is configured for {model_id}; re-ingest the document"
+        )
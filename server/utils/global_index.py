@@ -0,0 +1,473 @@
+import os
+import json
+import zlib
+import fcntl
+import sqlite3
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+from config import Config
+from utils.vector_index import export_store
+from utils.embedding_providers import (
+    MODEL_ID_FILE,
+    EmbeddingModelMismatch,
+    read_model_id,
+    write_model_id,
+)
+
+# Shard files: "vectors" (float32 rows), "rows" (passage_id, doc_key int64
+# pairs), "deleted" (one uint8 tombstone per row) and "json" ({"dim"})
+SHARD_FILE = "shard_{}.{}"
+LEGACY_SHARD_FILE = "shard_{}.npz"
+PASSAGES_DB = "passages.sqlite"
+ROW_BYTES = 16
+# A shard is compacted once at least this many rows, and half of them, are deleted
+COMPACT_MIN_ROWS = 1024
+
+
+class GlobalIndex:
+    """One vector index over the passages of every PDF and URL document.
+
+    Passages are split across ``shards`` shards by document. A shard is a
+    set of append-only files read through mmap, like the per-document
+    stores in utils/vector_index.py: normalized float32 vectors, their
+    passage and document keys, and a tombstone per row. Text and
+    per-document attributes (type, name, keywords, date) live in SQLite.
+    Adding a document appends its rows and removing one marks them deleted,
+    so the cost of an ingestion does not grow with the corpus; a shard is
+    compacted once half of it is tombstones. A search scans the shards in
+    parallel without touching the per-document stores.
+
+    Writers hold the shard's file lock for the whole remove-and-insert, so
+    concurrent ingests of one document cannot duplicate it. Readers map a
+    consistent snapshot under a shared lock and re-map when the shard grew
+    or was compacted by any process; the pages live in the shared page
+    cache, not in each worker's heap.
+    """
+
+    def __init__(self, index_dir=None, shards=None):
+        self.index_dir = index_dir or Config.GLOBAL_INDEX_DIR
+        self.shards = shards or Config.GLOBAL_INDEX_SHARDS
+        self._loaded = {}  # shard -> (rows file signature, vectors, rows, deleted)
+        self._locks = [threading.Lock() for _ in range(self.shards)]
+        self._local = threading.local()
+        self._executor = None
+        self._init_lock = threading.Lock()
+        os.makedirs(self.index_dir, exist_ok=True)
+        with self._db() as conn:
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " doc_key INTEGER PRIMARY KEY, doc_id TEXT UNIQUE NOT NULL,"
+                " doc_type TEXT NOT NULL, name TEXT, keywords TEXT, created_at TEXT);"
+                "CREATE TABLE IF NOT EXISTS passages ("
+                " passage_id INTEGER PRIMARY KEY, doc_key INTEGER NOT NULL,"
+                " text TEXT NOT NULL, metadata TEXT);"
+                "CREATE INDEX IF NOT EXISTS passages_doc ON passages (doc_key);"
+                "CREATE INDEX IF NOT EXISTS documents_filter ON documents (doc_type, created_at);"
+            )
+
+    def _db(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.index_dir, PASSAGES_DB), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def shard_for(self, doc_id):
+        # Stable across processes, unlike hash()
+        return zlib.crc32(doc_id.encode("utf-8")) % self.shards
+
+    def _shard_path(self, shard, part):
+        return os.path.join(self.index_dir, SHARD_FILE.format(shard, part))
+
+    @contextmanager
+    def _file_lock(self, shard, mode):
+        with open(os.path.join(self.index_dir, f"shard_{shard}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _write_lock(self, shard):
+        with self._locks[shard]:
+            with self._file_lock(shard, fcntl.LOCK_EX):
+                self._migrate_legacy(shard)
+                yield
+
+    def _row_count(self, shard):
+        try:
+            return os.path.getsize(self._shard_path(shard, "rows")) // ROW_BYTES
+        except FileNotFoundError:
+            return 0
+
+    def _open_shard(self, shard, count):
+        """Maps the first ``count`` rows of a shard: (vectors, rows, deleted)"""
+        with open(self._shard_path(shard, "json")) as f:
+            dim = json.load(f)["dim"]
+        return (
+            np.memmap(self._shard_path(shard, "vectors"), np.float32, "r", shape=(count, dim)),
+            np.memmap(self._shard_path(shard, "rows"), np.int64, "r", shape=(count, 2)),
+            np.memmap(self._shard_path(shard, "deleted"), np.uint8, "r", shape=(count,)),
+        )
+
+    def _read_shard(self, shard):
+        """Returns (vectors, rows, deleted) mapped, re-mapping if the shard changed"""
+        try:
+            stat = os.stat(self._shard_path(shard, "rows"))
+        except FileNotFoundError:
+            if not os.path.exists(os.path.join(self.index_dir, LEGACY_SHARD_FILE.format(shard))):
+                return None
+            with self._write_lock(shard):
+                pass  # converts the shard written by an older version
+            return self._read_shard(shard)
+        signature = (stat.st_ino, stat.st_size)
+        loaded = self._loaded.get(shard)
+        if loaded and loaded[0] == signature:
+            return loaded[1:] if loaded[1] is not None else None
+        # Sizes are only consistent while no writer is appending or compacting
+        with self._file_lock(shard, fcntl.LOCK_SH):
+            stat = os.stat(self._shard_path(shard, "rows"))
+            count = stat.st_size // ROW_BYTES
+            arrays = self._open_shard(shard, count) if count else None
+        self._loaded[shard] = ((stat.st_ino, stat.st_size), *(arrays or (None,) * 3))
+        return arrays
+
+    def _append_rows(self, shard, vectors, passage_ids, doc_key):
+        """Appends rows to a shard; call with its write lock held"""
+        count = self._row_count(shard)
+        if not count:
+            with open(self._shard_path(shard, "json"), "w") as f:
+                json.dump({"dim": int(vectors.shape[1])}, f)
+        rows = np.column_stack(
+            [np.asarray(passage_ids, dtype=np.int64), np.full(len(passage_ids), doc_key, dtype=np.int64)]
+        )
+        # Trim whatever an interrupted append left past the last complete row;
+        # the rows file goes last, so readers never count a partial row
+        for part, data in (
+            ("vectors", np.ascontiguousarray(vectors, dtype=np.float32)),
+            ("deleted", np.zeros(len(rows), dtype=np.uint8)),
+            ("rows", rows),
+        ):
+            path = self._shard_path(shard, part)
+            with open(path, "ab") as f:
+                f.truncate(count * data[0].nbytes)
+                f.write(data.tobytes())
+
+    def _delete_rows(self, shard, doc_key):
+        """Tombstones a document's rows and compacts the shard once half of
+        it is deleted; call with its write lock held
+        """
+        count = self._row_count(shard)
+        if not count:
+            return
+        vectors, rows, deleted = self._open_shard(shard, count)
+        mask = np.array(deleted)
+        hits = np.flatnonzero(rows[:, 1] == doc_key)
+        if not len(hits):
+            return
+        # A document's rows were appended together, so one span covers them
+        first, last = int(hits[0]), int(hits[-1]) + 1
+        mask[hits] = 1
+        with open(self._shard_path(shard, "deleted"), "r+b") as f:
+            f.seek(first)
+            f.write(mask[first:last].tobytes())
+        dead = int(np.count_nonzero(mask))
+        if dead >= COMPACT_MIN_ROWS and dead * 2 >= count:
+            self._compact(shard, vectors, rows, mask)
+
+    def _compact(self, shard, vectors, rows, deleted):
+        live = deleted == 0
+        arrays = {
+            "vectors": np.ascontiguousarray(vectors[live]),
+            "deleted": np.zeros(int(live.sum()), dtype=np.uint8),
+            "rows": np.ascontiguousarray(rows[live]),
+        }
+        # Files are replaced, not rewritten, so mapped readers keep their snapshot
+        for part in ("vectors", "deleted", "rows"):
+            path = self._shard_path(shard, part)
+            with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+                f.write(arrays[part].tobytes())
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+    def _migrate_legacy(self, shard):
+        """Converts a single-file .npz shard of earlier versions; call with the file lock held"""
+        legacy = os.path.join(self.index_dir, LEGACY_SHARD_FILE.format(shard))
+        if not os.path.exists(legacy):
+            return
+        with np.load(legacy) as data:
+            vectors, passage_ids, doc_keys = data["vectors"], data["passage_ids"], data["doc_keys"]
+        for part in ("vectors", "deleted", "rows", "json"):
+            if os.path.exists(self._shard_path(shard, part)):
+                os.remove(self._shard_path(shard, part))
+        for doc_key in np.unique(doc_keys):
+            mine = doc_keys == doc_key
+            self._append_rows(shard, vectors[mine], passage_ids[mine], int(doc_key))
+        os.remove(legacy)
+
+    def _check_model(self, model_id):
+        built_with = read_model_id(self.index_dir, default=None)
+        if built_with is None:
+            write_model_id(self.index_dir, model_id)
+        elif built_with != model_id:
+            raise EmbeddingModelMismatch(
+                f"Global index was built with {built_with}, but the server is "
+                f"configured for {model_id}; rebuild it with python -m utils.global_index"
+            )
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def add_document(self, doc_type, doc_id, texts, vectors, metadatas=None,
+                     name=None, keywords=None, created_at=None, model_id=None):
+        """Indexes (or re-indexes) all passages of one document"""
+        vectors = self._normalize(vectors)
+        if model_id:
+            self._check_model(model_id)
+        metadatas = metadatas or [{} for _ in texts]
+        shard = self.shard_for(doc_id)
+        with self._write_lock(shard):
+            self._remove_locked(shard, doc_id)
+            conn = self._db()
+            with conn:
+                doc_key = conn.execute(
+                    "INSERT INTO documents (doc_id, doc_type, name, keywords, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (
+                        doc_id,
+                        doc_type,
+                        name,
+                        json.dumps(keywords or []),
+                        created_at.isoformat() if isinstance(created_at, datetime) else created_at,
+                    ),
+                ).lastrowid
+                passage_ids = []
+                for text, metadata in zip(texts, metadatas):
+                    passage_ids.append(
+                        conn.execute(
+                            "INSERT INTO passages (doc_key, text, metadata) VALUES (?, ?, ?)",
+                            (doc_key, text, json.dumps(metadata, default=str)),
+                        ).lastrowid
+                    )
+            if passage_ids:
+                self._append_rows(shard, vectors, passage_ids, doc_key)
+        return len(passage_ids)
+
+    def add_vector_store(self, doc_type, doc_id, vector_store, **attributes):
+        """Indexes a document straight from its (already built) vector store"""
+        texts, vectors, metadatas = export_store(vector_store)
+        return self.add_document(doc_type, doc_id, texts, vectors, metadatas, **attributes)
+
+    def update_document(self, doc_id, name=None, keywords=None):
+        """Updates the filterable name/keywords of an indexed document"""
+        conn = self._db()
+        with conn:
+            if name is not None:
+                conn.execute("UPDATE documents SET name = ? WHERE doc_id = ?", (name, doc_id))
+            if keywords is not None:
+                conn.execute(
+                    "UPDATE documents SET keywords = ? WHERE doc_id = ?",
+                    (json.dumps(keywords), doc_id),
+                )
+
+    def remove_document(self, doc_id):
+        """Drops a document's passages; a no-op if it was never indexed"""
+        shard = self.shard_for(doc_id)
+        with self._write_lock(shard):
+            return self._remove_locked(shard, doc_id)
+
+    def _remove_locked(self, shard, doc_id):
+        conn = self._db()
+        row = conn.execute("SELECT doc_key FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        if not row:
+            return False
+        doc_key = row[0]
+        self._delete_rows(shard, doc_key)
+        with conn:
+            conn.execute("DELETE FROM passages WHERE doc_key = ?", (doc_key,))
+            conn.execute("DELETE FROM documents WHERE doc_key = ?", (doc_key,))
+        return True
+
+    def _allowed_docs(self, doc_type=None, keywords=None, date_from=None, date_to=None):
+        """Doc keys matching the filters, or None when nothing is filtered"""
+        if not (doc_type or keywords or date_from or date_to):
+            return None
+        clauses, params = [], []
+        if doc_type:
+            clauses.append("doc_type = ?")
+            params.append(doc_type)
+        if date_from:
+            clauses.append("created_at >= ?")
+            params.append(date_from.isoformat() if isinstance(date_from, datetime) else date_from)
+        if date_to:
+            clauses.append("created_at <= ?")
+            params.append(date_to.isoformat() if isinstance(date_to, datetime) else date_to)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._db().execute(f"SELECT doc_key, keywords FROM documents {where}", params)
+
+        wanted = [keyword.lower() for keyword in keywords or []]
+        allowed = []
+        for doc_key, doc_keywords in rows:
+            if wanted:
+                have = " | ".join(json.loads(doc_keywords or "[]")).lower()
+                if not any(keyword in have for keyword in wanted):
+                    continue
+            allowed.append(doc_key)
+        return np.asarray(allowed, dtype=np.int64)
+
+    def _search_shard(self, shard, query, k, allowed):
+        arrays = self._read_shard(shard)
+        if arrays is None:
+            return []
+        vectors, rows, deleted = arrays
+        scores = np.where(deleted == 0, vectors @ query, -np.inf)
+        if allowed is not None:
+            scores = np.where(np.isin(rows[:, 1], allowed), scores, -np.inf)
+        passage_ids = rows[:, 0]
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [
+            (float(scores[i]), int(passage_ids[i]))
+            for i in top
+            if np.isfinite(scores[i])
+        ]
+
+    def search(self, query_vector, k=10, model_id=None, **filters):
+        """Top-k passages across all documents.
+
+        ``filters`` are doc_type ("pdf"/"url"), keywords (any of, substring
+        match) and date_from/date_to (ISO dates on the document creation date).
+        Returns [{doc_id, doc_type, name, score, text, metadata}], best first.
+        """
+        if model_id:
+            built_with = read_model_id(self.index_dir, default=None)
+            if built_with not in (None, model_id):
+                raise EmbeddingModelMismatch(
+                    f"Global index was built with {built_with}, but the server is "
+                    f"configured for {model_id}; rebuild it with python -m utils.global_index"
+                )
+        allowed = self._allowed_docs(**filters)
+        if allowed is not None and not len(allowed):
+            return []
+        query = self._normalize(query_vector)
+
+        with self._init_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=min(self.shards, os.cpu_count() or 1),
+                    thread_name_prefix="global-search",
+                )
+        hits = []
+        for shard_hits in self._executor.map(
+            lambda shard: self._search_shard(shard, query, k, allowed), range(self.shards)
+        ):
+            hits.extend(shard_hits)
+        hits = sorted(hits, reverse=True)[:k]
+        if not hits:
+            return []
+
+        placeholders = ",".join("?" * len(hits))
+        rows = self._db().execute(
+            "SELECT p.passage_id, p.text, p.metadata, d.doc_id, d.doc_type, d.name "
+            f"FROM passages p JOIN documents d ON d.doc_key = p.doc_key "
+            f"WHERE p.passage_id IN ({placeholders})",
+            [passage_id for _, passage_id in hits],
+        )
+        passages = {row[0]: row[1:] for row in rows}
+        results = []
+        for score, passage_id in hits:
+            if passage_id not in passages:
+                continue  # removed by another process since the shard was read
+            text, metadata, doc_id, doc_type, name = passages[passage_id]
+            results.append(
+                {
+                    "doc_id": doc_id,
+                    "doc_type": doc_type,
+                    "name": name,
+                    "score": round(score, 4),
+                    "text": text,
+                    "metadata": json.loads(metadata or "{}"),
+                }
+            )
+        return results
+
+    def stats(self):
+        conn = self._db()
+        return {
+            "documents": conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0],
+            "passages": conn.execute("SELECT COUNT(*) FROM passages").fetchone()[0],
+            "shards": self.shards,
+            "embedding_model": read_model_id(self.index_dir, default=None),
+        }
+
+    def clear(self):
+        """Drops every passage and the recorded embedding model"""
+        for shard in range(self.shards):
+            with self._write_lock(shard):
+                for part in ("rows", "vectors", "deleted", "json"):
+                    if os.path.exists(self._shard_path(shard, part)):
+                        os.remove(self._shard_path(shard, part))
+                self._loaded.pop(shard, None)
+        conn = self._db()
+        with conn:
+            conn.execute("DELETE FROM passages")
+            conn.execute("DELETE FROM documents")
+        model_file = os.path.join(self.index_dir, MODEL_ID_FILE)
+        if os.path.exists(model_file):
+            os.remove(model_file)
+
+
+_global_index = None
+_global_index_lock = threading.Lock()
+
+
+def get_global_index():
+    """Process-wide GlobalIndex, created on first use"""
+    global _global_index
+    with _global_index_lock:
+        if _global_index is None:
+            _global_index = GlobalIndex()
+        return _global_index
+
+
+def rebuild():
+    """Re-indexes every processed PDF and URL from its per-document FAISS store"""
+    from utils.container import container
+
+    index = get_global_index()
+    sources = (
+        ("pdf", "chat_id", container.chat_db.chats_collection, container.pdf_processor.load_vector_store, "upload_date"),
+        ("url", "url_id", container.url_db.urls_collection, container.url_processor.load_vector_store, "created_at"),
+    )
+    model_id = container.embeddings.model_name
+    if read_model_id(index.index_dir, default=None) not in (None, model_id):
+        index.clear()
+    for doc_type, id_field, collection, load, date_field in sources:
+        for record in collection.find({"status": {"$in": ["processed", None]}}, {"questions": 0}):
+            doc_id = record[id_field]
+            try:
+                count = index.add_vector_store(
+                    doc_type,
+                    doc_id,
+                    load(doc_id),
+                    name=record.get("name"),
+                    keywords=record.get("keywords"),
+                    created_at=record.get(date_field),
+                    model_id=model_id,
+                )
+                print(f"Indexed {doc_type} {doc_id}: {count} passages")
+            except Exception as e:
+                print(f"Skipped {doc_type} {doc_id}: {e}")
+
+
+if __name__ == "__main__":
+    # Backfill or rebuild after changing EMBEDDING_MODEL (run from server/):
+    #   python -m utils.global_index
+    rebuild()
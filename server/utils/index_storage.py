@@ -0,0 +1,413 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import tarfile
+import argparse
+import tempfile
+import threading
+import traceback
+from datetime import timezone
+from config import Config
+from utils.metrics import metrics, span
+from utils.vector_index import _locked
+from utils.vector_store_cache import vector_store_cache
+from utils.ingestion_queue import ACTIVE_STATUSES
+
+KINDS = ("pdf", "url")
+DIR_PREFIX = "faiss_index_"
+ARCHIVE_SUFFIX = ".tar.gz"
+# Our own archives, but extract them as untrusted data where tarfile supports it
+EXTRACT_OPTIONS = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+
+INDEX_STORAGE_OPERATIONS = metrics.counter(
+    "legalassist_index_storage_operations_total",
+    "Indexes archived to the cold tier, restored from it, and removed as orphans",
+    ("kind", "operation"),
+)
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _timestamp(value):
+    """Epoch seconds of a naive-UTC Mongo datetime (None stays None)"""
+    return value.replace(tzinfo=timezone.utc).timestamp() if value else None
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class IndexStorage:
+    """Owns where the per-document indexes of PDF and URL chats live on disk.
+
+    Hot indexes are the directories the processors build and read
+    ({root}/faiss_index_{doc_id}); cold ones are gzipped tarballs under
+    ``cold_dir``/{kind}/. ``ensure_hot`` unpacks an archived index before its
+    store is opened, so a chat moved to the cold tier answers its next
+    question after a short restore. ``sweep`` applies the retention policy:
+    directories and archives without a Mongo record are removed, and hot
+    indexes idle for ``cold_after_seconds``, then the least recently active
+    ones while the hot tier exceeds ``quota_bytes``, are archived. Recency is
+    the record's last_activity or the directory's mtime (bumped by builds and
+    restores), whichever is later, and nothing touched in the last
+    ``min_idle_seconds`` or still being ingested is moved.
+    """
+
+    def __init__(self, roots, cold_dir, quota_bytes, cold_after_seconds, min_idle_seconds,
+                 orphan_grace_seconds, sweep_interval):
+        self.roots = roots
+        self.cold_dir = cold_dir
+        self.quota_bytes = quota_bytes
+        self.cold_after_seconds = cold_after_seconds
+        self.min_idle_seconds = min_idle_seconds
+        self.orphan_grace_seconds = orphan_grace_seconds
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._usage = None  # (computed_at, usage)
+        self._sweeper_pid = None
+        self.last_sweep = None
+
+    def path(self, kind, doc_id):
+        return os.path.join(self.roots[kind], f"{DIR_PREFIX}{doc_id}")
+
+    def archive_path(self, kind, doc_id):
+        return os.path.join(self.cold_dir, kind, f"{DIR_PREFIX}{doc_id}{ARCHIVE_SUFFIX}")
+
+    def _key_lock(self, kind, doc_id):
+        with self._lock:
+            return self._key_locks.setdefault((kind, doc_id), threading.Lock())
+
+    def ensure_hot(self, kind, doc_id):
+        """Returns the document's index directory, restoring it from the cold tier first if archived"""
+        index_dir = self.path(kind, doc_id)
+        if os.path.isdir(index_dir):
+            return index_dir
+        archive = self.archive_path(kind, doc_id)
+        if not os.path.exists(archive):
+            return index_dir
+        with self._key_lock(kind, doc_id):
+            if not os.path.isdir(index_dir):
+                with span("index_restore"):
+                    self._restore(kind, archive, index_dir)
+        return index_dir
+
+    def _restore(self, kind, archive, index_dir):
+        root = os.path.dirname(index_dir)
+        os.makedirs(root, exist_ok=True)
+        # Unpacked aside and renamed into place, so readers never see a partial index
+        staging = tempfile.mkdtemp(prefix=".restore-", dir=root)
+        try:
+            try:
+                with tarfile.open(archive, "r:gz") as tar:
+                    tar.extractall(staging, **EXTRACT_OPTIONS)
+            except FileNotFoundError:
+                if os.path.isdir(index_dir):
+                    return  # restored by another worker in the meantime
+                raise
+            os.utime(staging)  # a restored index counts as just used
+            try:
+                os.rename(staging, index_dir)
+            except OSError:
+                if not os.path.isdir(index_dir):
+                    raise
+                return
+            staging = None
+        finally:
+            if staging:
+                shutil.rmtree(staging, ignore_errors=True)
+        try:
+            os.remove(archive)
+        except FileNotFoundError:
+            pass
+        INDEX_STORAGE_OPERATIONS.inc(kind=kind, operation="restore")
+        self._usage = None
+
+    def archive(self, kind, doc_id):
+        """Moves a hot index to the cold tier; returns the bytes it took in the hot tier.
+
+        Other workers keep serving a store they already have open (its files
+        stay mapped) until their vector store cache drops it.
+        """
+        index_dir = self.path(kind, doc_id)
+        archive = self.archive_path(kind, doc_id)
+        os.makedirs(os.path.dirname(archive), exist_ok=True)
+        with self._key_lock(kind, doc_id):
+            with _locked(index_dir):
+                size = _dir_size(index_dir)
+                staging = f"{archive}.{os.getpid()}.tmp"
+                try:
+                    with tarfile.open(staging, "w:gz") as tar:
+                        for name in sorted(os.listdir(index_dir)):
+                            if name != ".lock":
+                                tar.add(os.path.join(index_dir, name), arcname=name)
+                    os.replace(staging, archive)
+                finally:
+                    if os.path.exists(staging):
+                        os.remove(staging)
+                trash = tempfile.mkdtemp(prefix=".archived-", dir=os.path.dirname(index_dir))
+                os.rename(index_dir, os.path.join(trash, "index"))
+            shutil.rmtree(trash, ignore_errors=True)
+            vector_store_cache.invalidate((kind, doc_id))
+        INDEX_STORAGE_OPERATIONS.inc(kind=kind, operation="archive")
+        self._usage = None
+        return size
+
+    def delete(self, kind, doc_id):
+        """Removes a document's index from both tiers (not fatal on failure)"""
+        for path in (self.path(kind, doc_id), self.archive_path(kind, doc_id)):
+            try:
+                _remove(path)
+            except Exception as e:
+                print(f"Warning: Failed to delete {path}: {e}")
+        self._usage = None
+
+    def _scan(self, kind):
+        """(hot, cold, leftovers): {doc_id: (path, mtime)} per tier, and
+        [(path, mtime)] of interrupted restores, archives and removals
+        """
+        hot, cold, leftovers = {}, {}, []
+        for directory, tier in ((self.roots[kind], hot), (os.path.join(self.cold_dir, kind), cold)):
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                try:
+                    mtime = entry.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if entry.name.startswith(".") or entry.name.endswith(".tmp"):
+                    leftovers.append((entry.path, mtime))
+                elif entry.name.startswith(DIR_PREFIX):
+                    doc_id = entry.name[len(DIR_PREFIX):]
+                    if tier is cold:
+                        if not doc_id.endswith(ARCHIVE_SUFFIX):
+                            continue
+                        doc_id = doc_id[: -len(ARCHIVE_SUFFIX)]
+                    elif not entry.is_dir():
+                        continue
+                    tier[doc_id] = (entry.path, mtime)
+        return hot, cold, leftovers
+
+    def usage(self, max_age=30):
+        """{tier: {kind: {"bytes", "indexes"}}}, rescanned at most every ``max_age`` seconds"""
+        cached = self._usage
+        if cached and time.monotonic() - cached[0] < max_age:
+            return cached[1]
+        usage = {"hot": {}, "cold": {}}
+        for kind in KINDS:
+            hot, cold, _ = self._scan(kind)
+            usage["hot"][kind] = {
+                "bytes": sum(_dir_size(path) for path, _ in hot.values()),
+                "indexes": len(hot),
+            }
+            cold_bytes = 0
+            for path, _ in cold.values():
+                try:
+                    cold_bytes += os.path.getsize(path)
+                except FileNotFoundError:
+                    pass
+            usage["cold"][kind] = {"bytes": cold_bytes, "indexes": len(cold)}
+        self._usage = (time.monotonic(), usage)
+        return usage
+
+    def sweep(self, dry_run=False):
+        """Applies the retention policy once; returns a summary, or None when
+        another worker is sweeping or swept less than an interval ago
+        """
+        os.makedirs(self.cold_dir, exist_ok=True)
+        with open(os.path.join(self.cold_dir, ".sweep.lock"), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            try:
+                return self._sweep(dry_run)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _sweep(self, dry_run):
+        from utils.container import container
+
+        started = time.time()
+        records = {
+            "pdf": container.chat_db.get_index_activity(),
+            "url": container.url_db.get_index_activity(),
+        }
+        actions = []
+        hot_bytes = 0
+        candidates = []  # (recency, kind, doc_id, size)
+
+        for kind in KINDS:
+            hot, cold, leftovers = self._scan(kind)
+            known = records[kind]
+            for path, mtime in leftovers:
+                if started - mtime > self.orphan_grace_seconds:
+                    actions.append(("remove_leftover", kind, os.path.basename(path), 0))
+                    if not dry_run:
+                        _remove(path)
+            for tier in (hot, cold):
+                for doc_id, (path, mtime) in list(tier.items()):
+                    if doc_id in known or started - mtime <= self.orphan_grace_seconds:
+                        continue
+                    size = _dir_size(path) if tier is hot else os.path.getsize(path)
+                    actions.append(("remove_orphan", kind, doc_id, size))
+                    del tier[doc_id]
+                    if not dry_run:
+                        _remove(path)
+                        INDEX_STORAGE_OPERATIONS.inc(kind=kind, operation="remove_orphan")
+
+            for doc_id, (path, mtime) in hot.items():
+                size = _dir_size(path)
+                hot_bytes += size
+                record = known.get(doc_id)
+                if record is None or record.get("status") in ACTIVE_STATUSES:
+                    continue
+                recency = max(_timestamp(record.get("last_activity")) or 0, mtime)
+                if started - recency >= self.min_idle_seconds:
+                    candidates.append((recency, kind, doc_id, size))
+
+        candidates.sort()
+        for recency, kind, doc_id, size in candidates:
+            idle = started - recency >= self.cold_after_seconds
+            over_quota = self.quota_bytes and hot_bytes > self.quota_bytes
+            if not (idle or over_quota):
+                continue
+            actions.append(("archive", kind, doc_id, size))
+            if not dry_run:
+                try:
+                    self.archive(kind, doc_id)
+                except Exception as e:
+                    print(f"Warning: Failed to archive {kind} index {doc_id}: {e}")
+                    continue
+            hot_bytes -= size
+
+        if not dry_run:
+            self._usage = None
+        summary = {
+            "dry_run": dry_run,
+            "finished_at": time.time(),
+            "seconds": round(time.time() - started, 3),
+            "removed": sum(1 for action in actions if action[0] != "archive"),
+            "archived": sum(1 for action in actions if action[0] == "archive"),
+            "hot_bytes": hot_bytes,
+            "over_quota": bool(self.quota_bytes and hot_bytes > self.quota_bytes),
+            "actions": [
+                {"operation": operation, "kind": kind, "doc_id": doc_id, "bytes": size}
+                for operation, kind, doc_id, size in actions
+            ],
+        }
+        if not dry_run:
+            self.last_sweep = summary
+        return summary
+
+    def start_sweeper(self):
+        """Starts the periodic sweep thread once per process (after any gunicorn fork)"""
+        if not self.sweep_interval:
+            return
+        with self._lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+        threading.Thread(target=self._sweep_forever, name="index-sweeper", daemon=True).start()
+
+    def _sweep_forever(self):
+        stamp = os.path.join(self.cold_dir, ".last_sweep")
+        while True:
+            try:
+                # Every worker runs this loop; one sweep per interval is enough
+                if not os.path.exists(stamp) or time.time() - os.path.getmtime(stamp) >= self.sweep_interval:
+                    summary = self.sweep()
+                    if summary is not None:
+                        with open(stamp, "w") as f:
+                            f.write(str(summary["finished_at"]))
+                        if summary["removed"] or summary["archived"]:
+                            print(
+                                f"Index storage sweep: {summary['removed']} removed, "
+                                f"{summary['archived']} archived in {summary['seconds']}s"
+                            )
+            except Exception:
+                print("Error sweeping index storage:", traceback.format_exc())
+            time.sleep(self.sweep_interval)
+
+    def stats(self):
+        return {
+            "usage": self.usage(),
+            "quota_bytes": self.quota_bytes,
+            "cold_after_seconds": self.cold_after_seconds,
+            "sweep_interval": self.sweep_interval,
+            "last_sweep": self.last_sweep,
+        }
+
+
+index_storage = IndexStorage(
+    roots={"pdf": Config.PDF_INDEX_DIR, "url": Config.URL_INDEX_DIR},
+    cold_dir=Config.INDEX_COLD_DIR,
+    quota_bytes=Config.INDEX_DISK_QUOTA_MB * 1024 * 1024,
+    cold_after_seconds=Config.INDEX_COLD_AFTER_DAYS * 86400,
+    min_idle_seconds=Config.INDEX_MIN_IDLE_SECONDS,
+    orphan_grace_seconds=Config.INDEX_ORPHAN_GRACE_SECONDS,
+    sweep_interval=Config.INDEX_SWEEP_INTERVAL_SECONDS,
+)
+
+
+def _usage_values(field):
+    usage = index_storage.usage()
+    return {(kind, tier): usage[tier][kind][field] for tier in usage for kind in usage[tier]}
+
+
+metrics.gauge(
+    "legalassist_index_disk_bytes",
+    "Disk used by per-document indexes, by tier (hot directories, cold archives)",
+    ("kind", "tier"),
+    collect=lambda: _usage_values("bytes"),
+)
+metrics.gauge(
+    "legalassist_index_count",
+    "Per-document indexes on disk, by tier",
+    ("kind", "tier"),
+    collect=lambda: _usage_values("indexes"),
+)
+metrics.gauge(
+    "legalassist_index_disk_quota_bytes",
+    "Hot tier quota enforced by archiving (0: none)",
+    collect=lambda: {(): index_storage.quota_bytes},
+)
+
+
+if __name__ == "__main__":
+    # Run from server/, e.g. from cron when INDEX_SWEEP_INTERVAL_SECONDS=0:
+    #   python -m utils.index_storage sweep [--dry-run]
+    #   python -m utils.index_storage usage
+    parser = argparse.ArgumentParser(description="Per-document index retention")
+    parser.add_argument("command", choices=["sweep", "usage"])
+    parser.add_argument("--dry-run", action="store_true", help="only list what a sweep would do")
+    args = parser.parse_args()
+    if args.command == "usage":
+        print(json.dumps(index_storage.stats(), indent=2, default=str))
+        sys.exit(0)
+    summary = index_storage.sweep(dry_run=args.dry_run)
+    if summary is None:
+        print("Another process is sweeping")
+        sys.exit(1)
+    for action in summary["actions"]:
+        print(f"{action['operation']} {action['kind']} {action['doc_id']} ({action['bytes']} bytes)")
+    print(
+        f"{summary['removed']} removed, {summary['archived']} archived; "
+        f"hot tier {summary['hot_bytes']} bytes"
+        + (" (still over quota)" if summary["over_quota"] else "")
+    )
@@ -0,0 +1,226 @@
+import os
+import time
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from config import Config
+
+# Ingestion stages in order, with the progress (percent) reported for each
+JOB_STAGES = {
+    "queued": 0,
+    "extracting": 10,
+    "embedding": 40,
+    "indexing": 70,
+    "processed": 100,
+    "failed": 100,
+}
+ACTIVE_STATUSES = ["queued", "extracting", "embedding", "indexing"]
+
+
+def wants_background(value):
+    """Parses the request's `async` flag, falling back to INGESTION_ASYNC"""
+    if value is None:
+        return Config.INGESTION_ASYNC
+    return str(value).lower() in ("1", "true", "yes")
+
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue has no room for another job"""
+
+
+class JobContext:
+    """Handed to a job handler so it can report its stage on the Mongo record"""
+
+    def __init__(self, queue, kind, job_id):
+        self.queue = queue
+        self.kind = kind
+        self.job_id = job_id
+
+    def set_status(self, status, **fields):
+        self.queue.set_status(self.kind, self.job_id, status, **fields)
+
+
+class IngestionQueue:
+    """Bounded local worker pool for PDF and URL ingestion jobs.
+
+    The job id is the chat_id / url_id and the job state lives in the existing
+    ``status`` field of the Mongo record, so a restarted process can find and
+    resume interrupted jobs. Each record also carries a ``job`` sub-document
+    with the owning worker and a heartbeat, kept fresh for every job the
+    process holds, queued or running; a job is only resumed once its
+    heartbeat is stale, so several gunicorn workers never run it twice.
+    """
+
+    def __init__(self, max_workers, max_pending, stale_seconds):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.stale_seconds = stale_seconds
+        self._instance_tag = uuid.uuid4().hex[:8]
+        self._handlers = {}
+        self._managers = {}
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._resumer_pid = None
+        self._held = set()  # (kind, job_id) queued or running in this process
+        self._heartbeat_pid = None
+
+    def register(self, kind, handler, get_db_manager):
+        """Registers ``handler(ctx, record)`` for a job kind.
+
+        ``get_db_manager()`` returns a manager providing update_job, get_job,
+        get_job_status and claim_stale_jobs for that kind's collection. It is
+        called on every use, so each forked worker gets its own client.
+        """
+        self._handlers[kind] = handler
+        self._managers[kind] = get_db_manager
+
+    def _manager(self, kind):
+        return self._managers[kind]()
+
+    @property
+    def worker_id(self):
+        # Includes the pid so each forked gunicorn worker gets its own id
+        return f"{os.getpid()}-{self._instance_tag}"
+
+    def _get_executor(self):
+        # Created lazily so the pool is never started before gunicorn forks
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="ingestion"
+                )
+            return self._executor
+
+    def set_status(self, kind, job_id, status, **fields):
+        update = {
+            "status": status,
+            "progress": JOB_STAGES.get(status, 0),
+            "job.owner": self.worker_id,
+            "job.heartbeat": datetime.utcnow(),
+            **fields,
+        }
+        self._manager(kind).update_job(job_id, {"$set": update})
+
+    def submit(self, kind, job_id):
+        """Queues a job whose Mongo record already exists"""
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError("Ingestion queue is full, try again later")
+        try:
+            self.set_status(kind, job_id, "queued")
+            self._hold(kind, job_id)
+            self._get_executor().submit(self._run, kind, job_id)
+        except Exception:
+            self._release(kind, job_id)
+            self._slots.release()
+            raise
+
+    def run_now(self, kind, job_id):
+        """Runs a job synchronously in the calling thread (non-async requests)"""
+        self.set_status(kind, job_id, "queued")
+        self._hold(kind, job_id)
+        try:
+            return self._execute(kind, job_id)
+        finally:
+            self._release(kind, job_id)
+
+    def _run(self, kind, job_id):
+        try:
+            self._execute(kind, job_id)
+        except Exception:
+            pass  # already recorded as failed on the Mongo record
+        finally:
+            self._release(kind, job_id)
+            self._slots.release()
+
+    def _hold(self, kind, job_id):
+        with self._lock:
+            self._held.add((kind, job_id))
+            # Started lazily, like the executor, so it runs in each forked worker
+            if self._heartbeat_pid != os.getpid():
+                self._heartbeat_pid = os.getpid()
+                threading.Thread(
+                    target=self._heartbeat, name="ingestion-heartbeat", daemon=True
+                ).start()
+
+    def _release(self, kind, job_id):
+        with self._lock:
+            self._held.discard((kind, job_id))
+
+    def _heartbeat(self):
+        # Keeps jobs waiting in the pool, and long stages (e.g. embedding a
+        # huge PDF), from looking abandoned to other workers' resume
+        while True:
+            time.sleep(self.stale_seconds / 3)
+            with self._lock:
+                held = list(self._held)
+            for kind, job_id in held:
+                try:
+                    self._manager(kind).update_job(
+                        job_id, {"$set": {"job.heartbeat": datetime.utcnow()}}
+                    )
+                except Exception as e:
+                    print(f"Warning: Failed to heartbeat {kind} job {job_id}: {e}")
+
+    def _execute(self, kind, job_id):
+        ctx = JobContext(self, kind, job_id)
+        try:
+            record = self._manager(kind).get_job(job_id)
+            result = self._handlers[kind](ctx, record) or {}
+            ctx.set_status("processed", error=None, **result)
+            return result
+        except Exception as e:
+            print(f"Error in {kind} ingestion job {job_id}:", traceback.format_exc())
+            ctx.set_status("failed", error=str(e))
+            raise
+
+    def resume(self):
+        """Re-queues jobs left unfinished by a previous (crashed or restarted) process"""
+        stale_before = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        resumed = 0
+        for kind, get_db_manager in self._managers.items():
+            for job_id in get_db_manager().claim_stale_jobs(
+                ACTIVE_STATUSES, stale_before, self.worker_id
+            ):
+                try:
+                    self.submit(kind, job_id)
+                except QueueFullError:
+                    # Leave the claimed job; it is retried once its heartbeat is stale
+                    return resumed
+                resumed += 1
+        if resumed:
+            print(f"Resumed {resumed} interrupted ingestion job(s)")
+        return resumed
+
+    def start_resumer(self):
+        """Starts the resume thread once per process (after any gunicorn fork).
+
+        It resumes abandoned jobs right away and then every ``stale_seconds``,
+        so jobs of a worker that dies later are picked up without new traffic.
+        """
+        with self._lock:
+            if self._resumer_pid == os.getpid():
+                return
+            self._resumer_pid = os.getpid()
+        threading.Thread(target=self._resume_forever, name="ingestion-resume", daemon=True).start()
+
+    def _resume_forever(self):
+        while True:
+            try:
+                self.resume()
+            except Exception:
+                print("Error resuming ingestion jobs:", traceback.format_exc())
+            time.sleep(self.stale_seconds)
+
+    def job_status(self, kind, job_id):
+        """Status, progress and error of a job, read from its Mongo record"""
+        return self._manager(kind).get_job_status(job_id)
+
+
+ingestion_queue = IngestionQueue(
+    max_workers=Config.INGESTION_WORKERS,
+    max_pending=Config.INGESTION_MAX_PENDING,
+    stale_seconds=Config.INGESTION_STALE_SECONDS,
+)
@@ -0,0 +1,166 @@
+import os
+import json
+import numpy as np
+from config import Config
+from utils.embedding_providers import write_model_id, check_model_id
+from utils.lexical_index import LexicalIndex
+from utils.vector_index import _locked
+
+# The tracked llama-index docstore the index is built from; the generated
+# files go to Config.IPC_INDEX_DIR, outside the source tree
+IPC_DOCSTORE_DIR = "./indian_penal_code_index"
+EMBEDDINGS_FILE = "embeddings.npy"
+NODES_FILE = "nodes.json"
+LEXICAL_FILE = "lexical.npz"
+
+# The IPC index is always embedded with this local model
+IPC_EMBEDDING_MODEL = "local:sentence-transformers/all-MiniLM-L6-v2"
+
+
+class IPCIndex:
+    """Read-only retrieval index over the IPC docstore nodes.
+
+    The embedding matrix is a float32 ``.npy`` file opened with ``mmap_mode="r"``
+    so every gunicorn worker shares the same page-cache copy instead of holding
+    its own. Rows are L2-normalised, so cosine similarity is a single matmul.
+    A BM25 index over the node texts (``lexical.npz``) serves section lookups
+    and is fused with the vector ranking.
+    """
+
+    def __init__(self, embeddings, nodes, lexical=None):
+        self.embeddings = embeddings
+        self.nodes = nodes
+        self.lexical = lexical
+
+    def __len__(self):
+        return self.embeddings.shape[0]
+
+    @staticmethod
+    def read_docstore_nodes(docstore_dir=IPC_DOCSTORE_DIR):
+        """Extracts the non-empty text nodes from the llama-index docstore"""
+        with open(os.path.join(docstore_dir, "docstore.json"), "r", encoding="utf-8") as f:
+            data = json.load(f)["docstore/data"]
+
+        nodes = {"node_id": [], "page_label": [], "file_name": [], "text": []}
+        for node in data.values():
+            node_data = node["__data__"]
+            text = (node_data.get("text") or "").strip()
+            if not text:
+                continue
+            metadata = node_data.get("metadata") or {}
+            nodes["node_id"].append(node_data["id_"])
+            nodes["page_label"].append(str(metadata.get("page_label", "")))
+            nodes["file_name"].append(metadata.get("file_name", ""))
+            nodes["text"].append(text)
+        return nodes
+
+    @staticmethod
+    def _normalize(matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    @classmethod
+    def build(cls, embed_model, model_id, index_dir=None, docstore_dir=IPC_DOCSTORE_DIR, rebuild=True):
+        """Embeds every docstore node and persists the matrix, node table and
+        BM25 index, then opens them.
+
+        Runs under the index directory's file lock, so workers starting
+        together build it once; with ``rebuild=False`` an index another
+        process finished meanwhile is opened instead.
+        """
+        index_dir = index_dir or Config.IPC_INDEX_DIR
+        os.makedirs(index_dir, exist_ok=True)
+        with _locked(index_dir):
+            if rebuild or not cls.exists(index_dir):
+                nodes = cls.read_docstore_nodes(docstore_dir)
+                embeddings = cls._normalize(embed_model.embed_documents(nodes["text"]))
+
+                # Each file is written aside and renamed; the node table goes
+                # last because exists() treats it as the index being complete
+                nodes_path = os.path.join(index_dir, NODES_FILE)
+                if os.path.exists(nodes_path):
+                    os.remove(nodes_path)
+                embeddings_path = os.path.join(index_dir, EMBEDDINGS_FILE)
+                with open(embeddings_path + ".tmp", "wb") as f:
+                    np.save(f, embeddings)
+                os.replace(embeddings_path + ".tmp", embeddings_path)
+                LexicalIndex.build(nodes["text"]).save(os.path.join(index_dir, LEXICAL_FILE))
+                write_model_id(index_dir, model_id)
+                with open(nodes_path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(nodes, f, ensure_ascii=False)
+                os.replace(nodes_path + ".tmp", nodes_path)
+        return cls.load(model_id, index_dir)
+
+    @classmethod
+    def load(cls, model_id, index_dir=None):
+        """Opens a previously built index; the matrix is memory-mapped, not read.
+        Nothing is written: an index without its BM25 file gets one in memory.
+        """
+        index_dir = index_dir or Config.IPC_INDEX_DIR
+        check_model_id(index_dir, model_id, default=IPC_EMBEDDING_MODEL)
+        embeddings = np.load(
+            os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r"
+        )
+        with open(os.path.join(index_dir, NODES_FILE), "r", encoding="utf-8") as f:
+            nodes = json.load(f)
+        lexical_path = os.path.join(index_dir, LEXICAL_FILE)
+        if os.path.exists(lexical_path):
+            lexical = LexicalIndex.load(lexical_path)
+        else:
+            # Indexes built before hybrid retrieval; `python -m utils.ipc_index` persists it
+            lexical = LexicalIndex.build(nodes["text"])
+        return cls(embeddings, nodes, lexical)
+
+    @classmethod
+    def exists(cls, index_dir=None):
+        index_dir = index_dir or Config.IPC_INDEX_DIR
+        return os.path.exists(
+            os.path.join(index_dir, EMBEDDINGS_FILE)
+        ) and os.path.exists(os.path.join(index_dir, NODES_FILE))
+
+    def _node(self, i, score):
+        return {
+            "node_id": self.nodes["node_id"][i],
+            "page_label": self.nodes["page_label"][i],
+            "file_name": self.nodes["file_name"][i],
+            "text": self.nodes["text"][i],
+            "score": float(score),
+        }
+
+    def _ranked(self, query_embedding, k):
+        """[(cosine, row)] of the k most similar nodes"""
+        query = self._normalize(query_embedding).reshape(-1)
+        scores = self.embeddings @ query
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(scores[i], int(i)) for i in top]
+
+    def search(self, query_embedding, k=4):
+        """Returns the top-k nodes as dicts with text, citation fields and score"""
+        if len(self) == 0:
+            return []
+        return [self._node(i, score) for score, i in self._ranked(query_embedding, k)]
+
+    def hybrid_search(self, question, query_embedding=None, k=4):
+        """Top-k nodes from BM25 fused with the vector ranking (score is the
+        fused RRF score); without ``query_embedding``, from BM25 alone.
+        """
+        if self.lexical is None or len(self) == 0:
+            return [] if query_embedding is None else self.search(query_embedding, k)
+        vector_rows = None
+        if query_embedding is not None:
+            vector_rows = [i for _, i in self._ranked(query_embedding, max(k * 4, 20))]
+        return [self._node(i, score) for score, i in self.lexical.hybrid(question, vector_rows, k)]
+
+
+if __name__ == "__main__":
+    # Offline build step: python -m utils.ipc_index
+    from utils.embedding_providers import create_embeddings
+
+    model = create_embeddings(IPC_EMBEDDING_MODEL)
+    index = IPCIndex.build(model, IPC_EMBEDDING_MODEL)
+    print(f"Built IPC index with {len(index)} nodes in {Config.IPC_INDEX_DIR}")
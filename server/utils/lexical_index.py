@@ -0,0 +1,313 @@
+import os
+import re
+from collections import Counter
+import numpy as np
+from config import Config
+
+# Lower-cased words and numbers; "498A" stays one token so section numbers
+# with letter suffixes are looked up exactly
+WORD_PATTERN = re.compile(r"[^\W_]+")
+MAX_TERM_CHARS = 32  # longer "words" are OCR noise and would widen the term array
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this "
+    "to was were will with which what who whom whose when where how why does do did "
+    "can could should would shall may must me tell explain about say says said mean "
+    "means under any there their they them these those than then into upon".split()
+)
+
+# Words that only introduce a reference ("Section", "IPC", ...); not content
+REFERENCE_WORDS = frozenset(
+    "section sections sec secs s ss article articles art arts clause clauses rule rules "
+    "regulation regulations order orders ipc crpc cpc iea bns bnss bsa act code".split()
+)
+
+# Statute references in a question: "Section 498A", "s. 302", "Art 21", "§ 12",
+# "IPC 302", "302 IPC", "420 of the IPC". A bare "s" must be followed by a dot
+# or a space and not follow an apostrophe ("landlord's 2 months" is not a
+# reference), and years ("Rules 2023", "IPC 1860") are not section numbers.
+STATUTES = r"(?:ipc|crpc|cpc|iea|bns|bnss|bsa)"
+NUMBER = r"(?!(?:18|19|20)\d\d\b)\d{1,4}[a-z]{0,3}"
+REFERENCE_PATTERN = re.compile(
+    r"(?:\b(?:sections?|secs?|articles?|arts?|clauses?|rules?|regulations?|orders?)\.?"
+    r"|(?<!['’])\bss?(?:\.|(?=\s))|§+)"
+    rf"\s*({NUMBER})\b"
+    rf"|\b{STATUTES}\s*({NUMBER})\b"
+    rf"|\b({NUMBER})\s+(?:of\s+(?:the\s+)?)?{STATUTES}\b",
+    re.IGNORECASE,
+)
+
+# Where a section is defined in the text: a line opening with its number, as
+# in bare acts ("302. Punishment for murder.", "1[150. Form of accounts")
+DEFINITION_PATTERN = re.compile(
+    r"^[ \t]*(?:\d+\[)?(\d{1,4}[A-Z]{0,3})\.[ \t]*[A-Z\[]", re.MULTILINE
+)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    return [
+        term
+        for term in WORD_PATTERN.findall(text.lower())
+        if term not in STOPWORDS and len(term) <= MAX_TERM_CHARS
+    ]
+
+
+def references(text):
+    """Section numbers referenced in ``text``, lower-cased, in order"""
+    found = []
+    for match in REFERENCE_PATTERN.finditer(text):
+        ref = next(group for group in match.groups() if group).lower()
+        if ref not in found:
+            found.append(ref)
+    return found
+
+
+def is_reference_query(question):
+    """True for lookups like "IPC 302" or "what does Section 498A say": a
+    statute reference plus at most LEXICAL_FAST_PATH_MAX_TERMS other words.
+    These are answered from the lexical index without embedding the question.
+    """
+    refs = references(question)
+    if not refs:
+        return False
+    others = [
+        term for term in tokenize(question) if term not in refs and term not in REFERENCE_WORDS
+    ]
+    return len(others) <= Config.LEXICAL_FAST_PATH_MAX_TERMS
+
+
+def reciprocal_rank_fusion(rankings, k=None):
+    """[(score, row)] best first, fusing ranked row lists by sum(1 / (k + rank))"""
+    k = Config.HYBRID_RRF_K if k is None else k
+    scores = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            scores[row] = scores.get(row, 0.0) + 1.0 / (k + rank)
+    return sorted(((score, row) for row, score in scores.items()), reverse=True)
+
+
+class LexicalIndex:
+    """BM25 inverted index over the chunks of one store, plus a table of the
+    rows where each section number is defined.
+
+    Saved as a single uncompressed ``.npz`` of flat arrays (no pickle): the
+    sorted term array is searched with ``np.searchsorted``, so opening does
+    not rebuild a dictionary and a lookup touches only the query's postings.
+    """
+
+    ARRAYS = ("terms", "term_offsets", "rows", "tfs", "lengths", "refs", "ref_offsets", "ref_rows")
+
+    def __init__(self, arrays):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.count = len(self.lengths)
+        self.avg_length = float(self.lengths.mean()) if self.count else 0.0
+        # Sections defined per row: tables of contents "define" dozens
+        self.definition_counts = np.bincount(self.ref_rows, minlength=self.count)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    @classmethod
+    def build(cls, texts, headings=None):
+        """Indexes ``texts``; ``headings`` (e.g. the chunker's section metadata)
+        also mark the rows where a section is defined.
+        """
+        postings, definitions, lengths = {}, {}, []
+        headings = headings or [None] * len(texts)
+        for row, (text, heading) in enumerate(zip(texts, headings)):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((row, tf))
+            refs = [ref.lower() for ref in DEFINITION_PATTERN.findall(text)]
+            if heading:
+                refs += references(heading) + [ref.lower() for ref in DEFINITION_PATTERN.findall(heading)]
+            for ref in set(refs):
+                definitions.setdefault(ref, []).append(row)
+
+        terms = sorted(postings)
+        rows, tfs, term_offsets = [], [], [0]
+        for term in terms:
+            for row, tf in postings[term]:
+                rows.append(row)
+                tfs.append(min(tf, 65535))
+            term_offsets.append(len(rows))
+        refs = sorted(definitions)
+        ref_rows, ref_offsets = [], [0]
+        for ref in refs:
+            ref_rows.extend(definitions[ref])
+            ref_offsets.append(len(ref_rows))
+
+        return cls(
+            {
+                "terms": np.array(terms, dtype=str) if terms else np.array([], dtype="U1"),
+                "term_offsets": np.asarray(term_offsets, dtype=np.int64),
+                "rows": np.asarray(rows, dtype=np.int32),
+                "tfs": np.asarray(tfs, dtype=np.uint16),
+                "lengths": np.asarray(lengths, dtype=np.int32),
+                "refs": np.array(refs, dtype=str) if refs else np.array([], dtype="U1"),
+                "ref_offsets": np.asarray(ref_offsets, dtype=np.int64),
+                "ref_rows": np.asarray(ref_rows, dtype=np.int32),
+            }
+        )
+
+    def subset(self, keep):
+        """The index restricted to the rows where ``keep`` (a bool mask) is set,
+        renumbered in order; postings are filtered, not re-tokenized.
+        """
+        new_rows = np.cumsum(keep) - 1
+
+        def select(keys, offsets, rows, columns):
+            key_ids = np.repeat(np.arange(len(keys)), np.diff(offsets))
+            mask = keep[rows]
+            counts = np.bincount(key_ids[mask], minlength=len(keys))
+            used = counts > 0
+            return (
+                keys[used],
+                np.concatenate([[0], np.cumsum(counts[used])]).astype(np.int64),
+                new_rows[rows[mask]].astype(np.int32),
+                [column[mask] for column in columns],
+            )
+
+        terms, term_offsets, rows, (tfs,) = select(self.terms, self.term_offsets, self.rows, [self.tfs])
+        refs, ref_offsets, ref_rows, _ = select(self.refs, self.ref_offsets, self.ref_rows, [])
+        return LexicalIndex(
+            {
+                "terms": terms,
+                "term_offsets": term_offsets,
+                "rows": rows,
+                "tfs": tfs,
+                "lengths": self.lengths[keep],
+                "refs": refs,
+                "ref_offsets": ref_offsets,
+                "ref_rows": ref_rows,
+            }
+        )
+
+    def merge(self, other):
+        """This index followed by ``other``, whose rows are numbered after ours"""
+
+        def combine(keys_a, offsets_a, rows_a, columns_a, keys_b, offsets_b, rows_b, columns_b):
+            keys = np.union1d(keys_a, keys_b)
+            key_ids = np.concatenate(
+                [
+                    np.repeat(np.searchsorted(keys, keys_a), np.diff(offsets_a)),
+                    np.repeat(np.searchsorted(keys, keys_b), np.diff(offsets_b)),
+                ]
+            )
+            # Stable: within a key, our rows stay ahead of (and below) the new ones
+            order = np.argsort(key_ids, kind="stable")
+            counts = np.bincount(key_ids, minlength=len(keys))
+            return (
+                keys,
+                np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+                np.concatenate([rows_a, rows_b + self.count])[order].astype(np.int32),
+                [np.concatenate([a, b])[order] for a, b in zip(columns_a, columns_b)],
+            )
+
+        terms, term_offsets, rows, (tfs,) = combine(
+            self.terms, self.term_offsets, self.rows, [self.tfs],
+            other.terms, other.term_offsets, other.rows, [other.tfs],
+        )
+        refs, ref_offsets, ref_rows, _ = combine(
+            self.refs, self.ref_offsets, self.ref_rows, [],
+            other.refs, other.ref_offsets, other.ref_rows, [],
+        )
+        return LexicalIndex(
+            {
+                "terms": terms,
+                "term_offsets": term_offsets,
+                "rows": rows,
+                "tfs": tfs,
+                "lengths": np.concatenate([self.lengths, other.lengths]),
+                "refs": refs,
+                "ref_offsets": ref_offsets,
+                "ref_rows": ref_rows,
+            }
+        )
+
+    def save(self, path):
+        # Unique temp name: several workers may backfill the same index at once
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **{name: getattr(self, name) for name in self.ARRAYS})
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls({name: data[name] for name in cls.ARRAYS})
+
+    @staticmethod
+    def _find(sorted_array, key):
+        i = int(np.searchsorted(sorted_array, key))
+        if i < len(sorted_array) and sorted_array[i] == key:
+            return i
+        return None
+
+    def definitions(self, refs):
+        """Rows defining any of the section numbers ``refs``"""
+        found = []
+        for ref in refs:
+            i = self._find(self.refs, ref)
+            if i is not None:
+                found.extend(int(row) for row in self.ref_rows[self.ref_offsets[i] : self.ref_offsets[i + 1]])
+        return sorted(set(found))
+
+    def search(self, query, k=4, allowed=None):
+        """[(bm25_score, row)] best first; rows matching no query term, or not
+        set in the ``allowed`` mask, are left out.
+        """
+        if not self.count:
+            return []
+        scores = np.zeros(self.count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            i = self._find(self.terms, term)
+            if i is None:
+                continue
+            start, stop = self.term_offsets[i], self.term_offsets[i + 1]
+            rows = self.rows[start:stop]
+            tf = self.tfs[start:stop].astype(np.float32)
+            idf = np.log(1 + (self.count - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[rows] / self.avg_length)
+            scores[rows] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        if allowed is not None:
+            scores[~allowed] = 0
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        k = min(k, len(hits))
+        top = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[row]), int(row)) for row in top]
+
+    def hybrid(self, query, vector_rows=None, k=4, allowed=None):
+        """[(score, row)] for ``query``: rows defining a referenced section come
+        first (the body of the section before tables of contents listing it),
+        then BM25 ranks fused with ``vector_rows`` (nearest first, or None for
+        a lexical-only lookup) by reciprocal rank fusion. ``allowed`` is an
+        optional bool mask of the rows that may be returned.
+        """
+        lexical_rows = [row for _, row in self.search(query, max(k * 4, 20), allowed)]
+        lexical_rank = {row: rank for rank, row in enumerate(lexical_rows)}
+        definitions = self.definitions(references(query))
+        if allowed is not None:
+            definitions = [row for row in definitions if allowed[row]]
+        pinned = sorted(
+            definitions,
+            key=lambda row: (self.definition_counts[row], lexical_rank.get(row, len(lexical_rows)), row),
+        )[:k]
+        rankings = [lexical_rows] if vector_rows is None else [lexical_rows, vector_rows]
+        fused = reciprocal_rank_fusion(rankings)
+        # Above any fused score (each ranking adds at most 1 / (k + 1))
+        results = [(float(len(rankings)), row) for row in pinned]
+        results += [(score, row) for score, row in fused if row not in pinned]
+        return results[:k]
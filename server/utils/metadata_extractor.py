@@ -0,0 +1,83 @@
+import json
+import re
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# Prompts used by the fallback path, one LLM call per field
+FIELD_PROMPTS = {
+    "name": "Generate a short and meaningful name for this {source}. Answer in english only.",
+    "description": "Write a 20-25 word description summarizing the {source}. Answer in english only.",
+    "keywords": "Give 3-4 important keywords or phrases relevant to the {source}, separated by commas. Answer in english only.",
+}
+
+STRUCTURED_PROMPT = """
+Read the content below and return metadata for this {source} as a single JSON
+object with exactly these keys and nothing else (no markdown, no commentary):
+  "name": a short and meaningful name,
+  "description": a 20-25 word description summarizing it,
+  "keywords": a list of 3-4 important keywords or phrases.
+Answer in english only.
+
+Content:
+{context}
+"""
+
+
+class MetadataError(ValueError):
+    """Raised when the structured metadata response cannot be parsed"""
+
+
+def split_keywords(keywords):
+    return [k.strip() for k in keywords.split(",") if k.strip()]
+
+
+def parse_metadata(text, fields):
+    """Parses and validates the model's JSON answer"""
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        raise MetadataError("No JSON object in metadata response")
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        raise MetadataError(f"Invalid metadata JSON: {e}")
+
+    metadata = {}
+    for field in fields:
+        value = data.get(field)
+        if field == "keywords":
+            if isinstance(value, str):
+                value = split_keywords(value)
+            if not isinstance(value, list) or not all(isinstance(k, str) for k in value):
+                raise MetadataError("keywords must be a list of strings")
+            value = [k.strip() for k in value if k.strip()]
+        elif not isinstance(value, str) or not value.strip():
+            raise MetadataError(f"{field} must be a non-empty string")
+        else:
+            value = value.strip()
+        metadata[field] = value
+    return metadata
+
+
+def extract_metadata(model, context, source, fields=("name", "description", "keywords")):
+    """Generates document metadata with a single structured LLM call.
+
+    ``source`` names the document in the prompts (e.g. "PDF document",
+    "URL content"). If the structured answer cannot be parsed, the fields are
+    requested individually, concurrently, as before.
+    """
+    try:
+        response = model.invoke(STRUCTURED_PROMPT.format(source=source, context=context))
+        return parse_metadata(response.content, fields)
+    except MetadataError:
+        print("Structured metadata failed, falling back:", traceback.format_exc())
+
+    def ask(field):
+        prompt = FIELD_PROMPTS[field].format(source=source)
+        return model.invoke(f"{prompt}\n\nContent:\n{context}").content.strip()
+
+    with ThreadPoolExecutor(max_workers=len(fields)) as executor:
+        answers = dict(zip(fields, executor.map(ask, fields)))
+
+    if "keywords" in answers:
+        answers["keywords"] = split_keywords(answers["keywords"])
+    return answers
@@ -0,0 +1,321 @@
+import time
+import threading
+from contextlib import contextmanager
+from flask import g, has_request_context
+from langchain_core.callbacks import BaseCallbackHandler
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_str(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["counts"]):
+                    labels = _label_str(self.labelnames + ("le",), key + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _label_str(self.labelnames + ("le",), key + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {series['count']}")
+                labels = _label_str(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {series['sum']}")
+                lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+class Gauge:
+    """Current values, either set directly or read from ``collect()`` at
+    render time ({label values tuple: value}), for values such as disk usage
+    that are cheaper to sample on scrape than to track on every change.
+    """
+
+    def __init__(self, name, help_text, labelnames=(), collect=None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if self.collect is not None:
+            try:
+                values = dict(self.collect())
+            except Exception as e:
+                print(f"Warning: Failed to collect {self.name}: {e}")
+                values = {}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_label_str(self.labelnames, key)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    """Minimal Prometheus-compatible metrics, rendered in the text exposition format.
+
+    Values are per process: under gunicorn each worker keeps its own, the same
+    as the /api/cache statistics.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help_text, labelnames=(), collect=None):
+        metric = Gauge(name, help_text, labelnames, collect)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    "legalassist_stage_seconds", "Time spent in each pipeline stage", ("stage",)
+)
+REQUEST_SECONDS = metrics.histogram(
+    "legalassist_request_seconds", "HTTP request latency", ("method", "endpoint", "status")
+)
+MONGO_SECONDS = metrics.histogram(
+    "legalassist_mongo_seconds", "MongoDB command latency", ("command", "collection")
+)
+MONGO_ERRORS = metrics.counter(
+    "legalassist_mongo_errors_total", "Failed MongoDB commands", ("command", "collection")
+)
+LLM_TOKENS = metrics.counter(
+    "legalassist_llm_tokens_total",
+    "LLM tokens (provider-reported when available, else estimated at 4 chars/token)",
+    ("kind",),
+)
+LLM_FIRST_TOKEN_SECONDS = metrics.histogram(
+    "legalassist_llm_first_token_seconds", "Time to the first streamed LLM token"
+)
+EMBEDDED_TEXTS = metrics.counter(
+    "legalassist_embedded_texts_total", "Texts embedded, by embedding cache result", ("cache",)
+)
+
+
+def record(stage, seconds):
+    """Observes a stage duration and adds it to the current request's spans"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    _add_span(stage, seconds)
+
+
+def _add_span(name, seconds):
+    if has_request_context():
+        spans = g.setdefault("spans", {})
+        total, count = spans.get(name, (0.0, 0))
+        spans[name] = (total + seconds, count + 1)
+
+
+@contextmanager
+def span(stage):
+    """Times the enclosed block as one ``stage``"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+class TimedIterator:
+    """Wraps an iterator, accumulating the time spent waiting on it in ``seconds``"""
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self.seconds = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return next(self._iterator)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+
+def request_spans():
+    return g.get("spans", {}) if has_request_context() else {}
+
+
+def server_timing_header(spans, total_seconds):
+    """Formats spans as a Server-Timing header value (durations in ms)"""
+    parts = [
+        f'{name};dur={seconds * 1000:.1f};desc="{count}x"'
+        for name, (seconds, count) in sorted(spans.items(), key=lambda item: -item[1][0])
+    ]
+    parts.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """pymongo listener timing every command sent by MongoDBManager, URLDBManager, etc."""
+
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._collections[event.request_id] = collection if isinstance(collection, str) else ""
+
+    def _finish(self, event):
+        with self._lock:
+            collection = self._collections.pop(event.request_id, "")
+        return collection
+
+    def succeeded(self, event):
+        collection = self._finish(event)
+        seconds = event.duration_micros / 1e6
+        MONGO_SECONDS.observe(seconds, command=event.command_name, collection=collection)
+        _add_span(f"mongo_{event.command_name}", seconds)
+
+    def failed(self, event):
+        collection = self._finish(event)
+        seconds = event.duration_micros / 1e6
+        MONGO_SECONDS.observe(seconds, command=event.command_name, collection=collection)
+        MONGO_ERRORS.inc(command=event.command_name, collection=collection)
+        _add_span(f"mongo_{event.command_name}", seconds)
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """LangChain callback recording LLM call latency, first-token latency and tokens.
+
+    Attached to the chat models themselves, so direct invokes, QA chains and
+    streams are all covered.
+    """
+
+    def __init__(self):
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, prompt_chars):
+        with self._lock:
+            self._runs[run_id] = {
+                "started": time.perf_counter(),
+                "prompt_chars": prompt_chars,
+                "first_token": False,
+            }
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, sum(len(prompt) for prompt in prompts))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(
+            run_id, sum(len(str(m.content)) for batch in messages for m in batch)
+        )
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.get(run_id)
+            if not run or run["first_token"]:
+                return
+            run["first_token"] = True
+        LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - run["started"])
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if not run:
+            return
+        record("llm", time.perf_counter() - run["started"])
+
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        completion_tokens = usage.get("completion_tokens")
+        if prompt_tokens is None:
+            prompt_tokens = run["prompt_chars"] // 4
+        if completion_tokens is None:
+            completion_chars = sum(
+                len(generation.text) for batch in response.generations for generation in batch
+            )
+            completion_tokens = completion_chars // 4
+        LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, kind="completion")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run:
+            record("llm_error", time.perf_counter() - run["started"])
+
+
+llm_metrics = LLMMetricsHandler()
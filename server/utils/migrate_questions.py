@@ -0,0 +1,21 @@
+from utils.database import MongoDBManager, URLDBManager, QAHistoryManager, create_mongo_client
+
+
+def migrate():
+    """Moves the embedded questions arrays of chats and URL chats into qa_history"""
+    client = create_mongo_client()
+    qa_manager = QAHistoryManager(client)
+    qa_manager.ensure_indexes()
+    chats = qa_manager.migrate_embedded_questions(
+        MongoDBManager(client).chats_collection, "chat_id", "pdf"
+    )
+    urls = qa_manager.migrate_embedded_questions(
+        URLDBManager(client).urls_collection, "url_id", "url"
+    )
+    return chats, urls
+
+
+if __name__ == "__main__":
+    # One-shot migration: python -m utils.migrate_questions
+    chats, urls = migrate()
+    print(f"Migrated {chats} chat and {urls} URL questions into qa_history")
@@ -0,0 +1,95 @@
+import threading
+import time
+import traceback
+
+
+class ModelRegistry:
+    """Lazily constructs heavy components (models, clients, indexes) on first use.
+
+    Each component is registered with a zero-argument factory and built at most
+    once per process. ``preload`` builds everything up front, which combined
+    with ``gunicorn --preload`` lets forked workers share the loaded weights
+    copy-on-write instead of each loading their own.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._status = {}
+        self._locks = {}
+        self._registry_lock = threading.Lock()
+        # Components readiness waits for: those being preloaded. Lazy ones load
+        # on their first request, so an idle pod must not wait for them.
+        self._required = set()
+
+    def register(self, name, factory):
+        """Registers a factory; nothing is loaded until ``get`` is called"""
+        with self._registry_lock:
+            self._factories[name] = factory
+            self._locks[name] = threading.Lock()
+            self._status[name] = {"state": "not_loaded", "load_seconds": None}
+
+    def get(self, name):
+        """Returns the component, loading it on first use (thread-safe)"""
+        if name in self._instances:
+            return self._instances[name]
+
+        with self._locks[name]:
+            if name in self._instances:
+                return self._instances[name]
+
+            self._status[name] = {"state": "loading", "load_seconds": None}
+            started = time.perf_counter()
+            try:
+                instance = self._factories[name]()
+            except Exception as e:
+                print(f"Error loading {name}:", traceback.format_exc())
+                self._status[name] = {
+                    "state": "failed",
+                    "load_seconds": round(time.perf_counter() - started, 3),
+                    "error": str(e),
+                }
+                raise
+
+            self._instances[name] = instance
+            self._status[name] = {
+                "state": "ready",
+                "load_seconds": round(time.perf_counter() - started, 3),
+            }
+            return instance
+
+    def override(self, name, instance):
+        """Installs a ready-made instance (e.g. a fake model for benchmarks)"""
+        self._instances[name] = instance
+        self._status[name] = {"state": "ready", "load_seconds": 0.0}
+
+    def preload(self):
+        """Loads every registered component; failures are recorded, not raised"""
+        names = list(self._factories)
+        self._required.update(names)
+        for name in names:
+            try:
+                self.get(name)
+            except Exception:
+                pass
+
+    def warm_up(self):
+        """Preloads in a background thread so the server can bind immediately"""
+        self._required.update(self._factories)
+        thread = threading.Thread(target=self.preload, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self):
+        """Per-component load state, used by the /readyz endpoint"""
+        return {
+            name: {**status, "required": name in self._required}
+            for name, status in self._status.items()
+        }
+
+    def is_ready(self):
+        """True once every preloaded component is ready; always true in lazy mode"""
+        return all(self._status[name]["state"] == "ready" for name in self._required)
+
+
+registry = ModelRegistry()
@@ -0,0 +1,71 @@
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from PyPDF2 import PdfReader
+from config import Config
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    # One long-lived pool per process; "forkserver" avoids forking a process
+    # that already runs Mongo/ingestion threads
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=Config.PDF_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context(Config.PDF_EXTRACT_START_METHOD),
+            )
+        return _pool
+
+
+def _extract(reader, start, stop):
+    # PyPDF2 3.0 does not expose /PageLabels, so the label is the 1-based page number
+    return [
+        (i + 1, str(i + 1), reader.pages[i].extract_text() or "")
+        for i in range(start, min(stop, len(reader.pages)))
+    ]
+
+
+def extract_page_range(pdf_path, start, stop):
+    """Extracts pages [start, stop) and returns [(page_number, page_label, text)].
+
+    Runs inside a pool worker, so it re-opens the file instead of receiving a
+    reader; only the page text travels back to the parent.
+    """
+    return _extract(PdfReader(pdf_path), start, stop)
+
+
+def iter_pages(pdf_path, batch_pages=None, max_inflight_pages=None, parallel=None):
+    """Yields (page_number, page_label, text) for every page, in order.
+
+    Page ranges of ``batch_pages`` are extracted on a process pool. At most
+    ``max_inflight_pages`` pages are extracted ahead of the consumer, which is
+    the memory ceiling: a huge PDF is never held in memory as a whole. Small
+    PDFs (below PDF_EXTRACT_PARALLEL_MIN_PAGES) are read in-process.
+    """
+    batch_pages = batch_pages or Config.PDF_EXTRACT_BATCH_PAGES
+    max_inflight_pages = max_inflight_pages or Config.PDF_EXTRACT_MAX_INFLIGHT_PAGES
+    reader = PdfReader(pdf_path)
+    page_count = len(reader.pages)
+    if parallel is None:
+        parallel = page_count >= Config.PDF_EXTRACT_PARALLEL_MIN_PAGES
+
+    ranges = deque((start, start + batch_pages) for start in range(0, page_count, batch_pages))
+    if not parallel:
+        for start, stop in ranges:
+            yield from _extract(reader, start, stop)
+        return
+    del reader
+
+    pool = _get_pool()
+    max_inflight = max(1, max_inflight_pages // batch_pages)
+    pending = deque()
+    while ranges or pending:
+        while ranges and len(pending) < max_inflight:
+            start, stop = ranges.popleft()
+            pending.append(pool.submit(extract_page_range, pdf_path, start, stop))
+        yield from pending.popleft().result()
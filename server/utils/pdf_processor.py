@@ -1,8 +1,13 @@
-from PyPDF2 import PdfReader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import FAISS
+from utils.vector_store_cache import vector_store_cache
+from utils.embedding_cache import get_embeddings
+from utils.embedding_providers import write_model_id, check_model_id
+from utils.pdf_extractor import iter_pages
+from utils.chunker import LegalChunker
+from utils.vector_index import MmapVectorStore, open_store, append_source, remove_source
+from utils.index_storage import index_storage
+from utils.metrics import record, span, TimedIterator
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,32 +17,69 @@ os.environ["GOOGLE_API_KEY"] = os.getenv("GEMINI")
 
 class PDFProcessor:
     @staticmethod
-    def get_pdf_text(pdf_file):
-        text = ""
-        pdf_reader = PdfReader(pdf_file)
-        for page in pdf_reader.pages:
-            text += page.extract_text() or ""
-        return text
+    def get_pdf_chunks(pdf_path):
+        """Streams pages (extracted in parallel) into the structure-aware chunker.
+
+        Returns (text_chunks, metadatas); every metadata dict carries the
+        chunk position, section heading and page_label of its chunk.
+        """
+        text_chunks, metadatas = [], []
+        started = time.perf_counter()
+        pages = TimedIterator(iter_pages(pdf_path))
+        for text, metadata in LegalChunker().chunk_pages(pages):
+            text_chunks.append(text)
+            metadatas.append(metadata)
+        record("pdf_extract", pages.seconds)
+        record("chunking", time.perf_counter() - started - pages.seconds)
+        return text_chunks, metadatas
 
     @staticmethod
     def get_text_chunks(text):
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=100000, chunk_overlap=1000
-        )
-        return text_splitter.split_text(text)
+        return [chunk for chunk, _ in LegalChunker().chunk_text(text)]
 
     @staticmethod
-    def get_vector_store(text_chunks, pdf_id):
-        embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-        vector_store = FAISS.from_texts(text_chunks, embedding=embeddings)
-        vector_store.save_local(f"chat indexes/faiss_index_{pdf_id}")
+    def get_vector_store(text_chunks, pdf_id, metadatas=None):
+        embeddings = get_embeddings()
+        with span("embedding"):
+            vectors = embeddings.embed_documents(text_chunks)
+        index_dir = index_storage.path("pdf", pdf_id)
+        with span("index_build"):
+            vector_store = MmapVectorStore.build(index_dir, text_chunks, vectors, metadatas)
+        write_model_id(index_dir, embeddings.model_name)
+        vector_store_cache.put(("pdf", pdf_id), vector_store)
         return pdf_id
 
     @staticmethod
     def load_vector_store(pdf_id):
-        embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-        return FAISS.load_local(
-            f"chat indexes/faiss_index_{pdf_id}",
-            embeddings,
-            allow_dangerous_deserialization=True,
-        )
+        def load():
+            embeddings = get_embeddings()
+            # Unpacks the index first if it was moved to the cold tier
+            index_dir = index_storage.ensure_hot("pdf", pdf_id)
+            check_model_id(index_dir, embeddings.model_name)
+            with span("index_load"):
+                return open_store(index_dir, embeddings)
+
+        return vector_store_cache.get_or_load(("pdf", pdf_id), load)
+
+    @staticmethod
+    def add_source(pdf_id, source_id, text_chunks, metadatas=None):
+        """Embeds only the new source's chunks and appends them to the chat's index"""
+        embeddings = get_embeddings()
+        index_dir = index_storage.ensure_hot("pdf", pdf_id)
+        check_model_id(index_dir, embeddings.model_name)
+        with span("embedding"):
+            vectors = embeddings.embed_documents(text_chunks)
+        with span("index_build"):
+            vector_store = append_source(
+                index_dir, source_id, text_chunks, vectors, metadatas, existing_source_id=pdf_id
+            )
+        vector_store_cache.put(("pdf", pdf_id), vector_store)
+        return vector_store
+
+    @staticmethod
+    def drop_source(pdf_id, source_id):
+        """Removes one source's chunks from the chat's index"""
+        with span("index_build"):
+            vector_store = remove_source(index_storage.ensure_hot("pdf", pdf_id), source_id)
+        vector_store_cache.put(("pdf", pdf_id), vector_store)
+        return vector_store
@@ -0,0 +1,84 @@
+import json
+import traceback
+from flask import Response, request, stream_with_context
+from utils.admission import stream_within_deadline
+
+
+def wants_stream(data=None):
+    """True when the client opted into SSE via `"stream": true` or the Accept header"""
+    if data and data.get("stream") in (True, "true", "1", 1):
+        return True
+    return "text/event-stream" in request.headers.get("Accept", "")
+
+
+def _event(payload, event=None):
+    message = f"data: {json.dumps(payload)}\n\n"
+    return f"event: {event}\n{message}" if event else message
+
+
+def stream_llm_answer(model, prompt, on_complete=None, extra=None):
+    """Streams an LLM answer as Server-Sent Events.
+
+    Each chunk is sent as a ``data: {"token": ...}`` event as soon as Gemini
+    produces it. Once the stream finishes, ``on_complete(answer)`` runs (used
+    to persist the Q&A) and a final ``done`` event carries the full answer.
+    If the client disconnects mid-stream nothing is persisted.
+    """
+
+    def generate():
+        parts = []
+        try:
+            for chunk in stream_within_deadline(lambda: model.stream(prompt)):
+                token = chunk.content
+                if not token:
+                    continue
+                parts.append(token)
+                yield _event({"token": token})
+
+            answer = "".join(parts)
+            if on_complete:
+                on_complete(answer)
+            yield _event({"answer": answer, **(extra or {})}, event="done")
+        except Exception as e:
+            print("Error streaming answer:", traceback.format_exc())
+            yield _event({"error": getattr(e, "description", None) or str(e)}, event="error")
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def stream_text(answer, extra=None):
+    """Sends an already known answer (e.g. from the answer cache) as SSE events"""
+
+    def generate():
+        yield _event({"token": answer})
+        yield _event({"answer": answer, **(extra or {})}, event="done")
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def stream_events(events):
+    """Sends ``(event, payload)`` pairs as SSE events as the iterator yields them
+    (event None for plain ``data:`` messages).
+    """
+
+    def generate():
+        try:
+            for event, payload in events:
+                yield _event(payload, event=event)
+        except Exception as e:
+            print("Error streaming events:", traceback.format_exc())
+            yield _event({"error": str(e)}, event="error")
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
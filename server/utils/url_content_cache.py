@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import requests
+from bs4 import BeautifulSoup
+from config import Config
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url):
+    """Canonical form used as the cache key: lower-case scheme/host, no default
+    port, no fragment, sorted query parameters and no trailing slash."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def html_to_text(html):
+    """Same extraction WebBaseLoader performs: BeautifulSoup's text content"""
+    return BeautifulSoup(html, "html.parser").get_text()
+
+
+class URLContentCache:
+    """On-disk cache of extracted page text keyed by normalized URL.
+
+    Entries keep the validators (ETag / Last-Modified) from the last response
+    so a refetch is a conditional GET, plus a hash of the extracted text and
+    the url_id whose index was built from it, so unchanged content can reuse
+    that index instead of being re-embedded.
+    """
+
+    def __init__(self, cache_dir, timeout):
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def _path(self, url):
+        key = hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, url):
+        path = self._path(url)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def put(self, url, entry):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(url)
+        with self._lock:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(path + ".tmp", path)
+
+    def fetch(self, url):
+        """Returns the cache entry for ``url``, revalidating it with the server.
+
+        The entry has ``text``, ``content_hash`` and ``index_id`` (the url_id of
+        an index built from this exact text, if any). ``index_id`` is cleared
+        whenever the content hash changes.
+        """
+        cached = self.get(url)
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = requests.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached:
+            cached["revalidated_at"] = datetime.utcnow().isoformat()
+            self.put(url, cached)
+            return cached
+        response.raise_for_status()
+
+        text = html_to_text(response.text)
+        content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        index_id = None
+        if cached and cached.get("content_hash") == content_hash:
+            index_id = cached.get("index_id")
+
+        entry = {
+            "url": normalize_url(url),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_hash": content_hash,
+            "text": text,
+            "index_id": index_id,
+            "fetched_at": datetime.utcnow().isoformat(),
+        }
+        self.put(url, entry)
+        return entry
+
+    def set_index_id(self, url, index_id):
+        """Records which url_id's index was built from the cached content"""
+        entry = self.get(url)
+        if entry:
+            entry["index_id"] = index_id
+            self.put(url, entry)
+
+
+url_content_cache = URLContentCache(
+    cache_dir=Config.URL_CACHE_DIR, timeout=Config.URL_FETCH_TIMEOUT
+)
@@ -1,76 +1,198 @@
+import os
 import uuid
-import traceback
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import WebBaseLoader
+import shutil
+from utils.vector_store_cache import vector_store_cache
+from utils.embedding_cache import get_embeddings
+from utils.embedding_providers import write_model_id, check_model_id, read_model_id
+from utils.url_content_cache import url_content_cache
+from utils.crawler import get_crawler
+from utils.metrics import span
+from utils.chunker import LegalChunker
+from utils.vector_index import MmapVectorStore, open_store, append_source, remove_source
+from utils.index_storage import index_storage
 
 
 class URLProcessor:
     """Handles all URL processing and vector store operations"""
 
     def __init__(self):
-        self.embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+        self.embeddings = get_embeddings()
 
     def get_text_from_url(self, url):
-        """Extracts text content from a given URL."""
+        """Extracts text content from a given URL (served from the content cache)."""
         try:
-            loader = WebBaseLoader(url)
-            documents = loader.load()
-            return "\n\n".join([doc.page_content for doc in documents])
+            return url_content_cache.fetch(url)["text"]
         except Exception as e:
             print(f"Error loading URL content: {e}")
             return None
 
     def get_text_chunks(self, text):
-        """Splits extracted text into manageable chunks."""
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=10000, chunk_overlap=1000
-        )
-        return text_splitter.split_text(text)
+        """Splits extracted text into token-budgeted, section-aware chunks."""
+        return [chunk for chunk, _ in LegalChunker().chunk_text(text)]
+
+    def get_chunks_with_metadata(self, text):
+        """Like get_text_chunks, but returns (text_chunks, metadatas)"""
+        chunks = LegalChunker().chunk_text(text)
+        return [chunk for chunk, _ in chunks], [metadata for _, metadata in chunks]
 
-    def create_vector_store(self, text_chunks, url_id):
+    def create_vector_store(self, text_chunks, url_id, metadatas=None):
         """
         Creates and saves vector store with a unique identifier.
         Returns the vector store instance.
         """
-        vector_store = FAISS.from_texts(text_chunks, embedding=self.embeddings)
-        vector_store.save_local(f"url indexes/faiss_index_{url_id}")
+        with span("embedding"):
+            vectors = self.embeddings.embed_documents(text_chunks)
+        index_dir = index_storage.path("url", url_id)
+        with span("index_build"):
+            vector_store = MmapVectorStore.build(index_dir, text_chunks, vectors, metadatas)
+        write_model_id(index_dir, self.embeddings.model_name)
+        vector_store_cache.put(("url", url_id), vector_store)
         return vector_store
 
     def load_vector_store(self, url_id):
         """
-        Loads the FAISS vector store for a given URL ID.
-        Returns the vector store instance.
+        Loads the vector store for a given URL ID (mmap format, or a legacy
+        FAISS pickle until it is migrated).
+        Returns the vector store instance (cached across requests).
         """
-        return FAISS.load_local(
-            f"url indexes/faiss_index_{url_id}",
-            self.embeddings,
-            allow_dangerous_deserialization=True,
-        )
+        def load():
+            # Unpacks the index first if it was moved to the cold tier
+            index_dir = index_storage.ensure_hot("url", url_id)
+            check_model_id(index_dir, self.embeddings.model_name)
+            with span("index_load"):
+                return open_store(index_dir, self.embeddings)
 
-    def process_url(self, url):
+        return vector_store_cache.get_or_load(("url", url_id), load)
+
+    def fetch_and_index(self, url, url_id, on_stage=None):
         """
-        Main method to process a URL.
-        Returns tuple: (url_id, error_message)
+        Single fetch-and-extract pipeline: fetches the page once (conditionally,
+        through the content cache), chunks it and builds the index for url_id.
+        If the content is unchanged since an index was last built from it, that
+        index is copied instead of re-embedding.
+        on_stage, if given, is called with "embedding" before indexing starts.
+        Returns dict with text, chunks and whether an index was reused.
         """
-        try:
-            if not url:
-                return None, "No URL provided"
+        with span("url_fetch"):
+            entry = url_content_cache.fetch(url)
+        text = entry["text"]
+        if not text or not text.strip():
+            raise ValueError("Failed to extract text from the URL")
 
-            url_id = str(uuid.uuid4())
-            raw_text = self.get_text_from_url(url)
+        with span("chunking"):
+            text_chunks, metadatas = self.get_chunks_with_metadata(text)
+        if not text_chunks:
+            raise ValueError("Failed to split text into chunks")
+        for metadata in metadatas:
+            metadata["source"] = url
+
+        if on_stage:
+            on_stage("embedding")
+        # Only an index of this page alone can be copied, not one with appended sources
+        index_id = entry.get("index_id")
+        source_dir = index_storage.path("url", index_id) if index_id else None
+        reused = (
+            source_dir is not None
+            and os.path.isdir(source_dir)
+            and read_model_id(source_dir) == self.embeddings.model_name
+            and not MmapVectorStore.has_sources(source_dir)
+        )
+        if reused:
+            if index_id != url_id:
+                shutil.copytree(source_dir, index_storage.path("url", url_id))
+        else:
+            self.create_vector_store(text_chunks, url_id, metadatas)
+            url_content_cache.set_index_id(url, url_id)
 
-            if not raw_text:
-                return None, "Failed to extract text from the URL"
+        return {"text": text, "chunks": text_chunks, "reused_index": reused}
 
-            text_chunks = self.get_text_chunks(raw_text)
+    def crawl_and_index(self, url, url_id, max_pages=None, max_depth=None, on_page=None):
+        """
+        Crawl mode: follows the links of ``url`` (see utils.crawler) and chunks
+        and embeds each page as soon as it is fetched, while later pages are
+        still downloading. Every page becomes a source of the index, the start
+        page with url_id as its id. on_page, if given, is called with the
+        number of pages embedded so far.
+        Returns dict with chunks and sources ({"source_id", "url", "title", "chunks"}).
+        """
+        texts, vectors, metadatas, sources = [], [], [], []
+        for page in get_crawler(max_pages, max_depth).pages(url):
+            with span("chunking"):
+                text_chunks, page_metadatas = self.get_chunks_with_metadata(page["text"])
             if not text_chunks:
-                return None, "Failed to split text into chunks"
+                continue
+            for metadata in page_metadatas:
+                metadata["source"] = page["url"]
+            with span("embedding"):
+                vectors.extend(self.embeddings.embed_documents(text_chunks))
+            sources.append(
+                {
+                    "source_id": url_id if not sources else str(uuid.uuid4()),
+                    "url": page["url"],
+                    "title": page["title"],
+                    "start": len(texts),
+                    "stop": len(texts) + len(text_chunks),
+                }
+            )
+            texts.extend(text_chunks)
+            metadatas.extend(page_metadatas)
+            if on_page:
+                on_page(len(sources))
+        if not texts:
+            raise ValueError("Failed to extract text from the URL")
 
-            self.create_vector_store(text_chunks, url_id)
-            return url_id, None
+        index_dir = index_storage.path("url", url_id)
+        row_ranges = [
+            {key: source[key] for key in ("source_id", "start", "stop")} for source in sources
+        ]
+        with span("index_build"):
+            vector_store = MmapVectorStore.build(
+                index_dir, texts, vectors, metadatas, sources=row_ranges if len(sources) > 1 else None
+            )
+        write_model_id(index_dir, self.embeddings.model_name)
+        vector_store_cache.put(("url", url_id), vector_store)
+        return {
+            "chunks": texts,
+            "sources": [
+                {
+                    "source_id": source["source_id"],
+                    "url": source["url"],
+                    "title": source["title"],
+                    "chunks": source["stop"] - source["start"],
+                }
+                for source in sources
+            ],
+        }
 
-        except Exception as e:
-            print("Error in URLProcessor:", traceback.format_exc())
-            return None, f"Failed to process URL: {str(e)}"
+    def add_source(self, url_id, source_id, url):
+        """Fetches, chunks and embeds one more URL and appends it to url_id's index.
+        Returns the new source's chunks.
+        """
+        index_dir = index_storage.ensure_hot("url", url_id)
+        check_model_id(index_dir, self.embeddings.model_name)
+        with span("url_fetch"):
+            text = url_content_cache.fetch(url)["text"]
+        if not text or not text.strip():
+            raise ValueError("Failed to extract text from the URL")
+        with span("chunking"):
+            text_chunks, metadatas = self.get_chunks_with_metadata(text)
+        if not text_chunks:
+            raise ValueError("Failed to split text into chunks")
+        for metadata in metadatas:
+            metadata["source"] = url
+
+        with span("embedding"):
+            vectors = self.embeddings.embed_documents(text_chunks)
+        with span("index_build"):
+            vector_store = append_source(
+                index_dir, source_id, text_chunks, vectors, metadatas, existing_source_id=url_id
+            )
+        vector_store_cache.put(("url", url_id), vector_store)
+        return text_chunks
+
+    def drop_source(self, url_id, source_id):
+        """Removes one source's chunks from url_id's index"""
+        with span("index_build"):
+            vector_store = remove_source(index_storage.ensure_hot("url", url_id), source_id)
+        vector_store_cache.put(("url", url_id), vector_store)
+        return vector_store
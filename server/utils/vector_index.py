@@ -0,0 +1,622 @@
+import os
+import sys
+import json
+import mmap
+import time
+import fcntl
+import bisect
+import shutil
+import argparse
+from contextlib import contextmanager
+import numpy as np
+from langchain_core.documents import Document
+from config import Config
+from utils.lexical_index import LexicalIndex
+
+FORMAT = "mmap-v1"
+MANIFEST_FILE = "index.json"
+VECTORS_FILE = "vectors.npy"
+NORMS_FILE = "norms.npy"
+IVFPQ_FILE = "ivfpq.faiss"
+CHUNKS_FILE = "chunks.jsonl"
+OFFSETS_FILE = "offsets.npy"
+LEXICAL_FILE = "lexical.npz"
+LEGACY_FILES = ("index.faiss", "index.pkl")
+INDEX_FILES = (VECTORS_FILE, NORMS_FILE, CHUNKS_FILE, OFFSETS_FILE, LEXICAL_FILE, IVFPQ_FILE)
+# Where _rewrite stages the new files; its manifest marks the set complete
+REWRITE_DIR = ".rewrite"
+STORAGES = ("float32", "float16", "ivfpq")
+
+# Rows scanned per block by the exact search, bounding its scratch memory
+SEARCH_BLOCK_ROWS = 16384
+
+
+class MmapVectorStore:
+    """Per-document vector index read through mmap, without pickle.
+
+    On disk (next to embedding_model.json):
+      index.json    manifest: format, count, dim, storage
+      vectors.npy   vectors, float32 or float16
+      norms.npy     squared L2 norms of the vectors (float32)
+      chunks.jsonl  one {"text", "metadata"} record per vector
+      offsets.npy   byte offsets of the records (count + 1, int64)
+      ivfpq.faiss   only for "ivfpq" storage: IVF-PQ coarse index
+      lexical.npz   BM25 inverted index of the chunks (utils.lexical_index)
+
+    A store can hold several sources (e.g. a case file and its exhibits): the
+    manifest then lists each source's contiguous row range, and
+    ``append_source`` / ``remove_source`` copy the existing rows instead of
+    re-embedding them. Without that list the store is a single source.
+
+    Opening costs a few syscalls whatever the document size; pages are read
+    on demand and live in the shared, reclaimable page cache rather than in
+    each worker's heap. Distances are L2, like the LangChain FAISS stores it
+    replaces, so rankings are unchanged. With "ivfpq" storage, candidates
+    from the IVF-PQ index are re-ranked with the exact float16 vectors.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != FORMAT:
+            raise ValueError(f"Unsupported index format in {index_dir}: {self.manifest.get('format')}")
+        self.count = self.manifest["count"]
+        self.storage = self.manifest["storage"]
+        self._manifest_stat = self._stat()
+        self._source_starts = [source["start"] for source in self.sources()]
+        self._vectors = np.load(os.path.join(index_dir, VECTORS_FILE), mmap_mode="r")
+        # Norms and offsets are 12 bytes per chunk, so they are read into memory;
+        # every mmap holds a file descriptor
+        self._norms = np.load(os.path.join(index_dir, NORMS_FILE))
+        self._offsets = np.load(os.path.join(index_dir, OFFSETS_FILE))
+        with open(os.path.join(index_dir, CHUNKS_FILE), "rb") as f:
+            self._chunks = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._ivfpq = None
+        if self.storage == "ivfpq":
+            import faiss
+
+            self._ivfpq = faiss.read_index(
+                os.path.join(index_dir, IVFPQ_FILE), faiss.IO_FLAG_MMAP
+            )
+            self._ivfpq.nprobe = Config.VECTOR_INDEX_NPROBE
+        self.lexical = self._open_lexical()
+
+    @staticmethod
+    def exists(index_dir):
+        return os.path.exists(os.path.join(index_dir, MANIFEST_FILE))
+
+    @staticmethod
+    def has_sources(index_dir):
+        """True when the index in ``index_dir`` holds more than its original source"""
+        try:
+            with open(os.path.join(index_dir, MANIFEST_FILE)) as f:
+                return bool(json.load(f).get("sources"))
+        except FileNotFoundError:
+            return False
+
+    @classmethod
+    def build(cls, index_dir, texts, vectors, metadatas=None, storage=None, sources=None):
+        """Writes a new index into ``index_dir`` (the manifest last) and opens it.
+        ``sources`` optionally lists the row range of each source, as in the manifest.
+        """
+        storage = storage or Config.VECTOR_INDEX_STORAGE
+        if storage not in STORAGES:
+            raise ValueError(f"VECTOR_INDEX_STORAGE must be one of {STORAGES}")
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or not len(vectors):
+            raise ValueError("An index needs at least one vector")
+        if storage == "ivfpq" and len(vectors) < Config.VECTOR_INDEX_IVF_MIN_VECTORS:
+            storage = "float16"  # too few vectors to train IVF-PQ; exact float16 is fast enough
+
+        os.makedirs(index_dir, exist_ok=True)
+        manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+
+        # Every file is written aside and renamed into place, so processes that
+        # still have the previous version mapped keep reading the old inode
+        def path(name):
+            return os.path.join(index_dir, name)
+
+        stored = vectors.astype(np.float16) if storage in ("float16", "ivfpq") else vectors
+        _save_npy(path(VECTORS_FILE), stored)
+        # Norms of the stored (possibly rounded) vectors keep distances consistent
+        as_float = stored.astype(np.float32)
+        _save_npy(path(NORMS_FILE), np.einsum("ij,ij->i", as_float, as_float))
+
+        metadatas = metadatas or [{} for _ in texts]
+        offsets = [0]
+        with open(path(CHUNKS_FILE) + ".tmp", "wb") as f:
+            _write_records(f, texts, metadatas, offsets)
+        os.replace(path(CHUNKS_FILE) + ".tmp", path(CHUNKS_FILE))
+        _save_npy(path(OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+
+        _build_lexical(path(LEXICAL_FILE), texts, metadatas)
+
+        if storage == "ivfpq":
+            _build_ivfpq(vectors, path(IVFPQ_FILE) + ".tmp")
+            os.replace(path(IVFPQ_FILE) + ".tmp", path(IVFPQ_FILE))
+
+        manifest = {"format": FORMAT, "count": len(vectors), "dim": vectors.shape[1], "storage": storage}
+        if sources:
+            manifest["sources"] = sources
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f)
+        return cls(index_dir)
+
+    def _stat(self):
+        try:
+            stat = os.stat(os.path.join(self.index_dir, MANIFEST_FILE))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def is_stale(self):
+        """True once another process has rewritten this index (e.g. appended a source)"""
+        current = self._stat()
+        return current is not None and current != self._manifest_stat
+
+    def sources(self):
+        """[{"source_id", "start", "stop"}] row ranges; empty for a single-source store"""
+        return self.manifest.get("sources", [])
+
+    def source_rows(self, source_ids):
+        """Rows of the given sources, or None when the store has a single source"""
+        if not self.sources():
+            return None
+        ranges = [np.arange(s["start"], s["stop"]) for s in self.sources() if s["source_id"] in source_ids]
+        return np.concatenate(ranges) if ranges else np.zeros(0, dtype=np.int64)
+
+    def _open_lexical(self):
+        path = os.path.join(self.index_dir, LEXICAL_FILE)
+        try:
+            if not os.path.exists(path):
+                # Stores built before hybrid retrieval get their lexical index on first open
+                docs = self.documents()
+                return _build_lexical(
+                    path, [doc.page_content for doc in docs], [doc.metadata for doc in docs]
+                )
+            return LexicalIndex.load(path)
+        except Exception as e:
+            print(f"Warning: No lexical index for {self.index_dir}, vector search only: {e}")
+            return None
+
+    def __len__(self):
+        return self.count
+
+    def resident_bytes(self):
+        """What an open store pins in the heap (the mmapped files are not counted)"""
+        size = 4096 + self._norms.nbytes + self._offsets.nbytes
+        if self.lexical is not None:
+            size += self.lexical.nbytes
+        if self._ivfpq is not None:
+            size += os.path.getsize(os.path.join(self.index_dir, IVFPQ_FILE))
+        return size
+
+    def document(self, i):
+        start, stop = int(self._offsets[i]), int(self._offsets[i + 1])
+        record = json.loads(self._chunks[start:stop])
+        metadata = record["metadata"]
+        if self._source_starts:
+            source = self.sources()[bisect.bisect_right(self._source_starts, i) - 1]
+            metadata["source_id"] = source["source_id"]
+        return Document(page_content=record["text"], metadata=metadata)
+
+    def documents(self):
+        return [self.document(i) for i in range(self.count)]
+
+    def vectors(self):
+        """All vectors as float32 (e.g. to feed the global index)"""
+        return np.asarray(self._vectors, dtype=np.float32)
+
+    def _exact(self, query, k, rows=None):
+        """[(distance, row)] of the k nearest rows (all rows, or just ``rows``)"""
+        q_norm = float(query @ query)
+        if rows is not None:
+            rows = np.sort(rows)  # sequential reads through the mmap
+            block = np.asarray(self._vectors[rows], dtype=np.float32)
+            distances = self._norms[rows] - 2 * (block @ query) + q_norm
+            top = np.argsort(distances)[:k]
+            return [(float(distances[i]), int(rows[i])) for i in top]
+
+        candidates = []
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            block = np.asarray(self._vectors[start : start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            distances = self._norms[start : start + SEARCH_BLOCK_ROWS] - 2 * (block @ query) + q_norm
+            take = min(k, len(distances))
+            top = np.argpartition(distances, take - 1)[:take]
+            candidates.extend((float(distances[i]), start + int(i)) for i in top)
+        return sorted(candidates)[:k]
+
+    def search(self, query_vector, k=4):
+        """[(l2_distance, row)] nearest first"""
+        query = np.asarray(query_vector, dtype=np.float32)
+        k = min(k, self.count)
+        if self._ivfpq is None:
+            return self._exact(query, k)
+        _, rows = self._ivfpq.search(query[None, :], k * Config.VECTOR_INDEX_RERANK_FACTOR)
+        rows = rows[0][rows[0] >= 0]
+        return self._exact(query, k, rows)
+
+    def search_many(self, query_vectors, k=4):
+        """search() for several queries at once: one pass over the vectors with
+        a matrix product per block instead of one scan per query.
+        """
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        k = min(k, self.count)
+        if self._ivfpq is not None:
+            _, rows = self._ivfpq.search(queries, k * Config.VECTOR_INDEX_RERANK_FACTOR)
+            return [self._exact(query, k, found[found >= 0]) for query, found in zip(queries, rows)]
+
+        q_norms = np.einsum("ij,ij->i", queries, queries)
+        candidates = [[] for _ in queries]
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            block = np.asarray(self._vectors[start : start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            distances = (
+                self._norms[start : start + SEARCH_BLOCK_ROWS, None] - 2 * (block @ queries.T) + q_norms
+            )
+            take = min(k, len(distances))
+            top = np.argpartition(distances, take - 1, axis=0)[:take]
+            for j in range(len(queries)):
+                candidates[j].extend((float(distances[i, j]), start + int(i)) for i in top[:, j])
+        return [sorted(found)[:k] for found in candidates]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, **kwargs):
+        return [(self.document(row), distance) for distance, row in self.search(embedding, k)]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def _search_rows(self, query_vector, k, rows=None):
+        """search(), or an exact search restricted to ``rows``"""
+        if rows is None:
+            return self.search(query_vector, k)
+        if not len(rows):
+            return []
+        return self._exact(np.asarray(query_vector, dtype=np.float32), k, rows)
+
+    def _allowed(self, source_ids):
+        """(rows, bool mask) for a source filter, or (None, None) when unfiltered"""
+        rows = None if source_ids is None else self.source_rows(source_ids)
+        if rows is None:
+            return None, None
+        mask = np.zeros(self.count, dtype=bool)
+        mask[rows] = True
+        return rows, mask
+
+    def hybrid_search(self, query, query_vector=None, k=4, source_ids=None):
+        """Documents for ``query`` from BM25 fused with vector search; without a
+        ``query_vector`` (the statute-reference fast path) from BM25 alone.
+        ``source_ids`` restricts the search to those sources' chunks.
+        """
+        rows, mask = self._allowed(source_ids)
+        vector_rows = None
+        if query_vector is not None:
+            depth = k if self.lexical is None else max(k * 4, 20)
+            vector_rows = [row for _, row in self._search_rows(query_vector, depth, rows)]
+        if self.lexical is None:
+            return [self.document(row) for row in (vector_rows or [])[:k]]
+        return [self.document(row) for _, row in self.lexical.hybrid(query, vector_rows, k, mask)]
+
+    def hybrid_search_many(self, queries, query_vectors, k=4, source_ids=None):
+        """hybrid_search() for several queries, with one vectorized vector search"""
+        rows, mask = self._allowed(source_ids)
+        depth = k if self.lexical is None else max(k * 4, 20)
+        if rows is None:
+            found = self.search_many(query_vectors, depth)
+        else:
+            found = [self._search_rows(vector, depth, rows) for vector in query_vectors]
+        results = []
+        for query, hits in zip(queries, found):
+            vector_rows = [row for _, row in hits]
+            if self.lexical is not None:
+                vector_rows = [row for _, row in self.lexical.hybrid(query, vector_rows, k, mask)]
+            results.append([self.document(row) for row in vector_rows[:k]])
+        return results
+
+    def _rewrite(self, keep, texts, vectors, metadatas, sources):
+        """Rewrites the store as its row ranges ``keep`` [(start, stop)] followed
+        by new chunks, and returns it reopened. Existing vectors, records and
+        postings are copied; only the new chunks are encoded and tokenized.
+
+        The new files are staged in REWRITE_DIR, with the manifest written
+        last, and only then moved into place (see _finish_rewrite), so a crash
+        never leaves the index without a complete set of files.
+        Call with the index directory locked.
+        """
+        def path(name):
+            return os.path.join(self.index_dir, name)
+
+        stage = os.path.join(self.index_dir, REWRITE_DIR)
+
+        def staged(name):
+            return os.path.join(stage, name)
+
+        dim = self._vectors.shape[1]
+        new_vectors = np.asarray(vectors if vectors is not None else [], dtype=np.float32).reshape(-1, dim)
+        kept = sum(stop - start for start, stop in keep)
+        total = kept + len(new_vectors)
+        if not total:
+            raise ValueError("An index needs at least one vector")
+
+        if os.path.exists(stage):
+            shutil.rmtree(stage)  # left by a rewrite that died before its manifest
+        os.makedirs(stage)
+
+        stored_new = new_vectors.astype(self._vectors.dtype)
+        out = np.lib.format.open_memmap(
+            staged(VECTORS_FILE), mode="w+", dtype=self._vectors.dtype, shape=(total, dim)
+        )
+        position = 0
+        for start, stop in keep:
+            for block in range(start, stop, SEARCH_BLOCK_ROWS):
+                end = min(block + SEARCH_BLOCK_ROWS, stop)
+                out[position : position + end - block] = self._vectors[block:end]
+                position += end - block
+        out[position:] = stored_new
+        out.flush()
+        del out
+
+        as_float = stored_new.astype(np.float32)
+        norms = [self._norms[start:stop] for start, stop in keep]
+        _save_npy(staged(NORMS_FILE), np.concatenate(norms + [np.einsum("ij,ij->i", as_float, as_float)]))
+
+        offsets = [0]
+        with open(staged(CHUNKS_FILE), "wb") as f:
+            for start, stop in keep:
+                first, last = int(self._offsets[start]), int(self._offsets[stop])
+                f.write(self._chunks[first:last])
+                base = offsets[-1] - first
+                offsets.extend(int(offset) + base for offset in self._offsets[start + 1 : stop + 1])
+            _write_records(f, texts, metadatas or [{} for _ in texts], offsets)
+        _save_npy(staged(OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+
+        mask = np.zeros(self.count, dtype=bool)
+        for start, stop in keep:
+            mask[start:stop] = True
+        headings = [(metadata or {}).get("section") for metadata in (metadatas or [{} for _ in texts])]
+        if self.lexical is not None:
+            lexical = self.lexical.subset(mask).merge(LexicalIndex.build(texts, headings))
+            lexical.save(staged(LEXICAL_FILE))
+        # Without a staged lexical index the old one is dropped and rebuilt
+        # from the records on next open
+
+        if self.storage == "ivfpq":
+            import faiss
+
+            # Trained quantizers are kept; only the codes are (re)added
+            index = faiss.read_index(path(IVFPQ_FILE))
+            if kept < self.count:
+                index.reset()
+                for start, stop in keep:
+                    for block in range(start, stop, SEARCH_BLOCK_ROWS):
+                        end = min(block + SEARCH_BLOCK_ROWS, stop)
+                        index.add(np.asarray(self._vectors[block:end], dtype=np.float32))
+            if len(new_vectors):
+                index.add(new_vectors)
+            faiss.write_index(index, staged(IVFPQ_FILE))
+
+        manifest = {key: value for key, value in self.manifest.items() if key != "sources"}
+        manifest["count"] = total
+        if sources:
+            manifest["sources"] = sources
+        with open(staged(MANIFEST_FILE) + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(staged(MANIFEST_FILE) + ".tmp", staged(MANIFEST_FILE))
+        _finish_rewrite(self.index_dir)
+        return MmapVectorStore(self.index_dir)
+
+
+def _finish_rewrite(index_dir):
+    """Moves a staged rewrite into place, the manifest last, or discards one
+    that died before its manifest was written. Safe to repeat after a crash
+    part-way through. Call with the index directory locked.
+    """
+    stage = os.path.join(index_dir, REWRITE_DIR)
+    if not os.path.isdir(stage):
+        return
+    if not os.path.exists(os.path.join(stage, MANIFEST_FILE)):
+        shutil.rmtree(stage)
+        return
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        # First pass: nothing is moved yet, so files the rewrite did not
+        # stage are ones it drops
+        for name in INDEX_FILES:
+            if not os.path.exists(os.path.join(stage, name)) and os.path.exists(os.path.join(index_dir, name)):
+                os.remove(os.path.join(index_dir, name))
+        # As in build(): no manifest while the files are swapped
+        os.remove(manifest_path)
+    for name in INDEX_FILES:
+        if os.path.exists(os.path.join(stage, name)):
+            # Processes that still have the previous version mapped keep the old inode
+            os.replace(os.path.join(stage, name), os.path.join(index_dir, name))
+    os.replace(os.path.join(stage, MANIFEST_FILE), manifest_path)
+    shutil.rmtree(stage)
+
+
+def _write_records(f, texts, metadatas, offsets):
+    """Writes one JSON line per chunk, extending ``offsets`` with their ends"""
+    for text, metadata in zip(texts, metadatas):
+        record = json.dumps({"text": text, "metadata": metadata}, default=str)
+        data = record.encode("utf-8") + b"\n"
+        f.write(data)
+        offsets.append(offsets[-1] + len(data))
+
+
+def _save_npy(path, array):
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, array)
+    os.replace(path + ".tmp", path)
+
+
+def _build_lexical(path, texts, metadatas):
+    headings = [(metadata or {}).get("section") for metadata in metadatas]
+    lexical = LexicalIndex.build(texts, headings)
+    lexical.save(path)
+    return lexical
+
+
+def _build_ivfpq(vectors, path):
+    import faiss
+
+    dim = vectors.shape[1]
+    subquantizers = next(m for m in (64, 48, 32, 24, 16, 12, 8, 4, 2, 1) if dim % m == 0)
+    # ~4*sqrt(n) lists, but keep ~39 training points per centroid as faiss recommends
+    nlist = max(1, min(int(4 * np.sqrt(len(vectors))), len(vectors) // 39))
+    index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, subquantizers, 8)
+    index.train(vectors)
+    index.add(vectors)
+    faiss.write_index(index, path)
+
+
+def export_store(vector_store):
+    """(texts, float32 vectors, metadatas) of an mmap or legacy LangChain FAISS store"""
+    if isinstance(vector_store, MmapVectorStore):
+        docs = vector_store.documents()
+        vectors = vector_store.vectors()
+    else:
+        count = vector_store.index.ntotal
+        vectors = vector_store.index.reconstruct_n(0, count)
+        docs = [
+            vector_store.docstore.search(vector_store.index_to_docstore_id[i])
+            for i in range(count)
+        ]
+    return [doc.page_content for doc in docs], vectors, [doc.metadata for doc in docs]
+
+
+@contextmanager
+def _locked(index_dir):
+    """Serializes writers of one index directory across processes, first
+    completing (or discarding) a rewrite that a crashed writer left behind
+    """
+    with open(os.path.join(index_dir, ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            _finish_rewrite(index_dir)
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def append_source(index_dir, source_id, texts, vectors, metadatas=None, existing_source_id=None):
+    """Adds one source's chunks to an existing index and returns the reopened
+    store. Rows already in a single-source index are attributed to
+    ``existing_source_id``; legacy pickle indexes are migrated first.
+    """
+    if not len(texts):
+        raise ValueError("The new source has no chunks")
+    with _locked(index_dir):
+        if not MmapVectorStore.exists(index_dir):
+            migrate_dir(index_dir)
+        store = MmapVectorStore(index_dir)
+        sources = store.sources() or [
+            {"source_id": existing_source_id, "start": 0, "stop": store.count}
+        ]
+        if any(source["source_id"] == source_id for source in sources):
+            raise ValueError(f"Source {source_id} is already in the index")
+        sources.append({"source_id": source_id, "start": store.count, "stop": store.count + len(texts)})
+        return store._rewrite([(0, store.count)], texts, vectors, metadatas, sources)
+
+
+def remove_source(index_dir, source_id):
+    """Drops one source's chunks from a multi-source index; returns the reopened store"""
+    with _locked(index_dir):
+        store = MmapVectorStore(index_dir)
+        sources = store.sources()
+        if not any(source["source_id"] == source_id for source in sources):
+            raise KeyError(source_id)
+        remaining = [source for source in sources if source["source_id"] != source_id]
+        if not remaining:
+            raise ValueError("Cannot remove the only source of a document")
+
+        renumbered, start = [], 0
+        for source in remaining:
+            stop = start + source["stop"] - source["start"]
+            renumbered.append({"source_id": source["source_id"], "start": start, "stop": stop})
+            start = stop
+        keep = [(source["start"], source["stop"]) for source in remaining]
+        return store._rewrite(keep, [], None, None, renumbered)
+
+
+def retrieve(vector_store, query, query_vector=None, k=4, source_ids=None):
+    """Hybrid search where the store has a lexical index, vector search on
+    legacy FAISS stores; without ``query_vector`` only lexical hits are returned.
+    """
+    if isinstance(vector_store, MmapVectorStore):
+        return vector_store.hybrid_search(query, query_vector, k, source_ids)
+    if query_vector is None:
+        return []
+    return vector_store.similarity_search_by_vector(query_vector, k=k)
+
+
+def retrieve_many(vector_store, queries, query_vectors, k=4, source_ids=None):
+    """retrieve() for several embedded queries against one store"""
+    if not queries:
+        return []
+    if isinstance(vector_store, MmapVectorStore):
+        return vector_store.hybrid_search_many(queries, query_vectors, k, source_ids)
+    return [vector_store.similarity_search_by_vector(vector, k=k) for vector in query_vectors]
+
+
+def open_store(index_dir, embeddings):
+    """Opens an index directory; legacy pickle-based ones still load until migrated"""
+    if not MmapVectorStore.exists(index_dir) and os.path.isdir(os.path.join(index_dir, REWRITE_DIR)):
+        # Mid-swap, or a rewrite that crashed; the lock waits for (or finishes) it
+        with _locked(index_dir):
+            pass
+    if MmapVectorStore.exists(index_dir):
+        return MmapVectorStore(index_dir)
+    from langchain_community.vectorstores import FAISS
+
+    return FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+
+
+def migrate_dir(index_dir, storage=None):
+    """Converts one legacy faiss_index_* directory in place; returns seconds taken"""
+    from langchain_community.vectorstores import FAISS
+
+    started = time.perf_counter()
+    # Our own files, written by this server: unpickling them once here is the
+    # last time the pickle is trusted
+    legacy = FAISS.load_local(index_dir, None, allow_dangerous_deserialization=True)
+    texts, vectors, metadatas = export_store(legacy)
+    MmapVectorStore.build(index_dir, texts, vectors, metadatas, storage)
+    for name in LEGACY_FILES:
+        path = os.path.join(index_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+    return time.perf_counter() - started
+
+
+def migrate(roots, storage=None):
+    migrated = failed = 0
+    for root in roots:
+        if not os.path.isdir(root):
+            continue
+        for name in sorted(os.listdir(root)):
+            index_dir = os.path.join(root, name)
+            if not name.startswith("faiss_index_") or MmapVectorStore.exists(index_dir):
+                continue
+            if not os.path.exists(os.path.join(index_dir, "index.faiss")):
+                continue
+            try:
+                seconds = migrate_dir(index_dir, storage)
+                migrated += 1
+                print(f"Migrated {index_dir} in {seconds:.2f}s")
+            except Exception as e:
+                failed += 1
+                print(f"Failed to migrate {index_dir}: {e}")
+    print(f"{migrated} migrated, {failed} failed")
+    return failed == 0
+
+
+if __name__ == "__main__":
+    # Converts existing pickle-based indexes (run from server/):
+    #   python -m utils.vector_index "chat indexes" "url indexes" --storage float16
+    parser = argparse.ArgumentParser(description="Migrate faiss_index_* directories to the mmap format")
+    parser.add_argument("roots", nargs="*", default=[Config.PDF_INDEX_DIR, Config.URL_INDEX_DIR])
+    parser.add_argument("--storage", choices=STORAGES, default=None)
+    args = parser.parse_args()
+    sys.exit(0 if migrate(args.roots, args.storage) else 1)
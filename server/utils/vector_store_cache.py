@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+
+
+class VectorStoreCache:
+    """Process-wide LRU cache of loaded vector stores keyed by (kind, doc_id).
+
+    Entries are evicted least-recently-used first once the estimated memory of
+    all cached stores exceeds ``max_bytes`` or there are more than
+    ``max_entries`` of them (each open mmap store holds file descriptors), and
+    are dropped on access once older than ``ttl_seconds``.
+    """
+
+    def __init__(self, max_bytes, ttl_seconds, max_entries=None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (store, size_bytes, loaded_at)
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def estimate_size(store):
+        """Rough resident size: the float32 vectors plus the stored chunk text"""
+        if hasattr(store, "resident_bytes"):
+            return store.resident_bytes()
+        index = store.index
+        size = index.ntotal * index.d * 4
+        for doc in getattr(store.docstore, "_dict", {}).values():
+            size += len(doc.page_content)
+        return size
+
+    def _lookup(self, key):
+        """The cached store for ``key`` (counted as a hit), or None when it is
+        missing, expired or stale
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[2] > self.ttl_seconds:
+                self._remove(key)
+                return None
+        # Rewritten on disk by another process (e.g. a source was appended);
+        # the check stats files, so other lookups don't wait for it
+        if hasattr(entry[0], "is_stale") and entry[0].is_stale():
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    self._remove(key)
+            return None
+        with self._lock:
+            if self._entries.get(key) is entry:
+                self._entries.move_to_end(key)
+            self.hits += 1
+        return entry[0]
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def get_or_load(self, key, loader):
+        """Returns the cached store for ``key``, calling ``loader()`` on a miss"""
+        store = self._lookup(key)
+        if store is not None:
+            return store
+        with self._lock:
+            # [lock, threads using it]; dropped by the last one, so keys that
+            # are never loaded again don't keep a lock around
+            load_lock = self._load_locks.setdefault(key, [threading.Lock(), 0])
+            load_lock[1] += 1
+
+        # Only one thread deserializes a given store; others wait and then hit
+        try:
+            with load_lock[0]:
+                store = self._lookup(key)
+                if store is not None:
+                    return store
+                with self._lock:
+                    self.misses += 1
+                store = loader()
+                self.put(key, store)
+                return store
+        finally:
+            with self._lock:
+                load_lock[1] -= 1
+                if not load_lock[1]:
+                    del self._load_locks[key]
+
+    def put(self, key, store):
+        size = self.estimate_size(store)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (store, size, time.monotonic())
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes or (
+                self.max_entries and len(self._entries) > self.max_entries
+            ):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+vector_store_cache = VectorStoreCache(
+    max_bytes=Config.VECTOR_STORE_CACHE_MAX_MB * 1024 * 1024,
+    ttl_seconds=Config.VECTOR_STORE_CACHE_TTL,
+    max_entries=Config.VECTOR_STORE_CACHE_MAX_ENTRIES,
+)